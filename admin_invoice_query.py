@@ -0,0 +1,260 @@
+# admin_invoice_query.py
+# -*- coding: utf-8 -*-
+"""
+管理員發票總覽（admin_invoices.html）查詢建構
+- keyset（seek）分頁：以 (日期欄位, id) 當游標往後翻，不用 OFFSET，深頁與大區間都維持固定成本
+- 先在索引上挑出該頁的 id（延遲 JOIN），再回表取欄位與使用者/公司名稱
+- 篩選組合對應 migrations/001_admin_invoice_indexes.sql 的複合索引
+- explain_admin_invoice_query() 用 EXPLAIN 確認沒有全表掃描 / filesort
+"""
+import base64
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# 資料表名稱（與 admin_routes / inv 共用同一份 schema）
+INVOICE_TABLE = "invoices"
+USER_TABLE = "users"
+COMPANY_TABLE = "companies"
+
+PAGE_SIZE = int(os.environ.get("ADMIN_INVOICE_PAGE_SIZE", 50))
+
+# basis 只允許這兩個欄位，避免把使用者輸入拼進 SQL
+BASIS_COLUMNS = {"in_date": "in_date", "created_at": "created_at"}
+SOURCES = ("manual", "auto")
+
+# 開發時設 ADMIN_QUERY_EXPLAIN=1，每次查詢都跑 EXPLAIN 並印出警告
+EXPLAIN_ON_QUERY = os.environ.get("ADMIN_QUERY_EXPLAIN", "") == "1"
+
+# 關鍵字 q 的發票號碼 / 統編部分比對改走 invoice_search_index（設 0 可退回 LIKE）
+USE_SEARCH_INDEX = os.environ.get("INVOICE_SEARCH_INDEX", "1") == "1"
+
+
+# === 篩選條件 ===
+def parse_date_range(s: str) -> Tuple[Optional[date], Optional[date]]:
+    """'YYYY-MM-DD - YYYY-MM-DD'（Litepicker 格式）→ (start, end)，單一日期視為當天。"""
+    found = re.findall(r"\d{4}-\d{1,2}-\d{1,2}", s or "")
+    days = []
+    for d in found[:2]:
+        try:
+            days.append(datetime.strptime(d, "%Y-%m-%d").date())
+        except ValueError:
+            continue
+    if not days:
+        return None, None
+    if len(days) == 1:
+        return days[0], days[0]
+    return min(days), max(days)
+
+
+def filters_from_args(args) -> Dict[str, Any]:
+    """從 request.args 取出 admin_invoices 的篩選條件（已正規化）。"""
+    basis = (args.get("basis") or "in_date").strip()
+    if basis not in BASIS_COLUMNS:
+        basis = "in_date"
+    source = (args.get("source") or "").strip()
+    if source not in SOURCES:
+        source = ""
+    user_id = (args.get("user_id") or "").strip()
+    start, end = parse_date_range(args.get("date_range") or "")
+    return {
+        "user_id": int(user_id) if user_id.isdigit() else None,
+        "tax_id": (args.get("tax_id") or "").strip(),
+        "basis": basis,
+        "start": start,
+        "end": end,
+        "q": (args.get("q") or "").strip(),
+        "source": source,
+    }
+
+
+# === 游標 ===
+def _json_default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return str(v)
+
+
+def encode_cursor(sort_value: Any, inv_id: int) -> str:
+    raw = json.dumps([sort_value, int(inv_id)], default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Optional[Tuple[Any, int]]:
+    """游標壞掉或被竄改就回 None（等同回第一頁）。"""
+    if not token:
+        return None
+    try:
+        pad = "=" * (-len(token) % 4)
+        sort_value, inv_id = json.loads(base64.urlsafe_b64decode(token + pad).decode("utf-8"))
+        return sort_value, int(inv_id)
+    except Exception:
+        return None
+
+
+# === 查詢建構 ===
+def _where(filters: Dict[str, Any], col: str) -> Tuple[List[str], List[Any]]:
+    conds: List[str] = []
+    params: List[Any] = []
+
+    # 等值條件放前面：對應複合索引的前導欄位
+    if filters.get("user_id") is not None:
+        conds.append("i.user_id = %s")
+        params.append(filters["user_id"])
+    if filters.get("tax_id"):
+        conds.append("i.tax_id = %s")
+        params.append(filters["tax_id"])
+    if filters.get("source"):
+        conds.append("i.source = %s")
+        params.append(filters["source"])
+
+    # 日期區間：半開區間，created_at 是 DATETIME 也能吃到索引
+    if filters.get("start"):
+        conds.append(f"i.{col} >= %s")
+        params.append(filters["start"])
+    if filters.get("end"):
+        conds.append(f"i.{col} < %s")
+        params.append(filters["end"] + timedelta(days=1))
+
+    q = filters.get("q")
+    if q:
+        like = f"%{q}%"
+        company_sql = (f"EXISTS (SELECT 1 FROM {COMPANY_TABLE} cq "
+                       f"WHERE cq.tax_id = i.tax_id AND cq.co_na LIKE %s)")
+        index_sql, index_params = "", []
+        if filters.get("q_index"):
+            from invoice_search_index import match_sql
+            index_sql, index_params = match_sql(q)
+        if not filters.get("q_index"):
+            conds.append(f"(i.in_nu LIKE %s OR i.tax_id LIKE %s OR {company_sql})")
+            params.extend([like, like, like])
+        elif index_sql:
+            # 發票號碼 / 統編走搜尋索引子查詢（符合的全部都在），這裡只剩公司名稱要 LIKE
+            conds.append(f"(i.id IN ({index_sql}) OR {company_sql})")
+            params.extend(index_params)
+            params.append(like)
+        else:
+            conds.append(company_sql)
+            params.append(like)
+    return conds, params
+
+
+def _seek(col: str, cursor: Optional[Tuple[Any, int]]) -> Tuple[str, List[Any]]:
+    """
+    DESC 排序下的 seek 條件；MySQL 的 NULL 排在 DESC 最後，
+    游標值為 NULL 代表已經翻到 NULL 區段。
+    """
+    if not cursor:
+        return "", []
+    sort_value, last_id = cursor
+    if sort_value is None:
+        return f"(i.{col} IS NULL AND i.id < %s)", [last_id]
+    return (
+        f"(i.{col} < %s OR (i.{col} = %s AND i.id < %s) OR i.{col} IS NULL)",
+        [sort_value, sort_value, last_id],
+    )
+
+
+def build_admin_invoice_query(filters: Dict[str, Any],
+                              cursor: Optional[Tuple[Any, int]] = None,
+                              limit: int = PAGE_SIZE) -> Tuple[str, List[Any]]:
+    """
+    回傳 (sql, params)。多抓一筆（limit + 1）用來判斷有沒有下一頁。
+    內層只碰 invoices 與索引，外層再 JOIN users / companies。
+    """
+    col = BASIS_COLUMNS.get(filters.get("basis") or "in_date", "in_date")
+    conds, params = _where(filters, col)
+    seek_sql, seek_params = _seek(col, cursor)
+    if seek_sql:
+        conds.append(seek_sql)
+        params.extend(seek_params)
+
+    where_sql = ("WHERE " + " AND ".join(conds)) if conds else ""
+    sql = (
+        "SELECT i.id, i.user_id, u.us_na AS username, i.tax_id, c.co_na, "
+        "i.in_nu, i.in_date, i.in_pri, i.created_at, i.source, i.file_path "
+        f"FROM (SELECT i.id FROM {INVOICE_TABLE} i {where_sql} "
+        f"ORDER BY i.{col} DESC, i.id DESC LIMIT %s) page "
+        f"JOIN {INVOICE_TABLE} i ON i.id = page.id "
+        f"LEFT JOIN {USER_TABLE} u ON u.id = i.user_id "
+        f"LEFT JOIN {COMPANY_TABLE} c ON c.tax_id = i.tax_id "
+        f"ORDER BY i.{col} DESC, i.id DESC"
+    )
+    params.append(int(limit) + 1)
+    return sql, params
+
+
+# === EXPLAIN 檢查 ===
+def explain_admin_invoice_query(conn, sql: str, params: List[Any]) -> Dict[str, Any]:
+    """
+    跑 EXPLAIN，回傳 {ok, keys, full_scans, filesort, rows}。
+    ok=False 代表 invoices 有全表掃描或需要 filesort（通常是少了對應的複合索引）。
+    """
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("EXPLAIN " + sql, tuple(params))
+        plan = cur.fetchall() or []
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+    keys, full_scans, filesort = [], [], False
+    for row in plan:
+        table = str(row.get("table") or "")
+        if row.get("key"):
+            keys.append(f"{table}:{row['key']}")
+        if str(row.get("type") or "").upper() == "ALL" and table in ("i", INVOICE_TABLE):
+            full_scans.append(table)
+        if "filesort" in str(row.get("Extra") or "").lower() and table in ("i", INVOICE_TABLE):
+            filesort = True
+    return {
+        "ok": not full_scans and not filesort,
+        "keys": keys,
+        "full_scans": full_scans,
+        "filesort": filesort,
+        "rows": plan,
+    }
+
+
+def with_search_index(conn, filters: Dict[str, Any]) -> Dict[str, Any]:
+    """有關鍵字且索引表可用時，標記 q_index 讓 _where 改走索引子查詢；否則維持 LIKE。"""
+    if not filters.get("q") or not USE_SEARCH_INDEX or "q_index" in filters:
+        return filters
+    from invoice_search_index import index_available
+    # 索引表還沒建（未跑 migration）就退回 LIKE
+    return dict(filters, q_index=index_available(conn))
+
+
+def fetch_admin_invoices_page(conn, filters: Dict[str, Any], after: str = "",
+                              limit: int = PAGE_SIZE) -> Dict[str, Any]:
+    """
+    給 admin_invoices 路由用：回傳 {rows, next_cursor, has_prev}。
+    after 是上一頁最後一筆的游標（?after=...）。
+    """
+    cursor = decode_cursor(after)
+    filters = with_search_index(conn, filters)
+    sql, params = build_admin_invoice_query(filters, cursor, limit)
+
+    if EXPLAIN_ON_QUERY:
+        plan = explain_admin_invoice_query(conn, sql, params)
+        if not plan["ok"]:
+            print(f"[ADMIN QUERY] 可能缺索引 full_scans={plan['full_scans']} "
+                  f"filesort={plan['filesort']} keys={plan['keys']}")
+
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall() or []
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+    next_cursor = ""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        col = BASIS_COLUMNS.get(filters.get("basis") or "in_date", "in_date")
+        last = rows[-1]
+        next_cursor = encode_cursor(last.get(col), last["id"])
+    return {"rows": rows, "next_cursor": next_cursor, "has_prev": cursor is not None}
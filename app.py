@@ -6,6 +6,16 @@ import inv
 import reinv
 import pre
 import yr  # ✅ 改用 ocr，別再 import yocr
+import thumbs
+import live_scan
+import profiling
+import reprocess
+import export_routes
+
+# 辨識專用的 worker 行程：啟動時先載好 OCR 子系統，第一個請求不用等 torch
+from ocr_runtime import APP_ROLE, warm_up
+if APP_ROLE == "worker":
+    warm_up()
 def print_routes():
     print("\n== Routes ==")
     for r in app.url_map.iter_rules():
@@ -0,0 +1,77 @@
+# bench_startup.py
+# -*- coding: utf-8 -*-
+"""
+啟動時間預算檢查：用 python -X importtime 量 `import app` 花多久、載入了哪些重量級模組
+    python bench_startup.py                 # 預設 APP_ROLE=web，預算 STARTUP_BUDGET_MS（1500ms）
+    python bench_startup.py --role all --budget 3000 --top 20
+超過預算，或 web 角色載入了 torch / cv2 / pdf2image 時，結束代碼為 1（可放進 CI）
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+HEAVY_MODULES = ("torch", "cv2", "pdf2image", "pytesseract", "torchvision")
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(role: str, target: str = "app") -> Tuple[int, List[Tuple[int, str]], Dict[str, bool]]:
+    """回傳 (總 import 時間 µs, [(cumulative µs, 模組)], {重量級模組: 是否載入})。"""
+    env = dict(os.environ, APP_ROLE=role)
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=here, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-15:])
+        raise RuntimeError(f"import {target} 失敗：\n{tail}")
+
+    rows: List[Tuple[int, str]] = []
+    total = 0
+    loaded = {m: False for m in HEAVY_MODULES}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        rows.append((cumulative, name))
+        if indent <= 1:   # 最上層的 import
+            total += cumulative
+        top = name.split(".")[0]
+        if top in loaded:
+            loaded[top] = True
+    rows.sort(reverse=True)
+    return total, rows, loaded
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="量測 import app 的啟動時間")
+    ap.add_argument("--role", default="web", choices=("web", "all", "worker"))
+    ap.add_argument("--budget", type=int, default=int(os.environ.get("STARTUP_BUDGET_MS", 1500)),
+                    help="啟動時間預算（毫秒）")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--target", default="app")
+    args = ap.parse_args(argv)
+
+    total, rows, loaded = measure(args.role, args.target)
+    ms = total / 1000.0
+    print(f"[STARTUP] APP_ROLE={args.role} import {args.target}: {ms:.0f} ms（預算 {args.budget} ms）")
+    print(f"[STARTUP] 最慢的 {args.top} 個模組（含子模組）：")
+    for cumulative, name in rows[:args.top]:
+        print(f"  {cumulative / 1000.0:8.1f} ms  {name}")
+    heavy = [m for m, v in loaded.items() if v]
+    print("[STARTUP] 已載入的重量級模組：", ", ".join(heavy) or "無")
+
+    ok = ms <= args.budget
+    if args.role == "web" and heavy:
+        print("[STARTUP] ✗ web 角色不應載入：", ", ".join(heavy))
+        ok = False
+    print("[STARTUP]", "✓ 通過" if ok else "✗ 超出預算")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,6 @@
 
 import os
 from flask import Flask, send_from_directory, render_template
-import pytesseract
 import sys
 import importlib.util
 
@@ -36,12 +35,19 @@ app.config.update(
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 os.makedirs(app.config["CROPPED_FOLDER"], exist_ok=True)
 
-# === Tesseract 設定（Windows）===
-# 指定 tesseract.exe 路徑
-pytesseract.pytesseract.tesseract_cmd = app.config["TESSERACT_CMD"]
-# 指定 TESSDATA_PREFIX（同資料夾下的 tessdata）
-tess_dir = os.path.dirname(app.config["TESSERACT_CMD"])
-os.environ["TESSDATA_PREFIX"] = os.path.join(tess_dir, "tessdata")
+# === Tesseract / Poppler 設定（Windows）===
+# 這裡只設環境變數，不 import pytesseract；OCR 子系統第一次載入時
+# （yocr/ocr_utils.py）才讀 TESSERACT_CMD 設定 tesseract.exe 路徑，見 ocr_runtime.py
+def configure_ocr_env():
+    if app.config["TESSERACT_CMD"]:
+        os.environ.setdefault("TESSERACT_CMD", app.config["TESSERACT_CMD"])
+        # 指定 TESSDATA_PREFIX（同資料夾下的 tessdata）
+        tess_dir = os.path.dirname(app.config["TESSERACT_CMD"])
+        os.environ["TESSDATA_PREFIX"] = os.path.join(tess_dir, "tessdata")
+    if app.config["POPPLER_PATH"]:
+        os.environ.setdefault("POPPLER_PATH", app.config["POPPLER_PATH"])
+
+configure_ocr_env()
 
 
 # === 將可用的 endpoint 名稱提供給所有模板（避免 current_app 未注入問題）===
@@ -53,22 +59,51 @@ def inject_endpoints():
     }
 
 # === 自動抓取 Email 發票附件（每分鐘） ===
+# 例外往外丟，讓 job_scheduler 記錄失敗並退避
 def run_email_fetcher():
+    spec = importlib.util.spec_from_file_location("email_invoice_fetcher", os.path.join(app.config["ROOT_DIR"], "email_invoice_fetcher.py"))
+    email_fetcher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(email_fetcher)
+    email_fetcher.fetch_invoices()
+    print("[APScheduler] 已自動執行 fetch_invoices()")
+
+# === 搜尋索引校正（每 10 分鐘） ===
+# 沒呼叫 invoice_search_index.sync_invoice() 的新增 / 修改 / 刪除，由這裡補回索引
+def run_search_index_reconcile():
+    from db import get_db
+    from invoice_search_index import reconcile_index
+    conn = get_db()
+    if conn is None:
+        raise RuntimeError("資料庫連線失敗")
     try:
-        spec = importlib.util.spec_from_file_location("email_invoice_fetcher", os.path.join(app.config["ROOT_DIR"], "email_invoice_fetcher.py"))
-        email_fetcher = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(email_fetcher)
-        email_fetcher.fetch_invoices()
-        print("[APScheduler] 已自動執行 fetch_invoices()")
-    except Exception as e:
-        print(f"[APScheduler] 執行 fetch_invoices() 發生錯誤: {e}")
+        print(f"[APScheduler] 搜尋索引校正：{reconcile_index(conn)}")
+    finally:
+        conn.close()
+
+SEARCH_INDEX_RECONCILE_SECONDS = int(os.environ.get("SEARCH_INDEX_RECONCILE_SECONDS", 600))   # 0 = 不排程
+
+# 每個 worker 都會 import 這裡，但只有搶到 leader 鎖的行程會真的抓信（見 job_scheduler.py）
+# 鎖檔與狀態放在私有的執行期資料夾：狀態裡有錯誤訊息 / 主機名稱 / PID，/uploads 是公開的
+RUN_DIR = os.environ.get("RUN_DIR", os.path.join(ROOT, "run"))
+os.makedirs(RUN_DIR, exist_ok=True)
+SCHEDULER_LOCK = os.path.join(RUN_DIR, "scheduler.lock")
+SCHEDULER_STATUS = os.path.join(RUN_DIR, "scheduler_status.json")
+# 舊版放在 uploads/ 的鎖檔 / 狀態檔刪掉（之後由 leader 重寫）
+for _old in ("scheduler.lock", "scheduler_status.json"):
+    try:
+        os.remove(os.path.join(app.config["UPLOAD_FOLDER"], _old))
+    except OSError:
+        pass
 
-if __name__ != "__main__":
+if __name__ != "__main__" and os.environ.get("SCHEDULER_ENABLED", "1") == "1":
     try:
-        from apscheduler.schedulers.background import BackgroundScheduler
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(run_email_fetcher, 'interval', minutes=1, id='email_fetcher_job', replace_existing=True)
-        scheduler.start()
+        from job_scheduler import start_scheduler
+        jobs = {"email_fetcher_job": {"fn": run_email_fetcher,
+                                      "seconds": int(os.environ.get("EMAIL_FETCH_SECONDS", 60))}}
+        if SEARCH_INDEX_RECONCILE_SECONDS > 0:
+            jobs["search_index_reconcile"] = {"fn": run_search_index_reconcile,
+                                              "seconds": SEARCH_INDEX_RECONCILE_SECONDS}
+        start_scheduler(jobs, lock_path=SCHEDULER_LOCK, status_path=SCHEDULER_STATUS)
     except Exception as e:
         print(f"[APScheduler] 啟動失敗: {e}")
 
@@ -77,7 +112,8 @@ print("[CORE] ROOT_DIR         =", app.config["ROOT_DIR"])
 print("[CORE] UPLOAD_FOLDER    =", app.config["UPLOAD_FOLDER"])
 print("[CORE] CROPPED_FOLDER   =", app.config["CROPPED_FOLDER"])
 print("[CORE] POPPLER_PATH     =", app.config["POPPLER_PATH"])
-print("[CORE] TESSERACT_CMD    =", pytesseract.pytesseract.tesseract_cmd)
+print("[CORE] TESSERACT_CMD    =", app.config["TESSERACT_CMD"])
+print("[CORE] APP_ROLE         =", os.environ.get("APP_ROLE", "all"))
 print("[CORE] TESSDATA_PREFIX  =", os.environ.get("TESSDATA_PREFIX", ""))
 
 # === 首頁 ===
@@ -85,21 +121,37 @@ print("[CORE] TESSDATA_PREFIX  =", os.environ.get("TESSDATA_PREFIX", ""))
 def home():
     return render_template("home.html")
 
+# 原圖/裁切圖的快取秒數：相機檔名可能重複覆寫，所以不設太長，靠 ETag 重新驗證
+# （縮圖/預覽圖請用 thumbs.py 的 /thumb，網址帶版本可以長快取）
+UPLOAD_MAX_AGE = int(os.environ.get("UPLOAD_MAX_AGE", 3600))
+
 # === 靜態檔案：上傳原圖（唯一版本）===
+# conditional=True：支援 ETag / If-None-Match 與 Range（PDF 分段載入）
 @app.route("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    return send_from_directory(app.config["UPLOAD_FOLDER"], filename,
+                               conditional=True, max_age=UPLOAD_MAX_AGE)
 
 # === 靜態檔案：裁切圖（唯一版本）===
 @app.route("/uploads/cropped/<path:filename>")
 def uploads_cropped(filename):
-    return send_from_directory(app.config["CROPPED_FOLDER"], filename)
+    return send_from_directory(app.config["CROPPED_FOLDER"], filename,
+                               conditional=True, max_age=UPLOAD_MAX_AGE)
 
 # --- 健康檢查端點（貼到 core_app.py 最底部） ---
 @app.route("/ping")
 def ping():
     return "pong", 200
 
+@app.route("/scheduler_status")
+def scheduler_status():
+    """各排程工作最近一次執行的 leader / 時間 / 耗時 / 結果（管理員）。"""
+    from flask import session, jsonify
+    from job_scheduler import read_status
+    if session.get('role') != 'admin':
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify(read_status(SCHEDULER_STATUS))
+
 @app.route("/db_ping")
 def db_ping():
     from db import get_db
@@ -0,0 +1,300 @@
+# dedup.py
+# -*- coding: utf-8 -*-
+"""
+近似重複發票偵測（感知雜湊）
+- 同一張紙本發票被 /camera 拍兩次、或 Email 與手動上傳各來一次時，不再重跑 YOLO + OCR
+- 每張圖算 pHash（DCT）+ dHash（梯度），兩個漢明距離都低於門檻才是「候選」；
+  雜湊只看 32x32 / 17x16 的縮圖，同一家廠商、版面相同但號碼 / 金額不同的發票距離也只有個位數，
+  所以候選還要再比欄位：記下時存每個欄位框（YOLO 偵測、含 padding）的小灰階圖（高 FIELD_SIG_H），
+  新圖在同一位置（稍微放大範圍容許平移）對齊後比局部差異（field_matches），每個欄位都對得上才算重複；
+  先前沒有欄位框的結果一律不當重複
+- 只比對同一位擁有者（登入使用者 / 來源 IP）的紀錄，別人的辨識結果與裁切圖不會回給你
+- 每筆紀錄用自己的 id 當鍵（相機上傳的檔名常常都是 snapshot.jpg，不能用檔名）
+- 最近的雜湊與辨識結果存在記憶體（有上限 / 有效期），並追加到 data/phash_index.jsonl，重啟後載回
+  （裡面有每位使用者的辨識結果，不能放在 /uploads 公開提供的資料夾；DUP_INDEX_FILE 可改路徑）
+- 找到重複時回傳先前的結果並標記 duplicate，呼叫端可用 force=1 強制重跑
+"""
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+DUP_ENABLED = os.environ.get("DUP_DETECT", "1") == "1"
+PHASH_MAX_DIST = int(os.environ.get("DUP_PHASH_MAX", 6))
+DHASH_MAX_DIST = int(os.environ.get("DUP_DHASH_MAX", 10))
+INDEX_SIZE = int(os.environ.get("DUP_INDEX_SIZE", 5000))
+INDEX_TTL = float(os.environ.get("DUP_TTL_HOURS", 72)) * 3600
+FIELD_MIN_CORR = float(os.environ.get("DUP_FIELD_MIN_CORR", 0.8))    # 對齊後相關係數下限（對不上 = 不是同一張）
+FIELD_MAX_DIFF = float(os.environ.get("DUP_FIELD_MAX_DIFF", 0.5))    # 最不像的一個字寬範圍平均差異上限
+FIELD_SIG_H = 32          # 欄位小圖高度（像素；太小時數字糊成一團，同版面不同號碼分不開）
+FIELD_SIG_MAX_W = 480
+FIELD_MARGIN = 0.02       # 比對時範圍往外放大（佔整張寬 / 高的比例），容許重拍 / 重掃時的小平移
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+INDEX_FILE = os.environ.get("DUP_INDEX_FILE", os.path.join(_HERE, "data", "phash_index.jsonl"))
+_LEGACY_INDEX_FILE = os.path.join(_HERE, "uploads", "phash_index.jsonl")   # 舊版放在公開的 uploads/ 底下
+
+# 只保留畫面需要的欄位
+_RESULT_KEYS = ("type", "num", "date", "sun", "cash", "crops", "conf")
+
+
+# === 雜湊 ===
+def _gray(img_bgr):
+    import cv2
+    if img_bgr.ndim == 3:
+        return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    return img_bgr
+
+
+def phash(img_bgr) -> int:
+    """32x32 灰階 → DCT → 左上 8x8 低頻與中位數比較，64 bits。"""
+    import cv2
+    import numpy as np
+    g = cv2.resize(_gray(img_bgr), (32, 32), interpolation=cv2.INTER_AREA)
+    d = cv2.dct(np.float32(g))[:8, :8].flatten()
+    med = np.median(d[1:])  # 不含 DC
+    bits = d > med
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def dhash(img_bgr, size: int = 16) -> int:
+    """(size+1)xsize 灰階，左右相鄰比較，size*size bits（預設 256）。"""
+    import cv2
+    g = cv2.resize(_gray(img_bgr), (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (g[:, 1:] > g[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hashes(img_bgr) -> Tuple[int, int]:
+    return phash(img_bgr), dhash(img_bgr)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# === 欄位小圖 ===
+def _box_px(box: List[float], W: int, H: int, margin: float = 0.0) -> Tuple[int, int, int, int]:
+    x1, y1, x2, y2 = box
+    mx = my = margin
+    return (max(0, int((x1 - mx) * W)), max(0, int((y1 - my) * H)),
+            min(W, int(round((x2 + mx) * W))), min(H, int(round((y2 + my) * H))))
+
+
+def _field_region(img_bgr, box: List[float]):
+    """欄位框放大 FIELD_MARGIN 後縮到欄位高 FIELD_SIG_H → (縮小後的範圍, 欄位在其中的 (x, y, w, h))。"""
+    import cv2
+    H, W = img_bgr.shape[:2]
+    bx1, by1, bx2, by2 = _box_px(box, W, H)
+    if bx2 - bx1 < 4 or by2 - by1 < 4:
+        return None, None
+    x1, y1, x2, y2 = _box_px(box, W, H, FIELD_MARGIN)
+    s = min(FIELD_SIG_H / float(by2 - by1), FIELD_SIG_MAX_W / float(bx2 - bx1))
+    region = cv2.resize(_gray(img_bgr[y1:y2, x1:x2]),
+                        (max(1, int(round((x2 - x1) * s))), max(1, int(round((y2 - y1) * s)))),
+                        interpolation=cv2.INTER_AREA)
+    ox, oy = int(round((bx1 - x1) * s)), int(round((by1 - y1) * s))
+    w = min(region.shape[1] - ox, max(1, int(round((bx2 - bx1) * s))))
+    h = min(region.shape[0] - oy, max(1, int(round((by2 - by1) * s))))
+    return region, (ox, oy, w, h)
+
+
+def field_signature(img_bgr, box: List[float]) -> Optional[Dict[str, Any]]:
+    """欄位框 → 高約 FIELD_SIG_H 的灰階小圖（zlib + base64）；縮放方式與比對時相同，同一張圖會完全對齊。"""
+    region, at = _field_region(img_bgr, box)
+    if region is None:
+        return None
+    ox, oy, w, h = at
+    sig = region[oy:oy + h, ox:ox + w].copy()
+    return {"box": list(box), "w": w, "h": h, "sig": base64.b64encode(zlib.compress(sig.tobytes())).decode("ascii")}
+
+
+def field_matches(img_bgr, f: Dict[str, Any]) -> bool:
+    """
+    新圖同一位置（放大 FIELD_MARGIN，容許小平移）與記下的欄位小圖比對：
+    先用正規化相關找對齊位置（相關太低 = 對不上），再看對齊後差異最大的一個字寬範圍；
+    整段相關係數會被相同的標籤文字撐高，只改一兩個數字時要看局部差異才分得出來
+    """
+    import cv2
+    import numpy as np
+    sig = np.frombuffer(zlib.decompress(base64.b64decode(f["sig"])), np.uint8).reshape(f["h"], f["w"])
+    region, _ = _field_region(img_bgr, f["box"])
+    if region is None or region.shape[0] < sig.shape[0] or region.shape[1] < sig.shape[1]:
+        return False
+    if float(sig.std()) < 1.0:
+        # 空白欄位：只要求新圖同一位置也是空白
+        return float(region.std()) < 4.0
+    res = cv2.matchTemplate(region, sig, cv2.TM_CCOEFF_NORMED)
+    _, corr, _, (px, py) = cv2.minMaxLoc(res)
+    if corr < FIELD_MIN_CORR:
+        return False
+    a = region[py:py + f["h"], px:px + f["w"]].astype(np.float32)
+    b = sig.astype(np.float32)
+    a = (a - a.mean()) / (a.std() + 1e-3)
+    b = (b - b.mean()) / (b.std() + 1e-3)
+    diff = cv2.GaussianBlur(np.abs(a - b), (0, 0), 1.0).mean(axis=0)
+    win = max(2, min(f["w"], f["h"] // 2))
+    worst = float(np.convolve(diff, np.ones(win) / win, mode="valid").max())
+    return worst <= FIELD_MAX_DIFF
+
+
+def field_signatures(img_bgr, result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for c in result.get("crops") or []:
+        if c.get("box"):
+            s = field_signature(img_bgr, c["box"])
+            if s:
+                out[c["key"]] = s
+    return out
+
+
+def fields_match(img_bgr, fields: Dict[str, Dict[str, Any]]) -> bool:
+    if not fields:
+        return False
+    return all(field_matches(img_bgr, f) for f in fields.values())
+
+
+# === 最近雜湊索引 ===
+class RecentHashIndex:
+    """最近 N 張的 (phash, dhash) → 結果；線性掃描（N 幾千筆，XOR + popcount 很便宜）。"""
+
+    def __init__(self, size: int = INDEX_SIZE, ttl: float = INDEX_TTL, path: str = ""):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.field_mismatches = 0   # 雜湊像但欄位內容不同（同版面不同張）
+        if path:
+            self._load()
+
+    def _load(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.isfile(_LEGACY_INDEX_FILE) and os.path.abspath(self.path) != _LEGACY_INDEX_FILE:
+            # 舊版的索引搬到私有資料夾（已經有新檔就直接刪掉公開的那份）
+            try:
+                if os.path.isfile(self.path):
+                    os.remove(_LEGACY_INDEX_FILE)
+                else:
+                    os.replace(_LEGACY_INDEX_FILE, self.path)
+            except OSError as ex:
+                print(f"[DEDUP] 搬移舊雜湊索引失敗：{ex}")
+        if not os.path.isfile(self.path):
+            return
+        now = time.time()
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue
+                    # 舊格式（沒有 id / 欄位小圖）的紀錄不可能比對成功，直接丟掉
+                    if e.get("id") and now - e.get("ts", 0) <= self.ttl:
+                        self._items[e["id"]] = e
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+            # 重寫一次檔案，把過期 / 超量的清掉
+            self._rewrite()
+        except Exception as ex:
+            print(f"[DEDUP] 載入雜湊索引失敗：{ex}")
+
+    def _rewrite(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            for e in self._items.values():
+                fp.write(json.dumps(e, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def find(self, ph: int, dh: int, owner: str = "", img_bgr=None) -> Optional[Dict[str, Any]]:
+        """
+        同一擁有者、雜湊夠近的候選依距離由近到遠，第一個欄位內容也對得上的就是重複。
+        img_bgr 不給（或候選沒有欄位小圖）時不做欄位比對，一律不算重複。
+        """
+        now = time.time()
+        cands = []
+        with self._lock:
+            for e in self._items.values():
+                if now - e["ts"] > self.ttl or e.get("owner", "") != owner:
+                    continue
+                d_p = hamming(ph, int(e["phash"], 16))
+                if d_p > PHASH_MAX_DIST:
+                    continue
+                d_d = hamming(dh, int(e["dhash"], 16))
+                if d_d > DHASH_MAX_DIST:
+                    continue
+                cands.append(((d_p, d_d, -e["ts"]), e))
+        cands.sort(key=lambda t: t[0])
+        for (d_p, d_d, _), e in cands:
+            if img_bgr is not None and fields_match(img_bgr, e.get("fields") or {}):
+                with self._lock:
+                    self.hits += 1
+                return dict(e, distance=d_p, dhash_distance=d_d)
+        with self._lock:
+            self.misses += 1
+            if cands:
+                self.field_mismatches += 1
+        return None
+
+    def add(self, filename: str, ph: int, dh: int, result: Dict[str, Any],
+            owner: str = "", img_bgr=None):
+        e = {
+            "id": uuid.uuid4().hex,
+            "filename": filename,
+            "owner": owner,
+            "phash": f"{ph:016x}",
+            "dhash": f"{dh:064x}",
+            "ts": time.time(),
+            "result": {k: result.get(k) for k in _RESULT_KEYS if k in result},
+            "fields": field_signatures(img_bgr, result) if img_bgr is not None else {},
+        }
+        with self._lock:
+            self._items[e["id"]] = e
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as fp:
+                        fp.write(json.dumps(e, ensure_ascii=False) + "\n")
+                except Exception as ex:
+                    print(f"[DEDUP] 寫入雜湊索引失敗：{ex}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses,
+                "field_mismatches": self.field_mismatches}
+
+
+INDEX = RecentHashIndex(path=INDEX_FILE)
+
+
+# === 給 detect_and_ocr 呼叫端用 ===
+def find_duplicate(img_bgr, owner: str = "") -> Tuple[Optional[Dict[str, Any]], Tuple[int, int]]:
+    """回傳 (同一擁有者先前的紀錄或 None, 這張圖的雜湊)；雜湊交給 remember() 避免重算。"""
+    hs = hashes(img_bgr)
+    if not DUP_ENABLED:
+        return None, hs
+    return INDEX.find(hs[0], hs[1], owner=owner, img_bgr=img_bgr), hs
+
+
+def remember(filename: str, hs: Tuple[int, int], result: Dict[str, Any], img_bgr=None, owner: str = ""):
+    """filename 是實際存檔的名稱（duplicate_of 會指向它）；img_bgr 用來記欄位小圖。"""
+    if DUP_ENABLED:
+        INDEX.add(filename, hs[0], hs[1], result, owner=owner, img_bgr=img_bgr)
+
+
+def duplicate_info(prior: Dict[str, Any]) -> Dict[str, Any]:
+    """把先前的結果包成 detect_and_ocr 的回傳格式，加上重複標記。"""
+    info = dict(prior.get("result") or {})
+    info.update({
+        "duplicate": True,
+        "duplicate_of": prior.get("filename", ""),
+        "duplicate_distance": prior.get("distance", 0),
+    })
+    return info
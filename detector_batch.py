@@ -0,0 +1,330 @@
+# detector_batch.py
+# -*- coding: utf-8 -*-
+"""
+命令列批次辨識（補歷年歸檔發票用；網頁上傳以外唯一的批次入口）
+
+    python detector_batch.py run --src D:/archive/2019 --out out/2019.jsonl [--csv out/2019.csv]
+                                 [--workers 4] [--pdf-pages first|all] [--profile accurate] [--db --user-id 1]
+
+- 遞迴走訪 --src 底下的圖片（jpg/png/bmp/tif）與 PDF，依路徑排序
+- ProcessPoolExecutor 多行程處理；每個 worker 啟動時載入一次 YOLO + OCR 並預熱 tr3，
+  之後整批都用同一份熱模型（不會每個檔重載）
+- 結果每完成一筆就寫一行 JSONL（flush），有給 --csv 時同步寫 CSV
+- 中斷續跑：JSONL 本身就是進度紀錄，重跑同一個指令會略過已完成的檔案（以相對路徑 + 大小 + 修改時間判斷）；
+  最後一行若只寫了一半會先截掉；--retry-errors 會重做失敗的檔案。--db 的寫入進度記在 <out>.ckpt
+- --db：每 --db-batch 筆一個交易寫進 invoices（source='auto'），並同步更新搜尋索引
+- 流程設定檔預設依來源 batch → accurate（yocr/pipeline_profiles.json），--profile fast 可加速
+- 每個 worker 的 torch 執行緒數 BATCH_TORCH_THREADS（預設 CPU 數 / workers），避免互相搶核心
+- Tesseract / Poppler 路徑請用環境變數 TESSERACT_CMD / POPPLER_PATH 指定
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+PDF_EXTS = {".pdf"}
+CSV_FIELDS = ["file", "page", "type", "num", "date", "sun", "cash", "ms", "error"]
+
+
+# === 檔案清單 ===
+def file_key(path: str, root: str) -> str:
+    st = os.stat(path)
+    rel = os.path.relpath(path, root).replace(os.sep, "/")
+    return f"{rel}|{st.st_size}|{int(st.st_mtime)}"
+
+
+def walk(root: str) -> Iterator[str]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            if os.path.splitext(fn)[1].lower() in IMAGE_EXTS | PDF_EXTS:
+                yield os.path.join(dirpath, fn)
+
+
+# === worker 端 ===
+_W: Dict[str, Any] = {}
+
+
+def _init_worker(threads: int, crops_dir: str):
+    # 要在 import torch 之前設好
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    import ocr_runtime
+    p = ocr_runtime.pipeline()
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    ocr_runtime.warm_up()
+    _W.update(runtime=ocr_runtime, pipeline=p, crops_dir=crops_dir)
+    print(f"[BATCH] worker {os.getpid()} 就緒（torch threads={threads}）")
+
+
+def _record(key: str, rel: str, page: int, info: Dict[str, Any], ms: int, error: str = "") -> Dict[str, Any]:
+    return {
+        "key": key, "file": rel, "page": page,
+        "type": info.get("type", ""), "num": info.get("num", ""), "date": info.get("date", ""),
+        "sun": info.get("sun", ""), "cash": info.get("cash", ""), "conf": info.get("conf", {}),
+        "profile": info.get("profile", ""), "ms": ms, "error": error,
+    }
+
+
+def _process(path: str, key: str, rel: str, pdf_pages: str, profile: str = "") -> List[Dict[str, Any]]:
+    """在 worker 行程裡跑：一個檔案 → 每頁一筆紀錄。例外不往外丟，寫進 error 欄。"""
+    rt = _W["runtime"]
+    crops_dir = _W["crops_dir"]
+    out: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+    try:
+        if os.path.splitext(path)[1].lower() in PDF_EXTS:
+            from ingest import pil_to_bgr
+            pages = rt.pdf_to_images(path)
+            if not pages:
+                raise RuntimeError("PDF 轉圖失敗")
+            if pdf_pages == "first":
+                pages = pages[:1]
+            base = os.path.splitext(os.path.basename(path))[0]
+            for n, pil in enumerate(pages, 1):
+                t1 = time.perf_counter()
+                info = rt.detect_and_ocr(pil_to_bgr(pil), crops_dir=crops_dir, name=f"{base}_p{n}.jpg",
+                                         profile=profile or None, source="batch")
+                out.append(_record(key, rel, n, info, int((time.perf_counter() - t1) * 1000)))
+        else:
+            from ingest import decode_image
+            with open(path, "rb") as fp:   # 不用 cv2.imread：Windows 上中文路徑讀不到
+                img = decode_image(fp.read())
+            if img is None:
+                raise RuntimeError("無法讀取圖片")
+            info = rt.detect_and_ocr(img, crops_dir=crops_dir, name=os.path.basename(path),
+                                     profile=profile or None, source="batch")
+            out.append(_record(key, rel, 1, info, int((time.perf_counter() - t0) * 1000)))
+    except Exception as e:
+        out.append(_record(key, rel, 0, {}, int((time.perf_counter() - t0) * 1000), f"{type(e).__name__}: {e}"))
+    return out
+
+
+# === 輸出 / 續跑 ===
+def _load_done(out_path: str, retry_errors: bool = False) -> Tuple[Set[str], int]:
+    """讀既有 JSONL：回傳已完成的 key 與行數；最後一行不完整就截掉。retry_errors=True 時失敗的檔案不算完成。"""
+    done: Set[str] = set()
+    failed: Set[str] = set()
+    lines = 0
+    if not os.path.exists(out_path):
+        return done, lines
+    good = 0
+    with open(out_path, "rb") as fp:
+        for raw in fp:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                rec = json.loads(raw.decode("utf-8"))
+            except ValueError:
+                break
+            (failed if rec.get("error") else done).add(rec.get("key", ""))
+            lines += 1
+            good += len(raw)
+    if good != os.path.getsize(out_path):
+        print(f"[BATCH] 截掉 {out_path} 尾端不完整的紀錄")
+        with open(out_path, "r+b") as fp:
+            fp.truncate(good)
+    if not retry_errors:
+        done |= failed
+    return done, lines
+
+
+def _read_ckpt(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_ckpt(path: str, data: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+
+# === 寫入資料庫 ===
+def _cash(v: Any) -> Optional[float]:
+    try:
+        return float(str(v).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def insert_records(conn, records: List[Dict[str, Any]], user_id: int, src_root: str) -> int:
+    """一個交易寫入一批；錯誤或沒讀到號碼的紀錄略過。回傳寫入筆數。"""
+    from invoice_search_index import index_invoice
+    cur = conn.cursor()
+    n = 0
+    try:
+        for r in records:
+            if r.get("error") or not r.get("num"):
+                continue
+            cur.execute(
+                "INSERT INTO invoices (user_id, tax_id, in_nu, in_date, in_pri, source, file_path, created_at) "
+                "VALUES (%s,%s,%s,%s,%s,'auto',%s,NOW())",
+                (user_id, r.get("sun") or None, r["num"], r.get("date") or None, _cash(r.get("cash")),
+                 os.path.join(src_root, r["file"])))
+            index_invoice(conn, cur.lastrowid, r["num"], r.get("sun") or "", commit=False)
+            n += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try: cur.close()
+        except Exception: pass
+    return n
+
+
+def _flush_db(args, out_path: str, ckpt_path: str, ckpt: Dict[str, Any], force: bool = False):
+    """把 JSONL 裡還沒寫進資料庫的紀錄分批寫入；ckpt["db_lines"] 記到第幾行。"""
+    start = int(ckpt.get("db_lines", 0))
+    with open(out_path, "r", encoding="utf-8") as fp:
+        pending = [json.loads(line) for i, line in enumerate(fp) if i >= start]
+    if not pending or (len(pending) < args.db_batch and not force):
+        return
+    from db import get_db
+    conn = get_db()
+    if conn is None:
+        raise RuntimeError("資料庫連線失敗")
+    try:
+        for i in range(0, len(pending), args.db_batch):
+            chunk = pending[i:i + args.db_batch]
+            if len(chunk) < args.db_batch and not force:
+                break
+            n = insert_records(conn, chunk, args.user_id, os.path.abspath(args.src))
+            ckpt["db_lines"] = start + i + len(chunk)
+            ckpt["db_rows"] = int(ckpt.get("db_rows", 0)) + n
+            _write_ckpt(ckpt_path, ckpt)
+            print(f"[BATCH] 資料庫寫入 {n} 筆（累計 {ckpt['db_rows']}）")
+    finally:
+        conn.close()
+
+
+# === 主流程 ===
+def run(args) -> int:
+    src = os.path.abspath(args.src)
+    out_path = args.out
+    ckpt_path = out_path + ".ckpt"
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    crops_dir = args.crops or os.path.join(os.path.dirname(os.path.abspath(out_path)), "cropped")
+    os.makedirs(crops_dir, exist_ok=True)
+
+    done, lines = _load_done(out_path, args.retry_errors)
+    ckpt = _read_ckpt(ckpt_path)
+    if args.db and int(ckpt.get("db_lines", 0)) > lines:
+        ckpt["db_lines"] = lines   # JSONL 被截短過
+
+    todo = []
+    for path in walk(src):
+        key = file_key(path, src)
+        if key not in done:
+            todo.append((path, key, os.path.relpath(path, src).replace(os.sep, "/")))
+    print(f"[BATCH] {src}：已完成 {len(done)} 個檔案，待處理 {len(todo)} 個")
+    if not todo:
+        if args.db:
+            _flush_db(args, out_path, ckpt_path, ckpt, force=True)
+        return 0
+
+    workers = max(1, args.workers)
+    threads = int(os.environ.get("BATCH_TORCH_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+    csv_new = bool(args.csv) and not os.path.exists(args.csv)
+    out_fp = open(out_path, "a", encoding="utf-8")
+    csv_fp = open(args.csv, "a", encoding="utf-8-sig" if csv_new else "utf-8", newline="") if args.csv else None
+    writer = csv.DictWriter(csv_fp, fieldnames=CSV_FIELDS, extrasaction="ignore") if csv_fp else None
+    if writer and csv_new:
+        writer.writeheader()
+
+    import multiprocessing as mp
+    t0 = time.perf_counter()
+    n_files = n_pages = n_err = 0
+    it = iter(todo)
+    inflight = {}
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                               initializer=_init_worker, initargs=(threads, crops_dir))
+    try:
+        # 最多 workers*2 個工作在排隊，目錄再大也不會一次全部塞進佇列
+        def _fill():
+            for path, key, rel in it:
+                inflight[pool.submit(_process, path, key, rel, args.pdf_pages, args.profile)] = rel
+                if len(inflight) >= workers * 2:
+                    break
+        _fill()
+        while inflight:
+            finished, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                rel = inflight.pop(fut)
+                recs = fut.result()
+                for r in recs:
+                    out_fp.write(json.dumps(r, ensure_ascii=False) + "\n")
+                    if writer:
+                        writer.writerow(r)
+                    if r["error"]:
+                        n_err += 1
+                        print(f"[BATCH] {rel} 失敗：{r['error']}")
+                n_pages += len(recs)
+                n_files += 1
+                out_fp.flush()
+                if csv_fp:
+                    csv_fp.flush()
+                if n_files % 50 == 0:
+                    rate = n_files / max(1e-6, time.perf_counter() - t0)
+                    print(f"[BATCH] {n_files}/{len(todo)} 檔（{rate:.2f} 檔/秒，錯誤 {n_err}）")
+                    if args.db:
+                        _flush_db(args, out_path, ckpt_path, ckpt)
+            _fill()
+    except BrokenProcessPool as e:
+        # worker 初始化失敗（模型 / tesseract 載不起來）或被系統砍掉：已寫入的紀錄保留，之後續跑
+        print(f"[BATCH] worker 行程異常結束，停止：{e}")
+    except KeyboardInterrupt:
+        print("[BATCH] 中斷；已完成的紀錄都已寫入，重跑同一個指令即可續跑")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        out_fp.close()
+        if csv_fp:
+            csv_fp.close()
+
+    if args.db:
+        _flush_db(args, out_path, ckpt_path, ckpt, force=True)
+    dt = time.perf_counter() - t0
+    print(f"[BATCH] 完成 {n_files} 檔 / {n_pages} 頁，錯誤 {n_err}，耗時 {dt:.1f}s（{n_files / max(dt, 1e-6):.2f} 檔/秒）")
+    return 1 if n_files < len(todo) else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="批次辨識歸檔發票（可中斷續跑）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--src", required=True, help="要走訪的資料夾")
+    r.add_argument("--out", required=True, help="JSONL 結果檔（同時是續跑紀錄）")
+    r.add_argument("--csv", default="", help="另外輸出 CSV")
+    r.add_argument("--crops", default="", help="欄位裁切圖目錄（預設 <out 所在目錄>/cropped）")
+    r.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    r.add_argument("--pdf-pages", choices=("first", "all"), default="all")
+    r.add_argument("--profile", default="", help="流程設定檔（預設依來源 batch → accurate）")
+    r.add_argument("--retry-errors", action="store_true", help="續跑時重做上次失敗的檔案")
+    r.add_argument("--db", action="store_true", help="寫入 invoices 資料表")
+    r.add_argument("--user-id", type=int, default=0, help="--db 時寫入的 user_id")
+    r.add_argument("--db-batch", type=int, default=200)
+    args = ap.parse_args(argv)
+    if args.db and not args.user_id:
+        ap.error("--db 需要 --user-id")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
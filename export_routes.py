@@ -0,0 +1,407 @@
+# export_routes.py
+# -*- coding: utf-8 -*-
+"""
+發票匯出（CSV / XLSX）
+- GET /export/invoices.csv、/export/invoices.xlsx，條件與畫面相同：
+    scope=search（預設）search.html 的 vendor / date_mode / date_range，只匯出登入者自己的發票
+    scope=admin          admin_invoices.html 的 user_id / tax_id / basis / date_range / q / source（管理員）
+- 資料庫端游標（mysql-connector buffered=False）每次 fetchmany(EXPORT_FETCH) 筆，
+  邊讀邊寫成 chunked 回應；不管幾萬筆，記憶體用量都固定
+- XLSX 不靠 openpyxl：zipfile 直接寫進不可 seek 的輸出（data descriptor），工作表用 inline string，
+  一樣是一段一段送出
+- background=1：在背景寫到 exports/<job_id>.<fmt>（EXPORT_DIR），回 202 + 狀態 / 下載網址；
+  進度也推到 job_events（/progress/<job_id>/stream 可訂閱），檔案保留 EXPORT_KEEP_HOURS 小時
+  匯出檔不放在 /uploads 公開的資料夾：job_id 會出現在進度串流裡，只能經 export_download 檢查權限後下載
+"""
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from flask import Response, abort, jsonify, request, send_from_directory, session, stream_with_context, url_for
+
+from core_app import app
+from job_events import EVENTS
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(app.config["ROOT_DIR"], "exports"))
+_LEGACY_EXPORT_DIR = os.path.join(app.config["UPLOAD_FOLDER"], "exports")   # 舊版放在公開的 uploads/ 底下
+EXPORT_FETCH = int(os.environ.get("EXPORT_FETCH", 1000))          # 每次從游標取幾筆
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 500))  # 幾筆送出一段
+EXPORT_KEEP_HOURS = float(os.environ.get("EXPORT_KEEP_HOURS", 24))
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# (SELECT 欄位, 標題, 是否數值)
+COLUMNS: List[Tuple[str, str, bool]] = [
+    ("i.id", "ID", True),
+    ("i.in_nu", "發票號碼", False),
+    ("i.in_date", "發票日期", False),
+    ("i.in_pri", "金額", True),
+    ("i.tax_id", "賣方統編", False),
+    ("c.co_na", "公司名稱", False),
+    ("u.us_na", "使用者", False),
+    ("i.source", "來源", False),
+    ("i.created_at", "建立時間", False),
+    ("i.file_path", "檔案", False),
+]
+
+os.makedirs(EXPORT_DIR, exist_ok=True)
+if os.path.isdir(_LEGACY_EXPORT_DIR) and os.path.abspath(_LEGACY_EXPORT_DIR) != os.path.abspath(EXPORT_DIR):
+    # 舊版留在公開資料夾的匯出檔直接刪掉（本來就只保留 EXPORT_KEEP_HOURS，使用者重新匯出即可）
+    shutil.rmtree(_LEGACY_EXPORT_DIR, ignore_errors=True)
+
+
+# === 篩選條件 ===
+def _vendor_tax_id(conn, vendor: str) -> str:
+    """search.html 的廠商選單值：統編直接用，否則當 companies.id 查統編。"""
+    vendor = (vendor or "").strip()
+    if not vendor or re.fullmatch(r"\d{8}", vendor):
+        return vendor
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT tax_id FROM companies WHERE id=%s", (vendor,))
+        row = cur.fetchone()
+    except Exception:
+        row = None
+    finally:
+        try: cur.close()
+        except Exception: pass
+    return (row or {}).get("tax_id") or vendor
+
+
+def export_filters(conn, args) -> Dict[str, Any]:
+    """依 scope 把畫面的查詢參數轉成 admin_invoice_query 的 filters。"""
+    from admin_invoice_query import BASIS_COLUMNS, filters_from_args, parse_date_range, with_search_index
+    if (args.get("scope") or "search") == "admin":
+        if session.get("role") != "admin":
+            abort(403)
+        # 關鍵字走搜尋索引子查詢，匯出的是全部符合的發票，不會被候選上限截斷
+        return with_search_index(conn, filters_from_args(args))
+    start, end = parse_date_range(args.get("date_range") or "")
+    basis = args.get("date_mode") or "in_date"
+    return {
+        "user_id": session.get("user_id"),
+        "tax_id": _vendor_tax_id(conn, args.get("vendor")),
+        "basis": basis if basis in BASIS_COLUMNS else "in_date",
+        "start": start,
+        "end": end,
+        "q": "",
+        "source": "",
+    }
+
+
+def build_export_query(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    from admin_invoice_query import BASIS_COLUMNS, COMPANY_TABLE, INVOICE_TABLE, USER_TABLE, _where
+    col = BASIS_COLUMNS.get(filters.get("basis") or "in_date", "in_date")
+    conds, params = _where(filters, col)
+    where_sql = ("WHERE " + " AND ".join(conds)) if conds else ""
+    sql = (
+        f"SELECT {', '.join(c for c, _, _ in COLUMNS)} FROM {INVOICE_TABLE} i "
+        f"LEFT JOIN {USER_TABLE} u ON u.id = i.user_id "
+        f"LEFT JOIN {COMPANY_TABLE} c ON c.tax_id = i.tax_id "
+        f"{where_sql} ORDER BY i.{col} DESC, i.id DESC"
+    )
+    return sql, params
+
+
+# === 逐筆讀取 ===
+def _cell(v: Any) -> Any:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, date):
+        return v.strftime("%Y-%m-%d")
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def iter_rows(conn, sql: str, params: List[Any]) -> Iterator[List[Any]]:
+    """資料庫端游標：結果不整包抓進記憶體，每次 fetchmany 一批。"""
+    cur = conn.cursor(buffered=False)
+    try:
+        cur.execute(sql, tuple(params))
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH)
+            if not rows:
+                break
+            for r in rows:
+                yield [_cell(v) for v in r]
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+# === CSV ===
+_FORMULA = ("=", "+", "-", "@")
+
+
+def _csv_safe(v: Any) -> Any:
+    # Excel 會把 = + - @ 開頭的字串當公式
+    return "'" + v if isinstance(v, str) and v.startswith(_FORMULA) else v
+
+
+def csv_chunks(rows: Iterator[List[Any]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    buf.write("\ufeff")   # BOM：Excel 直接開才不會亂碼
+    w.writerow([h for _, h, _ in COLUMNS])
+    n = 0
+    for r in rows:
+        w.writerow([_csv_safe(v) for v in r])
+        n += 1
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+# === XLSX ===
+class _Sink:
+    """zipfile 的輸出端：沒有 seek / tell，zipfile 會改用 data descriptor；寫進來的位元組隨時取走送出。"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="invoices" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'),
+}
+
+_XML_BAD = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_row(values: List[Any], numeric: List[bool]) -> str:
+    cells = []
+    for v, num in zip(values, numeric):
+        if num and isinstance(v, (int, float)):
+            cells.append(f"<c><v>{v}</v></c>")
+        elif v == "":
+            cells.append("<c/>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(_XML_BAD.sub("", str(v)))}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>"
+
+
+def xlsx_chunks(rows: Iterator[List[Any]]) -> Iterator[bytes]:
+    sink = _Sink()
+    numeric = [n for _, _, n in COLUMNS]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_STATIC.items():
+            zf.writestr(name, xml)
+        yield sink.take()
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as fp:
+            fp.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                      + _xlsx_row([h for _, h, _ in COLUMNS], [False] * len(COLUMNS))).encode("utf-8"))
+            n = 0
+            for r in rows:
+                fp.write(_xlsx_row(r, numeric).encode("utf-8"))
+                n += 1
+                if n % EXPORT_CHUNK_ROWS == 0:
+                    yield sink.take()
+            fp.write(b"</sheetData></worksheet>")
+    yield sink.take()
+
+
+WRITERS: Dict[str, Callable[[Iterator[List[Any]]], Iterator[bytes]]] = {"csv": csv_chunks, "xlsx": xlsx_chunks}
+
+
+def export_chunks(conn, fmt: str, sql: str, params: List[Any],
+                  on_row: Optional[Callable[[int], None]] = None) -> Iterator[bytes]:
+    rows = iter_rows(conn, sql, params)
+    if on_row:
+        def counted(it=rows):
+            for n, r in enumerate(it, 1):
+                on_row(n)
+                yield r
+        rows = counted()
+    return WRITERS[fmt](rows)
+
+
+def _download_name(fmt: str) -> str:
+    return f"invoices_{time.strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+
+# === 背景匯出 ===
+def _meta_path(job_id: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}.json")
+
+
+def _read_meta(job_id: str) -> Optional[Dict[str, Any]]:
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+        return None
+    try:
+        with open(_meta_path(job_id), "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta: Dict[str, Any]):
+    tmp = _meta_path(meta["id"]) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(meta, fp, ensure_ascii=False)
+    os.replace(tmp, _meta_path(meta["id"]))
+
+
+def _prune_exports():
+    cutoff = time.time() - EXPORT_KEEP_HOURS * 3600
+    for name in os.listdir(EXPORT_DIR):
+        p = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(p) < cutoff:
+                os.remove(p)
+        except OSError:
+            pass
+
+
+def _run_background(meta: Dict[str, Any], sql: str, params: List[Any]):
+    from db import get_db
+    job_id, fmt = meta["id"], meta["fmt"]
+    out_path = os.path.join(EXPORT_DIR, meta["file"])
+    meta["status"] = "running"
+    _write_meta(meta)
+
+    def progress(n: int):
+        meta["rows"] = n
+        if n % EXPORT_CHUNK_ROWS == 0:
+            EVENTS.publish(job_id, "progress", {"rows": n})
+
+    conn = get_db()
+    try:
+        if conn is None:
+            raise RuntimeError("資料庫連線失敗")
+        with open(out_path + ".part", "wb") as fp:
+            for chunk in export_chunks(conn, fmt, sql, params, on_row=progress):
+                fp.write(chunk)
+        os.replace(out_path + ".part", out_path)
+        meta["status"] = "done"
+    except Exception as e:
+        meta["status"], meta["error"] = "error", str(e)
+        print(f"[EXPORT] {job_id} 失敗：{e}")
+    finally:
+        if conn is not None:
+            conn.close()
+        meta["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        _write_meta(meta)
+        EVENTS.publish(job_id, "done", dict(meta), final=True)
+        print(f"[EXPORT] {job_id} {meta['status']}：{meta.get('rows', 0)} 筆 → {meta['file']}")
+
+
+def _can_see(meta: Dict[str, Any]) -> bool:
+    return session.get("role") == "admin" or (meta.get("owner") is not None and meta["owner"] == session.get("user_id"))
+
+
+# === 路由 ===
+@app.route("/export/invoices.<fmt>", methods=["GET"], endpoint="export_invoices")
+def export_invoices(fmt: str):
+    if fmt not in FORMATS:
+        abort(404)
+    if not session.get("user_id") and session.get("role") != "admin":
+        abort(401)
+    from db import get_db
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "資料庫連線失敗"}), 500
+    try:
+        sql, params = build_export_query(export_filters(conn, request.args))
+    except Exception:
+        conn.close()
+        raise
+
+    if request.args.get("background") == "1":
+        conn.close()
+        _prune_exports()
+        job_id = uuid.uuid4().hex
+        meta = {"id": job_id, "fmt": fmt, "file": f"{job_id}.{fmt}", "name": _download_name(fmt),
+                "owner": session.get("user_id"), "status": "queued", "rows": 0, "error": "",
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"), "finished": "",
+                "download_url": url_for("export_download", job_id=job_id)}
+        _write_meta(meta)
+        threading.Thread(target=_run_background, args=(meta, sql, params), name=f"export-{job_id}",
+                         daemon=True).start()
+        return jsonify({"job_id": job_id, "status_url": url_for("export_status", job_id=job_id),
+                        "download_url": meta["download_url"]}), 202
+
+    def generate():
+        try:
+            yield from export_chunks(conn, fmt, sql, params)
+        finally:
+            conn.close()
+
+    resp = Response(stream_with_context(generate()), mimetype=FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{_download_name(fmt)}"'
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx 不要緩衝
+    return resp
+
+
+@app.route("/export/jobs/<job_id>", methods=["GET"], endpoint="export_status")
+def export_status(job_id: str):
+    meta = _read_meta(job_id)
+    if not meta or not _can_see(meta):
+        abort(404)
+    return jsonify(meta)
+
+
+@app.route("/export/jobs/<job_id>/download", methods=["GET"], endpoint="export_download")
+def export_download(job_id: str):
+    meta = _read_meta(job_id)
+    if not meta or not _can_see(meta):
+        abort(404)
+    if meta["status"] != "done":
+        return jsonify({"error": "匯出尚未完成", "status": meta["status"]}), 409
+    return send_from_directory(EXPORT_DIR, meta["file"], as_attachment=True, download_name=meta["name"])
@@ -0,0 +1,89 @@
+# ingest.py
+# -*- coding: utf-8 -*-
+"""
+上傳檔直接在記憶體解碼
+- 從 request 的檔案串流讀出 bytes → cv2.imdecode，不必先 f.save() 再 cv2.imread
+- 原檔寫入 uploads/ 丟到背景執行緒，與 YOLO + OCR 同時進行
+- PDF 轉出的頁面（PIL）也直接轉成 BGR 陣列
+- 整頁多張模式切出的區塊（BGR 陣列）也在背景寫檔
+"""
+import os
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Iterable, Optional
+
+_PERSIST_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("PERSIST_WORKERS", 2)),
+                                   thread_name_prefix="persist")
+
+
+def read_upload(f) -> bytes:
+    """讀出 FileStorage 內容（小檔在記憶體，大檔由 werkzeug 暫存在 spooled 檔）。"""
+    try:
+        f.stream.seek(0)
+    except Exception:
+        pass
+    return f.read()
+
+
+def decode_image(data: bytes):
+    """bytes → BGR numpy array；無法解碼回 None。"""
+    if not data:
+        return None
+    import cv2
+    import numpy as np
+    buf = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def pil_to_bgr(pil_img):
+    import cv2
+    import numpy as np
+    return cv2.cvtColor(np.asarray(pil_img.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def _write_bytes(data: bytes, path: str) -> str:
+    tmp = f"{path}.{uuid.uuid4().hex[:6]}.part"
+    with open(tmp, "wb") as fp:
+        fp.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _write_jpeg(pil_img, path: str, quality: int = 95) -> str:
+    tmp = f"{path}.{uuid.uuid4().hex[:6]}.part"
+    pil_img.save(tmp, "JPEG", quality=quality)
+    os.replace(tmp, path)
+    return path
+
+
+def persist_async(data: bytes, path: str) -> Future:
+    """背景寫檔（先寫 .part 再改名，/uploads 不會讀到寫一半的檔）。"""
+    return _PERSIST_POOL.submit(_write_bytes, data, path)
+
+
+def persist_jpeg_async(pil_img, path: str, quality: int = 95) -> Future:
+    return _PERSIST_POOL.submit(_write_jpeg, pil_img, path, quality)
+
+
+def _write_bgr(img_bgr, path: str, quality: int = 95) -> str:
+    import cv2
+    ok, buf = cv2.imencode(".jpg", img_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError(f"JPEG 編碼失敗：{path}")
+    return _write_bytes(buf.tobytes(), path)
+
+
+def persist_bgr_async(img_bgr, path: str, quality: int = 95) -> Future:
+    """整頁切出來的區塊（BGR 陣列）在背景編碼 + 寫檔。"""
+    return _PERSIST_POOL.submit(_write_bgr, img_bgr, path, quality)
+
+
+def wait_persisted(futures: Iterable[Optional[Future]], timeout: float = 30.0):
+    """回應前確認原檔都已落地（前端拿到 imageUrl 會馬上載圖）；寫檔失敗只記 log。"""
+    fs = [f for f in futures if f is not None]
+    if not fs:
+        return
+    wait(fs, timeout=timeout)
+    for f in fs:
+        if f.done() and f.exception() is not None:
+            print(f"[INGEST] 原檔寫入失敗：{f.exception()}")
@@ -0,0 +1,265 @@
+# invoice_search_index.py
+# -*- coding: utf-8 -*-
+"""
+發票號碼（num）/ 賣方統編（snu）部分比對索引
+- 3-gram 表 invoice_search_grams：中段比對（AB12 → 含 "B12" 的發票）不必 LIKE '%…%' 掃全表
+- 正規化值表 invoice_search_keys：前綴比對與最後的精確驗證
+- OCR 容錯：O/0、B/8、I/1、Z/2、G/6 先折成同一個字再建索引（與 ocr_utils 的 mapping 相同），
+  所以 "AB1234" 也找得到被存成 "A81234" 的發票
+- 新增 / 修改 / 刪除發票後呼叫 sync_invoice(conn, invoice_id)（只要 id，會自己讀現值；發票已刪就移除索引）；
+  手上已有號碼 / 統編的批次流程可直接用 index_invoice() / remove_invoice()
+- 沒掛到的寫入路徑由 reconcile_index() 補：排程每 SEARCH_INDEX_RECONCILE_SECONDS 秒跑一次（core_app），
+  也可手動 `python invoice_search_index.py --reconcile`；整個重建用 `--rebuild`
+- 查詢端用 match_sql() 產生子查詢（i.id IN (...)），符合的全部都在，不先抓一批 id 再截斷；
+  search_invoice_ids() 只在需要排序好的 id 清單時用
+表結構見 migrations/002_invoice_search_index.sql
+"""
+import re
+import sys
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+GRAM_TABLE = "invoice_search_grams"
+KEY_TABLE = "invoice_search_keys"
+INVOICE_TABLE = "invoices"
+
+# 欄位 → invoices 的實際欄名
+FIELDS = {"num": "in_nu", "snu": "tax_id"}
+
+GRAM = 3
+
+# OCR 常見誤讀：字母一律折成數字（ocr_utils 的 fix_* 是反方向修正同一組字元）
+_CONFUSABLE = str.maketrans({"O": "0", "B": "8", "I": "1", "Z": "2", "G": "6"})
+
+
+# === 正規化 / 切 gram ===
+def normalize(s: str, fuzzy: bool = True) -> str:
+    t = re.sub(r"[^A-Z0-9]", "", (s or "").upper())
+    return t.translate(_CONFUSABLE) if fuzzy else t
+
+
+def grams(norm: str) -> Set[str]:
+    if len(norm) < GRAM:
+        return set()
+    return {norm[i:i + GRAM] for i in range(len(norm) - GRAM + 1)}
+
+
+# === 寫入 ===
+def index_invoice(conn, invoice_id: int, num: str = "", snu: str = "", commit: bool = True):
+    """重建單張發票的索引（先刪再寫，可重複呼叫）。"""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DELETE FROM {GRAM_TABLE} WHERE invoice_id=%s", (invoice_id,))
+        cur.execute(f"DELETE FROM {KEY_TABLE} WHERE invoice_id=%s", (invoice_id,))
+        key_rows, gram_rows = [], []
+        for field, raw in (("num", num), ("snu", snu)):
+            norm = normalize(raw)
+            if not norm:
+                continue
+            key_rows.append((invoice_id, field, norm, normalize(raw, fuzzy=False)))
+            gram_rows.extend((g, field, invoice_id) for g in grams(norm))
+        if key_rows:
+            cur.executemany(
+                f"INSERT INTO {KEY_TABLE} (invoice_id, field, norm, raw) VALUES (%s,%s,%s,%s)", key_rows)
+        if gram_rows:
+            cur.executemany(
+                f"INSERT IGNORE INTO {GRAM_TABLE} (gram, field, invoice_id) VALUES (%s,%s,%s)", gram_rows)
+        if commit:
+            conn.commit()
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+def remove_invoice(conn, invoice_id: int, commit: bool = True):
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DELETE FROM {GRAM_TABLE} WHERE invoice_id=%s", (invoice_id,))
+        cur.execute(f"DELETE FROM {KEY_TABLE} WHERE invoice_id=%s", (invoice_id,))
+        if commit:
+            conn.commit()
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+def sync_invoice(conn, invoice_id: int, commit: bool = True):
+    """依 invoices 現值更新單張發票的索引；發票已不存在就移除。"""
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(f"SELECT {FIELDS['num']} AS num, {FIELDS['snu']} AS snu FROM {INVOICE_TABLE} WHERE id=%s",
+                    (invoice_id,))
+        row = cur.fetchone()
+    finally:
+        try: cur.close()
+        except Exception: pass
+    if row is None:
+        remove_invoice(conn, invoice_id, commit=commit)
+    else:
+        index_invoice(conn, invoice_id, row.get("num") or "", row.get("snu") or "", commit=commit)
+
+
+def rebuild_index(conn, batch: int = 1000) -> int:
+    """依 id 分批把 invoices 全部重建一次，回傳處理筆數。"""
+    done, last_id = 0, 0
+    while True:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(
+                f"SELECT id, {FIELDS['num']} AS num, {FIELDS['snu']} AS snu FROM {INVOICE_TABLE} "
+                f"WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch))
+            rows = cur.fetchall() or []
+        finally:
+            try: cur.close()
+            except Exception: pass
+        if not rows:
+            break
+        for r in rows:
+            index_invoice(conn, r["id"], r.get("num") or "", r.get("snu") or "", commit=False)
+        conn.commit()
+        done += len(rows)
+        last_id = rows[-1]["id"]
+    return done
+
+
+def _fetch(conn, sql: str, params=()) -> List[Dict[str, Any]]:
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(sql, tuple(params))
+        return cur.fetchall() or []
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+def reconcile_index(conn, batch: int = 1000) -> Dict[str, int]:
+    """
+    找出索引與 invoices 對不上的發票並修正（沒呼叫 sync_invoice 的新增 / 修改 / 刪除）：
+    - 索引裡有、invoices 已刪掉 → 移除
+    - 號碼 / 統編和索引的原字串不同（或根本沒建）→ 重建該張
+    只重寫對不上的，其餘只讀；回傳 {"checked", "reindexed", "removed"}
+    """
+    stats = {"checked": 0, "reindexed": 0, "removed": 0}
+    for table in (KEY_TABLE, GRAM_TABLE):
+        gone = _fetch(conn, f"SELECT DISTINCT x.invoice_id FROM {table} x "
+                            f"LEFT JOIN {INVOICE_TABLE} i ON i.id = x.invoice_id WHERE i.id IS NULL")
+        for r in gone:
+            remove_invoice(conn, r["invoice_id"], commit=False)
+        stats["removed"] += len(gone)
+    conn.commit()
+
+    last_id = 0
+    while True:
+        rows = _fetch(conn, f"SELECT id, {FIELDS['num']} AS num, {FIELDS['snu']} AS snu FROM {INVOICE_TABLE} "
+                            f"WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch))
+        if not rows:
+            break
+        indexed: Dict[int, Dict[str, str]] = {}
+        for k in _fetch(conn, f"SELECT invoice_id, field, raw FROM {KEY_TABLE} "
+                              f"WHERE invoice_id BETWEEN %s AND %s", (rows[0]["id"], rows[-1]["id"])):
+            indexed.setdefault(int(k["invoice_id"]), {})[k["field"]] = k["raw"]
+        for r in rows:
+            want = {f: normalize(r.get(f) or "", fuzzy=False) for f in FIELDS}
+            want = {f: v for f, v in want.items() if v}
+            if indexed.get(int(r["id"]), {}) != want:
+                index_invoice(conn, r["id"], r.get("num") or "", r.get("snu") or "", commit=False)
+                stats["reindexed"] += 1
+        conn.commit()
+        stats["checked"] += len(rows)
+        last_id = rows[-1]["id"]
+    return stats
+
+
+# === 查詢 ===
+def _placeholders(n: int) -> str:
+    return ",".join(["%s"] * n)
+
+
+def match_sql(q: str, fields: Sequence[str] = ("num", "snu"), fuzzy: bool = True,
+              prefix: bool = False, columns: str = "k.invoice_id") -> Tuple[str, List[Any]]:
+    """
+    回傳 (sql, params)：選出所有符合的 KEY_TABLE 列（預設只有 invoice_id），可直接當 IN 子查詢。
+    - prefix=True 或查詢字串不足 3 碼：只做前綴比對（走 (field, norm) 索引）
+    - 其餘：3-gram 交集找候選，再用正規化值 LIKE 驗證是否真的包含（只驗證候選，不掃全表）
+    - fuzzy=False：不做 O/0、B/8… 折疊，只比英數字
+    查詢字串正規化後只剩英數字，不會有 LIKE 萬用字元；沒有可比對的內容時回 ("", [])。
+    """
+    fields = [f for f in fields if f in FIELDS]
+    norm_q = normalize(q, fuzzy=True)
+    raw_q = normalize(q, fuzzy=False)
+    if not fields or not norm_q:
+        return "", []
+    col, val = ("k.norm", norm_q) if fuzzy else ("k.raw", raw_q)
+    if prefix or len(norm_q) < GRAM:
+        return (f"SELECT {columns} FROM {KEY_TABLE} k "
+                f"WHERE k.field IN ({_placeholders(len(fields))}) AND k.norm LIKE %s AND {col} LIKE %s",
+                [*fields, norm_q + "%", val + "%"])
+    gs = sorted(grams(norm_q))
+    return (f"SELECT {columns} FROM ("
+            f"  SELECT invoice_id, field FROM {GRAM_TABLE} "
+            f"  WHERE gram IN ({_placeholders(len(gs))}) AND field IN ({_placeholders(len(fields))}) "
+            f"  GROUP BY invoice_id, field HAVING COUNT(*) = %s"
+            f") g JOIN {KEY_TABLE} k ON k.invoice_id = g.invoice_id AND k.field = g.field "
+            f"WHERE {col} LIKE %s",
+            [*gs, *fields, len(gs), f"%{val}%"])
+
+
+def index_available(conn) -> bool:
+    """索引表建好了沒（還沒跑 migration 時呼叫端退回 LIKE）。"""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT 1 FROM {KEY_TABLE} LIMIT 1")
+        cur.fetchall()
+        return True
+    except Exception as e:
+        print(f"[SEARCH INDEX] 索引表無法使用：{e}")
+        return False
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+def search_invoice_ids(conn, q: str, fields: Sequence[str] = ("num", "snu"),
+                       fuzzy: bool = True, prefix: bool = False, limit: int = 500) -> List[int]:
+    """
+    回傳符合的 invoice id，精確相符排前面，取前 limit 個（排序是在全部符合的裡面排，不是隨便截一批）。
+    要「全部符合的」請用 match_sql() 當子查詢。
+    """
+    sql, params = match_sql(q, fields, fuzzy, prefix, columns="k.invoice_id, k.raw")
+    if not sql:
+        return []
+    raw_q = normalize(q, fuzzy=False)
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(sql, tuple(params))
+        cands = cur.fetchall() or []
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+    scored: Dict[int, int] = {}
+    for c in cands:
+        raw = c.get("raw") or ""
+        # 0 = 完全相同、1 = 原字串包含、2 = 只在容錯後相符
+        rank = 0 if raw == raw_q else 1 if raw_q in raw else 2
+        iid = int(c["invoice_id"])
+        scored[iid] = min(rank, scored.get(iid, rank))
+    return sorted(scored, key=lambda i: (scored[i], -i))[:limit]
+
+
+if __name__ == "__main__":
+    if "--rebuild" not in sys.argv and "--reconcile" not in sys.argv:
+        print("用法：python invoice_search_index.py --rebuild | --reconcile")
+        sys.exit(1)
+    from db import get_db
+    conn = get_db()
+    if conn is None:
+        print("資料庫連線失敗")
+        sys.exit(1)
+    try:
+        if "--reconcile" in sys.argv:
+            print(f"搜尋索引校正完成：{reconcile_index(conn)}")
+        else:
+            n = rebuild_index(conn)
+            print(f"搜尋索引重建完成：{n} 筆")
+    finally:
+        conn.close()
@@ -0,0 +1,94 @@
+# job_events.py
+# -*- coding: utf-8 -*-
+"""
+背景工作的事件串流（Server-Sent Events）
+- 每個 job 一串事件（progress / row / done），依序編號
+- 前端用 EventSource 訂閱 /progress/<job_id>/stream，事件一產生就推送，不再每 500ms 輪詢
+- 斷線重連時瀏覽器會帶 Last-Event-ID，從下一筆接著送，不會漏也不會重複
+- 訂閱可以比 job 開始得早（前端先開串流再送 /upload），會等到事件出現
+- 結束超過 JOB_EVENTS_TTL 秒的 job 會被清掉
+- 等了 JOB_STREAM_IDLE 秒還沒有任何事件（job id 不存在或一直沒開始）就送 status=missing 的 done 關掉串流，
+  否則瀏覽器會一直收 keepalive、斷了又自動重連
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+JOB_EVENTS_TTL = int(os.environ.get("JOB_EVENTS_TTL", 3600))
+JOB_STREAM_IDLE = int(os.environ.get("JOB_STREAM_IDLE", 300))
+KEEPALIVE_SECONDS = 15
+
+
+class _Job:
+    __slots__ = ("events", "finished", "ts")
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.finished = False
+        self.ts = time.time()
+
+
+class JobEvents:
+    def __init__(self, ttl: int = JOB_EVENTS_TTL):
+        self.ttl = ttl
+        self._jobs: Dict[str, _Job] = {}
+        self._cond = threading.Condition()
+
+    def _job(self, job_id: str) -> _Job:
+        j = self._jobs.get(job_id)
+        if j is None:
+            j = self._jobs[job_id] = _Job()
+        return j
+
+    def _prune(self):
+        now = time.time()
+        for k in [k for k, j in self._jobs.items() if (j.finished or not j.events) and now - j.ts > self.ttl]:
+            self._jobs.pop(k, None)
+
+    def publish(self, job_id: str, event: str, data: Dict[str, Any], final: bool = False):
+        with self._cond:
+            j = self._job(job_id)
+            if j.finished:
+                return
+            j.events.append({"id": len(j.events), "event": event, "data": data})
+            j.ts = time.time()
+            if final:
+                j.finished = True
+                self._prune()
+            self._cond.notify_all()
+
+    def stream(self, job_id: str, last_id: Optional[int] = None) -> Iterator[str]:
+        """SSE 格式的產生器；job 結束（送出 final 事件）後結束。"""
+        nxt = 0 if last_id is None else last_id + 1
+        since = time.time()
+        yield "retry: 2000\n\n"
+        while True:
+            with self._cond:
+                # 只查不建：亂給的 job id 不會在 _jobs 裡留一筆
+                j = self._jobs.get(job_id)
+                if j is None or (nxt >= len(j.events) and not j.finished):
+                    self._cond.wait(timeout=KEEPALIVE_SECONDS)
+                    j = self._jobs.get(job_id)
+                pending = j.events[nxt:] if j else []
+                finished = bool(j and j.finished)
+                started = bool(j and j.events)
+            if not pending:
+                if finished:
+                    return
+                if not started and time.time() - since > JOB_STREAM_IDLE:
+                    missing = {"status": "missing", "total": 0, "done": 0, "error": "", "finished": True}
+                    yield f"event: done\ndata: {json.dumps(missing)}\n\n"
+                    return
+                yield ": keepalive\n\n"   # 讓 proxy 不會因閒置切斷
+                continue
+            for e in pending:
+                payload = json.dumps(e["data"], ensure_ascii=False)
+                yield f"id: {e['id']}\nevent: {e['event']}\ndata: {payload}\n\n"
+            nxt = pending[-1]["id"] + 1
+            if finished and nxt >= len(j.events):
+                return
+
+
+EVENTS = JobEvents()
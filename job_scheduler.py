@@ -0,0 +1,173 @@
+# job_scheduler.py
+# -*- coding: utf-8 -*-
+"""
+排程工作（Email 抓發票附件）只由一個行程執行
+- 每個 worker 都會 import core_app，也都會啟動 APScheduler；但每次觸發時先搶檔案鎖（leader lock），
+  搶到的行程才真的執行，其他行程直接略過 → 不管開幾個 worker，信箱每分鐘只被抓一次
+- leader 行程掛掉，鎖會被 OS 釋放，下一次觸發由其他行程接手
+- 同一個工作不會重疊：APScheduler max_instances=1 + 行程內的執行鎖
+- 失敗後指數退避（含隨機抖動），退避期間的觸發直接略過
+- 最近一次執行的時間 / 耗時 / 結果寫到 run/scheduler_status.json（core_app.RUN_DIR），任何行程都能讀
+"""
+import json
+import os
+import random
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+BACKOFF_BASE = float(os.environ.get("SCHED_BACKOFF_BASE", 60))      # 秒
+BACKOFF_MAX = float(os.environ.get("SCHED_BACKOFF_MAX", 30 * 60))
+
+
+# === 跨行程檔案鎖 ===
+class LeaderLock:
+    """非阻塞的檔案鎖；Windows 用 msvcrt，其他用 fcntl。持有期間檔案保持開啟。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fp = None
+        self._guard = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fp is not None
+
+    def try_acquire(self) -> bool:
+        with self._guard:
+            if self._fp is not None:
+                return True
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fp = open(self.path, "a+")
+            try:
+                if os.name == "nt":
+                    import msvcrt
+                    fp.seek(0)
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fp.close()
+                return False
+            fp.seek(0)
+            fp.truncate()
+            fp.write(f"{os.getpid()}\n")
+            fp.flush()
+            self._fp = fp
+            print(f"[SCHEDULER] pid={os.getpid()} 取得 leader 鎖")
+            return True
+
+    def release(self):
+        with self._guard:
+            if self._fp is None:
+                return
+            try:
+                if os.name == "nt":
+                    import msvcrt
+                    self._fp.seek(0)
+                    msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._fp.close()
+                self._fp = None
+
+
+# === 單一工作的執行控制 ===
+class GuardedJob:
+    """包住排程函式：leader 才執行、不重疊、失敗退避、記錄狀態。"""
+
+    def __init__(self, name: str, fn: Callable[[], Any], lock: LeaderLock, status_path: str):
+        self.name = name
+        self.fn = fn
+        self.lock = lock
+        self.status_path = status_path
+        self._running = threading.Lock()
+        self.failures = 0
+        self.next_allowed = 0.0
+
+    def _write_status(self, st: Dict[str, Any]):
+        try:
+            data = read_status(self.status_path)
+            data[self.name] = st
+            tmp = f"{self.status_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fp:
+                json.dump(data, fp, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.status_path)
+        except Exception as e:
+            print(f"[SCHEDULER] 狀態寫入失敗：{e}")
+
+    def _backoff(self) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (self.failures - 1)))
+        return delay * random.uniform(0.5, 1.5)
+
+    def __call__(self):
+        if not self.lock.try_acquire():
+            return   # 其他行程是 leader
+        now = time.time()
+        if now < self.next_allowed:
+            return   # 退避中
+        if not self._running.acquire(blocking=False):
+            print(f"[SCHEDULER] {self.name} 上一次尚未結束，略過")
+            return
+        started = time.time()
+        outcome, error = "ok", ""
+        try:
+            self.fn()
+            self.failures = 0
+            self.next_allowed = 0.0
+        except Exception as e:
+            outcome, error = "error", f"{e}"
+            self.failures += 1
+            self.next_allowed = time.time() + self._backoff()
+            print(f"[SCHEDULER] {self.name} 失敗（連續 {self.failures} 次）：{e}")
+            traceback.print_exc()
+        finally:
+            self._running.release()
+        duration = time.time() - started
+        self._write_status({
+            "leader_pid": os.getpid(),
+            "last_run": started,
+            "duration_s": round(duration, 3),
+            "outcome": outcome,
+            "error": error,
+            "consecutive_failures": self.failures,
+            "next_allowed": self.next_allowed or None,
+        })
+
+
+def read_status(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+# === 啟動 ===
+_scheduler = None
+
+
+def start_scheduler(jobs: Dict[str, Dict[str, Any]], lock_path: str, status_path: str) -> Optional[Any]:
+    """
+    jobs: {job_id: {"fn": callable, "seconds": 間隔秒數}}
+    每個行程都啟動排程器，但只有持有 leader 鎖的行程會真的執行工作。
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    lock = LeaderLock(lock_path)
+    lock.try_acquire()
+    scheduler = BackgroundScheduler()
+    for job_id, cfg in jobs.items():
+        job = GuardedJob(job_id, cfg["fn"], lock, status_path)
+        scheduler.add_job(job, "interval", seconds=cfg["seconds"], id=job_id, replace_existing=True,
+                          max_instances=1, coalesce=True, misfire_grace_time=cfg["seconds"],
+                          jitter=cfg.get("jitter", 5))
+    scheduler.start()
+    _scheduler = scheduler
+    return scheduler
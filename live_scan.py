@@ -0,0 +1,237 @@
+# live_scan.py
+# -*- coding: utf-8 -*-
+"""
+相機即時掃描模式
+- 前端每次送一張縮小的畫面（JPEG）到 /camera/live/<sid>/frame，收到回應才送下一張
+- 伺服器每個 session 只處理最新的一張：上一張還在處理中 / 序號比已處理的舊 → 直接丟掉
+- 每張先做便宜的檢查：清晰度（Laplacian 變異數）、曝光、發票四邊是否都在畫面內、tr3 小尺寸偵測
+  （量測函式與上傳共用 yocr/quality.py）
+  → 回傳對焦 / 取景提示
+- 第一張「清楚且完整入鏡」的畫面才跑完整 YOLO + OCR，結果留在 session，之後的畫面都直接回結果
+- tr3 小尺寸偵測也走 EXECUTOR 排隊（擁有者是這位使用者，不算配額），門檻固定用 LIVE_TR3_CONF
+- 完整辨識也算使用者的配額（quotas.py）；辨識名額滿或配額用完（OcrBusy）時回 429 {"status": "busy", "retry_after"}，前端等一下再送
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict
+
+from flask import jsonify, request, url_for
+from werkzeug.utils import secure_filename
+
+from core_app import app
+from ingest import read_upload, decode_image, persist_async, wait_persisted
+from ocr_runtime import OcrBusy
+from quotas import identity, request_job
+from yocr.executor import OCR_OWNER
+from yocr.quality import document_quad, exposure, exposure_issue, sharpness
+
+LIVE_SHARPNESS_MIN = float(os.environ.get("LIVE_SHARPNESS_MIN", 80))   # Laplacian 變異數
+LIVE_MIN_AREA = float(os.environ.get("LIVE_MIN_AREA", 0.25))            # 發票佔畫面比例下限
+LIVE_EDGE_MARGIN = float(os.environ.get("LIVE_EDGE_MARGIN", 0.01))      # 四邊離畫面邊緣的最小比例
+LIVE_CHECK_EDGE = int(os.environ.get("LIVE_CHECK_EDGE", 480))           # 便宜檢查用的長邊
+LIVE_TR3_SIZE = int(os.environ.get("LIVE_TR3_SIZE", 320))
+LIVE_TR3_CONF = float(os.environ.get("LIVE_TR3_CONF", 0.25))
+LIVE_USE_TR3 = os.environ.get("LIVE_USE_TR3", "1") == "1"
+LIVE_GOOD_STREAK = int(os.environ.get("LIVE_GOOD_STREAK", 1))           # 連續幾張合格才辨識
+LIVE_SESSION_TTL = 10 * 60
+
+
+# === session 狀態 ===
+_sessions: Dict[str, Dict[str, Any]] = {}
+_sessions_lock = threading.Lock()
+
+
+def _new_state() -> Dict[str, Any]:
+    return {"lock": threading.Lock(), "last_seq": -1, "streak": 0, "result": None,
+            "frames": 0, "dropped": 0, "ts": time.time()}
+
+
+def _session(sid: str) -> Dict[str, Any]:
+    now = time.time()
+    with _sessions_lock:
+        # 順手清掉過期的 session
+        for k in [k for k, v in _sessions.items() if now - v["ts"] > LIVE_SESSION_TTL]:
+            _sessions.pop(k, None)
+        st = _sessions.get(sid)
+        if st is None:
+            st = _sessions[sid] = _new_state()
+        st["ts"] = now
+        return st
+
+
+# === 便宜的畫面檢查 ===
+def _framing(gray) -> Dict[str, Any]:
+    import cv2
+    h, w = gray.shape[:2]
+    quad = document_quad(gray)
+    if quad is None:
+        return {"framed": False, "hint": "請將整張發票放入畫面"}
+    area = cv2.contourArea(quad) / float(w * h)
+    x, y, bw, bh = cv2.boundingRect(quad)
+    mx, my = w * LIVE_EDGE_MARGIN, h * LIVE_EDGE_MARGIN
+    touches = x <= mx or y <= my or x + bw >= w - mx or y + bh >= h - my
+    if area < LIVE_MIN_AREA:
+        return {"framed": False, "hint": "請靠近一點", "area": round(area, 3)}
+    if touches:
+        return {"framed": False, "hint": "發票超出畫面，請退後一點", "area": round(area, 3)}
+    return {"framed": True, "hint": "", "area": round(area, 3),
+            "box": [x / w, y / h, (x + bw) / w, (y + bh) / h]}
+
+
+def _quick_vendor(img_bgr) -> Dict[str, Any]:
+    """tr3 小尺寸跑一次，只看有沒有認出廠商（也順便決定完整辨識要用哪個欄位模型）。"""
+    if not LIVE_USE_TR3:
+        return {"vendor": "auto", "conf": None}
+    from ocr_runtime import EXECUTOR, pipeline
+    p = pipeline()
+
+    def detect():
+        with p.MODEL_POOL.use("tr3") as tr3:
+            return p._map_class_to_key(tr3), tr3(img_bgr[:, :, ::-1], size=LIVE_TR3_SIZE)
+
+    # 與完整辨識共用名額：GPU 滿的時候這裡也排隊（排不到丟 OcrBusy）
+    class_map, res = EXECUTOR.run(detect)
+    det = res.xyxy[0]
+    if det is None or det.shape[0] == 0:
+        return {"vendor": "", "conf": 0.0}
+    conf = float(det[:, 4].max().item())
+    # 共用模型的 conf 是所有設定檔的最低門檻，這裡自己再依 LIVE_TR3_CONF 過濾
+    det = p._above(det, LIVE_TR3_CONF)
+    if det.shape[0] == 0:
+        return {"vendor": "", "conf": conf}
+    return {"vendor": p._choose_invoice_type(det, class_map), "conf": conf}
+
+
+def check_frame(img_bgr) -> Dict[str, Any]:
+    import cv2
+    h, w = img_bgr.shape[:2]
+    scale = LIVE_CHECK_EDGE / float(max(h, w))
+    small = cv2.resize(img_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1 else img_bgr
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    sharp = sharpness(gray)
+    exp = exposure(gray)
+    out: Dict[str, Any] = {"sharpness": round(sharp, 1), "brightness": exp["brightness"]}
+    out.update(_framing(gray))
+    issue = exposure_issue(dict(exp, sharpness=sharp))
+    if issue and issue["level"] == "reject":
+        out.update({"ok": False, "hint": issue["message"]})
+        return out
+    if sharp < LIVE_SHARPNESS_MIN:
+        out.update({"ok": False, "hint": out.get("hint") or "對焦不清，請保持穩定"})
+        return out
+    if not out["framed"]:
+        out["ok"] = False
+        return out
+    q = _quick_vendor(small)
+    out["vendor"], out["vendor_conf"] = q["vendor"], q["conf"]
+    if not q["vendor"]:
+        out.update({"ok": False, "hint": "無法辨認發票版型，請調整角度"})
+        return out
+    out["ok"] = True
+    return out
+
+
+def _busy(e: OcrBusy, check: Dict[str, Any]):
+    resp = jsonify({"status": "busy", "retry_after": e.retry_after, "error": str(e), **check})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
+# === 端點 ===
+@app.route("/camera/live/start", methods=["POST"])
+def live_start():
+    sid = uuid.uuid4().hex
+    _session(sid)
+    return jsonify({"sid": sid})
+
+
+@app.route("/camera/live/<sid>/frame", methods=["POST"])
+def live_frame(sid: str):
+    from yr import VENDOR_NAME_MAP, _ocr_or_duplicate
+
+    st = _session(sid)
+    try:
+        seq = int(request.form.get("seq", -1))
+    except ValueError:
+        seq = -1
+
+    if st["result"] is not None:
+        return jsonify({"status": "done", "row": st["result"]})
+    # 上一張還在處理：丟掉這張（前端收到就立刻送最新的畫面）
+    if not st["lock"].acquire(blocking=False):
+        st["dropped"] += 1
+        return jsonify({"status": "dropped", "reason": "busy"})
+    try:
+        if seq <= st["last_seq"]:
+            st["dropped"] += 1
+            return jsonify({"status": "dropped", "reason": "stale"})
+        st["last_seq"] = seq
+        st["frames"] += 1
+
+        f = request.files.get("frame")
+        data = read_upload(f) if f else b""
+        img = decode_image(data)
+        if img is None:
+            return jsonify({"status": "error", "error": "無法讀取畫面"}), 400
+
+        t0 = time.time()
+        tok = OCR_OWNER.set(identity()[0])
+        try:
+            check = check_frame(img)
+        except OcrBusy as e:
+            st["streak"] = 0
+            return _busy(e, {})
+        finally:
+            OCR_OWNER.reset(tok)
+        check["check_ms"] = int((time.time() - t0) * 1000)
+        st["streak"] = st["streak"] + 1 if check["ok"] else 0
+        if st["streak"] < LIVE_GOOD_STREAK:
+            return jsonify({"status": "scanning", **check})
+
+        # 合格畫面：跑完整辨識，並把這張畫面存成上傳檔
+        fname = secure_filename(f"live_{sid[:8]}_{seq}_{uuid.uuid4().hex[:8]}.jpg")
+        saving = persist_async(data, os.path.join(app.config["UPLOAD_FOLDER"], fname))
+        force = (request.form.get("force") or "") == "1"
+        try:
+            with request_job():
+                info = _ocr_or_duplicate(img, fname, app.config["CROPPED_FOLDER"], force=force,
+                                         inv_type=check.get("vendor") or "auto", source="camera")
+        except OcrBusy as e:
+            wait_persisted([saving])
+            st["streak"] = 0
+            return _busy(e, check)
+        wait_persisted([saving])
+        if info.get("rejected"):
+            # 全尺寸品質快篩沒過（例如解析度不足）：繼續掃描
+            st["streak"] = 0
+            return jsonify({"status": "scanning", **check, "ok": False, "hint": info["quality"]["hint"]})
+        row = {
+            "filename": fname,
+            "imageUrl": url_for("uploads", filename=fname),
+            "num":  info.get("num", ""),
+            "sun":  info.get("sun", ""),
+            "date": info.get("date", ""),
+            "cash": info.get("cash", ""),
+            "bnu":  "",
+            "name": VENDOR_NAME_MAP.get((info.get("type") or "").lower(), ""),
+            "add":  "",
+            "duplicate":    bool(info.get("duplicate")),
+            "duplicate_of": info.get("duplicate_of", ""),
+        }
+        st["result"] = row
+        print(f"[LIVE] {sid[:8]} frames={st['frames']} dropped={st['dropped']} "
+              f"total={int((time.time() - t0) * 1000)}ms")
+        return jsonify({"status": "done", "row": row, **check})
+    finally:
+        st["lock"].release()
+
+
+@app.route("/camera/live/<sid>/reset", methods=["POST"])
+def live_reset(sid: str):
+    """辨識完一張後繼續掃下一張。"""
+    with _sessions_lock:
+        _sessions[sid] = _new_state()
+    return jsonify({"sid": sid})
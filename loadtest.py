@@ -0,0 +1,305 @@
+# loadtest.py
+# -*- coding: utf-8 -*-
+"""
+上傳 / 辨識端點的壓力測試工具（只用標準函式庫）
+
+1) 起一個本機伺服器，資料庫換成 SQLite 替身（local_db.py），不需要 MySQL：
+    python loadtest.py serve --port 5000
+
+2) 拿一個資料夾的發票圖片重播到端點，統計吞吐量、延遲百分位數與錯誤率：
+    python loadtest.py run --dir samples/ --endpoint upload,camera --concurrency 4 --requests 200
+    python loadtest.py run --dir samples/ --endpoint upload --batch 10 --duration 120 --json report.json
+
+端點：
+    upload  → POST /upload（multipart files，可一次多張 --batch），同時輪詢 /progress/<job_id>
+    camera  → POST /upload_camera（單張）
+    email   → 先把檔案複製到伺服器的 uploads/（--email-dir，僅限本機伺服器）再 POST /upload_email_files
+"""
+import argparse
+import itertools
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".pdf"}
+
+
+# === 伺服器（DB 替身）===
+def serve(args):
+    import local_db
+    sys.modules["db"] = local_db   # 所有 `from db import get_db` 都拿到 SQLite 替身
+    os.environ.setdefault("SCHEDULER_ENABLED", "0")   # 壓測時不要去抓信
+    sys.path.insert(0, HERE)
+    from app import app
+    print(f"[LOADTEST] 本機伺服器（SQLite：{local_db.LOCAL_DB_PATH}）http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+# === HTTP 小工具 ===
+def _multipart(fields: Dict[str, str], files: List[tuple]) -> tuple:
+    boundary = uuid.uuid4().hex
+    out = bytearray()
+    for k, v in fields.items():
+        out += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{k}\"\r\n\r\n{v}\r\n").encode("utf-8")
+    for field, path in files:
+        name = os.path.basename(path)
+        ctype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        out += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{name}\"\r\n"
+                f"Content-Type: {ctype}\r\n\r\n").encode("utf-8")
+        with open(path, "rb") as fp:
+            out += fp.read()
+        out += b"\r\n"
+    out += f"--{boundary}--\r\n".encode("utf-8")
+    return bytes(out), f"multipart/form-data; boundary={boundary}"
+
+
+def _request(url: str, data: Optional[bytes], ctype: str, cookie: str, timeout: float) -> tuple:
+    req = urllib.request.Request(url, data=data, method="POST" if data is not None else "GET")
+    if ctype:
+        req.add_header("Content-Type", ctype)
+    if cookie:
+        req.add_header("Cookie", cookie)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+# === 進度追蹤 ===
+class ProgressWatcher(threading.Thread):
+    """上傳進行中輪詢 /progress/<job_id>，記錄第一張完成的時間。"""
+
+    def __init__(self, base: str, job_id: str, cookie: str, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.url = f"{base}/progress/{job_id}"
+        self.cookie = cookie
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.first_done: Optional[float] = None
+        self.polls = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                status, body = _request(self.url, None, "", self.cookie, 5)
+                self.polls += 1
+                if status == 200:
+                    p = json.loads(body or b"{}")
+                    if self.first_done is None and int(p.get("done") or 0) > 0:
+                        self.first_done = time.perf_counter() - self.started
+                    if p.get("finished") and p.get("status") != "missing":
+                        return
+            except Exception:
+                pass
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+# === 單一請求 ===
+def _do_upload(args, files: List[str]) -> Dict[str, Any]:
+    job_id = uuid.uuid4().hex
+    body, ctype = _multipart({"job_id": job_id}, [("files", p) for p in files])
+    watcher = ProgressWatcher(args.base, job_id, args.cookie) if args.follow_progress else None
+    if watcher:
+        watcher.start()
+    status, resp = _request(f"{args.base}/upload", body, ctype, args.cookie, args.timeout)
+    if watcher:
+        watcher.stop()
+    return {"status": status, "body": resp,
+            "first_result_s": watcher.first_done if watcher else None}
+
+
+def _do_camera(args, files: List[str]) -> Dict[str, Any]:
+    body, ctype = _multipart({}, [("file", files[0])])
+    status, resp = _request(f"{args.base}/upload_camera", body, ctype, args.cookie, args.timeout)
+    return {"status": status, "body": resp}
+
+
+def _do_email(args, files: List[str]) -> Dict[str, Any]:
+    names = []
+    stamp = time.strftime("%Y%m%d")
+    for p in files:
+        name = f"合作公司_{stamp}_{uuid.uuid4().hex[:8]}_{os.path.basename(p)}"
+        shutil.copyfile(p, os.path.join(args.email_dir, name))
+        names.append(name)
+    body = json.dumps({"filenames": names, "job_id": uuid.uuid4().hex}).encode("utf-8")
+    status, resp = _request(f"{args.base}/upload_email_files", body, "application/json", args.cookie, args.timeout)
+    return {"status": status, "body": resp}
+
+
+ENDPOINTS = {"upload": _do_upload, "camera": _do_camera, "email": _do_email}
+
+
+# === 統計 ===
+def percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def summarize(records: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"wall_s": round(wall, 2), "endpoints": {}}
+    for ep in sorted({r["endpoint"] for r in records}):
+        rs = [r for r in records if r["endpoint"] == ep]
+        ok = [r for r in rs if r["ok"]]
+        lat = sorted(r["latency"] for r in ok)
+        invoices = sum(r["files"] for r in ok)
+        first = sorted(r["first_result_s"] for r in rs if r.get("first_result_s") is not None)
+        errors: Dict[str, int] = {}
+        for r in rs:
+            if not r["ok"]:
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        out["endpoints"][ep] = {
+            "requests": len(rs),
+            "errors": len(rs) - len(ok),
+            "error_rate": round((len(rs) - len(ok)) / len(rs), 4) if rs else 0.0,
+            "req_per_s": round(len(ok) / wall, 3) if wall else 0.0,
+            "invoices_per_min": round(invoices * 60.0 / wall, 1) if wall else 0.0,
+            "latency_s": {f"p{p}": round(percentile(lat, p), 3) for p in (50, 90, 95, 99)},
+            "latency_max_s": round(lat[-1], 3) if lat else 0.0,
+            "first_result_p50_s": round(percentile(first, 50), 3) if first else None,
+            "error_kinds": errors,
+        }
+    return out
+
+
+def _print_report(rep: Dict[str, Any]):
+    print(f"\n[LOADTEST] 總時間 {rep['wall_s']} s")
+    for ep, s in rep["endpoints"].items():
+        lat = s["latency_s"]
+        print(f"  {ep:7s} 請求 {s['requests']:5d}  錯誤 {s['errors']:4d} ({s['error_rate']:.1%})  "
+              f"{s['req_per_s']:.2f} req/s  {s['invoices_per_min']:.1f} 張/分")
+        print(f"          延遲 p50={lat['p50']}s p90={lat['p90']}s p95={lat['p95']}s p99={lat['p99']}s "
+              f"max={s['latency_max_s']}s" +
+              (f"  第一張結果 p50={s['first_result_p50_s']}s" if s["first_result_p50_s"] is not None else ""))
+        for kind, n in s["error_kinds"].items():
+            print(f"          ✗ {kind}: {n}")
+
+
+# === 壓測主流程 ===
+def run(args):
+    files = sorted(
+        os.path.join(args.dir, f) for f in os.listdir(args.dir)
+        if os.path.splitext(f)[1].lower() in IMAGE_EXTS
+    )
+    if not files:
+        print(f"[LOADTEST] {args.dir} 沒有圖片 / PDF")
+        return 1
+    endpoints = [e.strip() for e in args.endpoint.split(",") if e.strip()]
+    for e in endpoints:
+        if e not in ENDPOINTS:
+            print(f"[LOADTEST] 不支援的端點：{e}")
+            return 1
+    if "email" in endpoints and not os.path.isdir(args.email_dir):
+        print(f"[LOADTEST] --email-dir 不存在：{args.email_dir}")
+        return 1
+
+    file_iter = itertools.cycle(files)
+    ep_iter = itertools.cycle(endpoints)
+    lock = threading.Lock()
+    records: List[Dict[str, Any]] = []
+    issued = [0]
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_task():
+        with lock:
+            if deadline is None and issued[0] >= args.requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            issued[0] += 1
+            ep = next(ep_iter)
+            n = args.batch if ep in ("upload", "email") else 1
+            return ep, [next(file_iter) for _ in range(n)]
+
+    def worker():
+        while True:
+            task = next_task()
+            if task is None:
+                return
+            ep, batch = task
+            t0 = time.perf_counter()
+            rec = {"endpoint": ep, "files": len(batch), "ok": False, "error": "", "first_result_s": None}
+            try:
+                res = ENDPOINTS[ep](args, batch)
+                rec["first_result_s"] = res.get("first_result_s")
+                if 200 <= res["status"] < 300:
+                    rec["ok"] = True
+                else:
+                    rec["error"] = f"HTTP {res['status']}"
+            except Exception as e:
+                rec["error"] = type(e).__name__
+            rec["latency"] = time.perf_counter() - t0
+            with lock:
+                records.append(rec)
+                if args.verbose:
+                    print(f"  {ep} {rec['latency']:.2f}s {'ok' if rec['ok'] else rec['error']}")
+
+    print(f"[LOADTEST] {args.base} 端點={endpoints} 併發={args.concurrency} "
+          + (f"持續 {args.duration}s" if args.duration else f"共 {args.requests} 次") + f"，素材 {len(files)} 個檔")
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    rep = summarize(records, time.perf_counter() - started)
+    rep["config"] = {"base": args.base, "endpoints": endpoints, "concurrency": args.concurrency,
+                     "batch": args.batch, "files": len(files)}
+    _print_report(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(rep, fp, ensure_ascii=False, indent=2)
+        print(f"[LOADTEST] 報告已寫入 {args.json}")
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="上傳 / 辨識端點壓力測試")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="以 SQLite 替身資料庫啟動本機伺服器")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=5000)
+
+    r = sub.add_parser("run", help="對伺服器送出負載")
+    r.add_argument("--base", default="http://127.0.0.1:5000")
+    r.add_argument("--dir", required=True, help="發票圖片 / PDF 資料夾")
+    r.add_argument("--endpoint", default="upload", help="upload,camera,email（逗號分隔，輪流送）")
+    r.add_argument("--concurrency", type=int, default=4)
+    r.add_argument("--requests", type=int, default=100, help="總請求數（沒給 --duration 時）")
+    r.add_argument("--duration", type=float, default=0, help="持續秒數（優先於 --requests）")
+    r.add_argument("--batch", type=int, default=1, help="upload / email 每次幾張")
+    r.add_argument("--follow-progress", action="store_true", default=True)
+    r.add_argument("--no-follow-progress", dest="follow_progress", action="store_false")
+    r.add_argument("--email-dir", default=os.path.join(HERE, "uploads"), help="伺服器的 uploads 資料夾（email 端點用）")
+    r.add_argument("--cookie", default="", help="登入後的 Cookie（例如 session=...）")
+    r.add_argument("--timeout", type=float, default=600)
+    r.add_argument("--json", default="", help="報告另存 JSON")
+    r.add_argument("-v", "--verbose", action="store_true")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "serve":
+        return serve(args)
+    args.base = args.base.rstrip("/")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main() or 0)
@@ -0,0 +1,149 @@
+# local_db.py
+# -*- coding: utf-8 -*-
+"""
+本機測試用的資料庫替身（SQLite）
+- 介面與 db.get_db() 回傳的 mysql-connector 連線相容到本專案用得到的程度：
+  cursor(dictionary=True)、%s 參數、execute / executemany / fetchone / fetchall、
+  lastrowid / rowcount、commit / rollback / close
+- 只給壓力測試 / 離線開發用：python loadtest.py serve 會把它掛成 `db` 模組，
+  不需要 MySQL 也能跑整個 app
+資料檔預設 uploads/local_test.db（環境變數 LOCAL_DB_PATH 可改）
+"""
+import os
+import re
+import sqlite3
+import threading
+
+LOCAL_DB_PATH = os.environ.get(
+    "LOCAL_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "local_test.db"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    us_na TEXT, mail TEXT, password TEXT, role TEXT DEFAULT 'user'
+);
+CREATE TABLE IF NOT EXISTS companies (
+    tax_id TEXT PRIMARY KEY, co_na TEXT
+);
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER, tax_id TEXT, in_nu TEXT, in_date TEXT, in_pri REAL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP, source TEXT, file_path TEXT
+);
+-- 與 migrations/002_invoice_search_index.sql 相同的主鍵 / 索引（INSERT IGNORE 靠主鍵去重）
+CREATE TABLE IF NOT EXISTS invoice_search_grams (
+    gram TEXT NOT NULL, field TEXT NOT NULL, invoice_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, field, invoice_id)
+);
+CREATE INDEX IF NOT EXISTS idx_isg_invoice ON invoice_search_grams (invoice_id);
+CREATE TABLE IF NOT EXISTS invoice_search_keys (
+    invoice_id INTEGER NOT NULL, field TEXT NOT NULL, norm TEXT NOT NULL, raw TEXT NOT NULL,
+    PRIMARY KEY (invoice_id, field)
+);
+CREATE INDEX IF NOT EXISTS idx_isk_field_norm ON invoice_search_keys (field, norm);
+"""
+
+# 舊版建出來的索引表沒有主鍵：內容可由 invoice_search_index.rebuild_index() 重建，直接砍掉重建表
+_KEYED_TABLES = ("invoice_search_grams", "invoice_search_keys")
+
+# MySQL 語法 → SQLite
+_REWRITES = [
+    (re.compile(r"\bNOW\(\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"`"), '"'),
+]
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _translate(sql: str) -> str:
+    sql = sql.replace("%s", "?")
+    for rx, rep in _REWRITES:
+        sql = rx.sub(rep, sql)
+    return sql
+
+
+class _Cursor:
+    def __init__(self, conn: sqlite3.Connection, dictionary: bool):
+        self._cur = conn.cursor()
+        self._dictionary = dictionary
+
+    def _row(self, r):
+        if r is None or not self._dictionary:
+            return r
+        return {d[0]: v for d, v in zip(self._cur.description, r)}
+
+    def execute(self, sql, params=()):
+        self._cur.execute(_translate(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(_translate(sql), [tuple(p) for p in seq])
+        return self
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, size: int = 1):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+class _Connection:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+    def cursor(self, dictionary: bool = False, **_):
+        return _Cursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def is_connected(self) -> bool:
+        return True
+
+
+def _init(path: str):
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path)
+        for t in _KEYED_TABLES:
+            cols = conn.execute(f"PRAGMA table_info({t})").fetchall()
+            if cols and not any(c[5] for c in cols):   # c[5] = 是否為主鍵欄位
+                print(f"[LOCAL DB] {t} 沒有主鍵（舊版建表），重建；請重跑 invoice_search_index.rebuild_index()")
+                conn.execute(f"DROP TABLE {t}")
+        conn.executescript(_SCHEMA)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.commit()
+        conn.close()
+        _initialized = True
+
+
+def get_db():
+    _init(LOCAL_DB_PATH)
+    return _Connection(LOCAL_DB_PATH)
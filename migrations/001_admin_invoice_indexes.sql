@@ -0,0 +1,33 @@
+-- 001_admin_invoice_indexes.sql
+-- 管理員發票總覽（admin_invoice_query.py）用的複合索引
+-- 規則：等值篩選欄位（user_id / tax_id / source）在前，排序用的日期欄位在後；
+--       InnoDB 次索引會自動帶主鍵 id，所以 (…, 日期) 等於 (…, 日期, id)，
+--       keyset 分頁的 ORDER BY 日期 DESC, id DESC 可以直接走索引、不用 filesort。
+-- 執行：mysql -u <user> -p <db> < migrations/001_admin_invoice_indexes.sql
+
+-- 無篩選 / 只有日期區間
+CREATE INDEX idx_inv_in_date          ON invoices (in_date);
+CREATE INDEX idx_inv_created_at       ON invoices (created_at);
+
+-- 使用者
+CREATE INDEX idx_inv_user_in_date     ON invoices (user_id, in_date);
+CREATE INDEX idx_inv_user_created_at  ON invoices (user_id, created_at);
+
+-- 公司（統編）
+CREATE INDEX idx_inv_tax_in_date      ON invoices (tax_id, in_date);
+CREATE INDEX idx_inv_tax_created_at   ON invoices (tax_id, created_at);
+
+-- 來源（manual / auto）
+CREATE INDEX idx_inv_source_in_date    ON invoices (source, in_date);
+CREATE INDEX idx_inv_source_created_at ON invoices (source, created_at);
+
+-- 常見的兩兩組合
+CREATE INDEX idx_inv_user_tax_in_date     ON invoices (user_id, tax_id, in_date);
+CREATE INDEX idx_inv_user_tax_created_at  ON invoices (user_id, tax_id, created_at);
+CREATE INDEX idx_inv_user_src_in_date     ON invoices (user_id, source, in_date);
+CREATE INDEX idx_inv_user_src_created_at  ON invoices (user_id, source, created_at);
+CREATE INDEX idx_inv_tax_src_in_date      ON invoices (tax_id, source, in_date);
+CREATE INDEX idx_inv_tax_src_created_at   ON invoices (tax_id, source, created_at);
+
+-- 公司名稱關鍵字查詢的 JOIN
+CREATE INDEX idx_companies_tax_id     ON companies (tax_id);
@@ -0,0 +1,20 @@
+-- 002_invoice_search_index.sql
+-- 發票號碼 / 賣方統編部分比對索引（invoice_search_index.py）
+-- 建表後執行一次：python invoice_search_index.py --rebuild
+
+CREATE TABLE IF NOT EXISTS invoice_search_grams (
+  gram        CHAR(3)     NOT NULL,
+  field       VARCHAR(8)  NOT NULL,   -- num / snu
+  invoice_id  INT         NOT NULL,
+  PRIMARY KEY (gram, field, invoice_id),
+  KEY idx_isg_invoice (invoice_id)
+) ENGINE=InnoDB DEFAULT CHARSET=ascii;
+
+CREATE TABLE IF NOT EXISTS invoice_search_keys (
+  invoice_id  INT         NOT NULL,
+  field       VARCHAR(8)  NOT NULL,
+  norm        VARCHAR(64) NOT NULL,   -- 容錯折疊後（O→0、B→8…）
+  raw         VARCHAR(64) NOT NULL,   -- 只去掉非英數字
+  PRIMARY KEY (invoice_id, field),
+  KEY idx_isk_field_norm (field, norm)
+) ENGINE=InnoDB DEFAULT CHARSET=ascii;
@@ -0,0 +1,228 @@
+# ocr_autotune.py
+# -*- coding: utf-8 -*-
+"""
+OCR 設定自動調校：每個 (廠商, 欄位) 找「達到正確率門檻中最快」的 tesseract 設定，寫進 yocr/ocr_profile.json
+
+    python ocr_autotune.py --dir synth/ [--threshold 0.95] [--max-per-vendor 60] [--out yocr/ocr_profile.json]
+
+- 標準答案格式與 synth_invoices.py 相同：<dir>/labels.jsonl，每行 {"file", "type", "num", "date", "sun", "cash"}
+  （值是清洗後的格式；真實發票人工標註也用同一格式即可）
+- 第一步：每張圖跑一次 YOLO 取得欄位裁切圖（票種直接用標準答案，避免分類錯誤干擾）；
+  調校結果只有 use_tuned 的流程設定檔（預設 fast）會採用，裁切也用同一個設定檔
+- 第二步：對每個 (廠商, 欄位) 搜尋 oem × psm × lang × 白名單 × 放大倍率，
+  讀出的文字經樣板清洗後與答案比對，記錄正確率與每次平均耗時
+  - 已有達標設定時，錯太多（不可能達標）或累計耗時已超過目前最佳的組合提前放棄，搜尋時間大幅縮短
+- 達標的項目 "meets": true，辨識流程（yocr/ocr_utils.ocr_fields_from_crops）啟動時載入後直接採用；
+  沒有任何組合達標的欄位照舊走錨點流程，檔案裡仍留最佳結果供參考
+- 預設保留檔案中其他廠商的結果（只重調這次有樣本的廠商）；--fresh 整份重寫
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FIELD_KEYS = ("num", "date", "sun", "cash")
+
+# 比樣板白名單更窄的候選（只在樣板白名單之外多試一種）
+_TIGHT_WHITELIST = {
+    "sun": "0123456789",
+    "cash": "0123456789.,",
+    "date": "0123456789/.-",
+}
+
+Sample = Tuple[str, str]          # (裁切圖路徑, 標準答案)
+Reader = Callable[[str, Dict[str, Any]], str]
+
+
+# === 第一步：取得裁切圖 ===
+def _load_labels(d: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(d, "labels.jsonl"), "r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def collect_samples(label_dir: str, max_per_vendor: int, profile: str = "fast") -> Dict[str, Dict[str, List[Sample]]]:
+    """回傳 {vendor: {field: [(crop_path, truth), ...]}}"""
+    from ocr_runtime import detect_and_ocr
+    from synth_invoices import _to_bgr
+    crops_dir = os.path.join(label_dir, "_tune_crops")
+    os.makedirs(crops_dir, exist_ok=True)
+    out: Dict[str, Dict[str, List[Sample]]] = {}
+    seen: Dict[str, int] = {}
+    for lab in _load_labels(label_dir):
+        inv = (lab.get("type") or "").lower()
+        if not inv or seen.get(inv, 0) >= max_per_vendor:
+            continue
+        img = _to_bgr(os.path.join(label_dir, lab["file"]))
+        if img is None:
+            continue
+        try:
+            res = detect_and_ocr(img, crops_dir=crops_dir, inv_type=inv, name=lab["file"], profile=profile)
+        except Exception as e:
+            print(f"[TUNE] {lab['file']} 偵測失敗：{e}")
+            continue
+        seen[inv] = seen.get(inv, 0) + 1
+        for c in res.get("crops") or []:
+            truth = lab.get(c["key"]) or ""
+            if truth:
+                out.setdefault(inv, {}).setdefault(c["key"], []).append((os.path.join(crops_dir, c["path"]), truth))
+    for inv, n in seen.items():
+        print(f"[TUNE] {inv}：{n} 張，欄位樣本 " + ", ".join(f"{k}={len(v)}" for k, v in out.get(inv, {}).items()))
+    return out
+
+
+# === 第二步：搜尋 ===
+def candidates(tpl, key: str, oems: List[int], psms: List[int], scales: List[int]) -> List[Dict[str, Any]]:
+    langs = ["eng"] + ([tpl.lang] if tpl.lang != "eng" else [])
+    wls: List[str] = []
+    for wl in ("", tpl.whitelist(key), _TIGHT_WHITELIST.get(key, "")):
+        if wl not in wls:
+            wls.append(wl)
+    # 便宜的先試（eng、小倍率），早點出現達標組合，後面的剪枝才有效
+    return [{"oem": o, "psm": p, "lang": l, "whitelist": w, "scale": s}
+            for l, s, o, p, w in itertools.product(langs, scales, oems, psms, wls)]
+
+
+def make_reader() -> Reader:
+    """實際讀圖：與辨識流程共用 _preprocess 與 tesseract_config；同一張圖同一倍率只前處理一次。"""
+    import cv2
+    import pytesseract
+    from yocr.ocr_utils import _preprocess
+    from yocr.ocr_profile import tesseract_config
+    cache: Dict[Tuple[str, int], Any] = {}
+
+    def read(path: str, cfg: Dict[str, Any]) -> str:
+        ck = (path, int(cfg.get("scale") or 0))
+        if ck not in cache:
+            img = cv2.imread(path)
+            cache[ck] = _preprocess(img, cfg.get("scale")) if img is not None else None
+        proc = cache[ck]
+        if proc is None:
+            return ""
+        return (pytesseract.image_to_string(proc, lang=cfg["lang"], config=tesseract_config(cfg)) or "").strip()
+    return read
+
+
+def score(cfg: Dict[str, Any], samples: List[Sample], clean: Callable[[str], str], read: Reader,
+          max_miss: Optional[int] = None, max_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """回傳 {"acc", "ms"}；超過 max_miss 或 max_seconds 時提前放棄回 None。"""
+    hit = miss = 0
+    spent = 0.0
+    for path, truth in samples:
+        t0 = time.perf_counter()
+        try:
+            text = read(path, cfg)
+        except Exception:
+            text = ""
+        spent += time.perf_counter() - t0
+        if clean(text) == truth:
+            hit += 1
+        else:
+            miss += 1
+        if (max_miss is not None and miss > max_miss) or (max_seconds is not None and spent > max_seconds):
+            return None
+    n = max(1, hit + miss)
+    return {"acc": round(hit / n, 4), "ms": round(spent * 1000 / n, 1)}
+
+
+def tune_field(tpl, key: str, samples: List[Sample], cands: List[Dict[str, Any]], read: Reader,
+               threshold: float) -> Dict[str, Any]:
+    clean = lambda t: tpl.clean(key, t)
+    n = len(samples)
+    allowed_miss = int(n * (1.0 - threshold) + 1e-9)
+    best_meet: Optional[Dict[str, Any]] = None
+    best_any: Optional[Dict[str, Any]] = None
+    tried = pruned = 0
+    for cfg in cands:
+        tried += 1
+        if best_meet:
+            r = score(cfg, samples, clean, read, max_miss=allowed_miss, max_seconds=best_meet["ms"] * n / 1000.0)
+        else:
+            r = score(cfg, samples, clean, read)
+        if r is None:
+            pruned += 1
+            continue
+        cur = dict(cfg, **r, n=n, meets=r["acc"] >= threshold)
+        if cur["meets"] and (best_meet is None or cur["ms"] < best_meet["ms"]):
+            best_meet = cur
+        if best_any is None or (cur["acc"], -cur["ms"]) > (best_any["acc"], -best_any["ms"]):
+            best_any = cur
+    best = best_meet or best_any or {"n": n, "meets": False}
+    best["tried"], best["pruned"] = tried, pruned
+    return best
+
+
+def _baseline(tpl, key: str, samples: List[Sample], read: Reader) -> Dict[str, Any]:
+    """目前流程逐欄位補讀用的設定（oem 3 / psm 7 / eng / 樣板白名單 / 自動倍率），當作比較基準。"""
+    cfg = {"oem": 3, "psm": 7, "lang": "eng", "whitelist": tpl.whitelist(key), "scale": 0}
+    return score(cfg, samples, lambda t: tpl.clean(key, t), read) or {}
+
+
+def run(args, read: Optional[Reader] = None, samples: Optional[Dict[str, Dict[str, List[Sample]]]] = None) -> int:
+    from yocr.vendor_registry import get_template
+    from yocr.ocr_profile import OCR_PROFILE_PATH
+    out_path = args.out or OCR_PROFILE_PATH
+    samples = samples if samples is not None else collect_samples(args.dir, args.max_per_vendor, args.profile)
+    read = read or make_reader()
+    oems = [int(x) for x in args.oem.split(",")]
+    psms = [int(x) for x in args.psm.split(",")]
+    scales = [int(x) for x in args.scale.split(",")]
+
+    prof: Dict[str, Any] = {}
+    if not args.fresh and os.path.exists(out_path):
+        with open(out_path, "r", encoding="utf-8") as fp:
+            prof = json.load(fp)
+    fields = prof.setdefault("fields", {})
+
+    t_all = time.perf_counter()
+    for inv, by_field in sorted(samples.items()):
+        tpl = get_template(inv)
+        fields[inv] = {}
+        for key in FIELD_KEYS:
+            ss = by_field.get(key) or []
+            if len(ss) < args.min_samples:
+                print(f"[TUNE] {inv}.{key}：樣本 {len(ss)} 筆不足 {args.min_samples}，略過")
+                continue
+            t0 = time.perf_counter()
+            cands = candidates(tpl, key, oems, psms, scales)
+            best = tune_field(tpl, key, ss, cands, read, args.threshold)
+            best["baseline"] = _baseline(tpl, key, ss, read)
+            fields[inv][key] = best
+            mark = "✓" if best.get("meets") else "✗"
+            print(f"[TUNE] {mark} {inv}.{key}: acc={best.get('acc')} {best.get('ms')}ms "
+                  f"(oem={best.get('oem')} psm={best.get('psm')} lang={best.get('lang')} "
+                  f"wl={'有' if best.get('whitelist') else '無'} scale={best.get('scale') or 'auto'}) "
+                  f"基準 acc={best['baseline'].get('acc')} {best['baseline'].get('ms')}ms；"
+                  f"試 {best['tried']} 組、剪枝 {best['pruned']}，{time.perf_counter() - t0:.1f}s")
+
+    prof.update(version=1, threshold=args.threshold, created=time.strftime("%Y-%m-%d %H:%M:%S"),
+                source=os.path.abspath(args.dir) if args.dir else "")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(prof, fp, ensure_ascii=False, indent=2)
+    os.replace(tmp, out_path)
+    print(f"[TUNE] 完成（{time.perf_counter() - t_all:.1f}s）→ {out_path}；重啟辨識行程後生效")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="每個 (廠商, 欄位) 自動調校 tesseract 設定")
+    ap.add_argument("--dir", required=True, help="含 labels.jsonl 的標註資料夾")
+    ap.add_argument("--out", default="", help="輸出路徑（預設 yocr/ocr_profile.json 或 OCR_PROFILE_PATH）")
+    ap.add_argument("--threshold", type=float, default=0.95, help="正確率門檻")
+    ap.add_argument("--max-per-vendor", type=int, default=60)
+    ap.add_argument("--min-samples", type=int, default=10)
+    ap.add_argument("--oem", default="1,3")
+    ap.add_argument("--psm", default="7,6,8,13")
+    ap.add_argument("--scale", default="0,1,2,3", help="前處理放大倍率，0 = 自動（原本的規則）")
+    ap.add_argument("--profile", default="fast",
+                    help="用哪個流程設定檔裁切（裁切圖尺寸要與採用調校結果的設定檔一致）")
+    ap.add_argument("--fresh", action="store_true", help="不保留檔案中其他廠商的結果")
+    return run(ap.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# ocr_runtime.py
+# -*- coding: utf-8 -*-
+"""
+OCR 子系統的延遲載入入口
+- torch / cv2 / pytesseract / pdf2image 只在第一次真的要辨識時才 import
+  （登入、查詢、管理頁、Email 抓信的行程都不必付這個啟動成本）
+- APP_ROLE 決定這個行程做什麼：
+    all    （預設）網頁 + 辨識都在同一個行程
+    web    只服務網頁，永遠不載入 torch；辨識類端點回 503，由反向代理導到 worker
+    worker 辨識專用；啟動時先把 OCR 子系統載好（預熱），第一個請求不用等
+- 啟動時間預算用 bench_startup.py 量
+- 辨識一律經過 yocr/executor.py 的執行器：同時最多 OCR_MAX_CONCURRENCY 件、排隊 OCR_MAX_QUEUE 件，
+  再多丟 OcrBusy（網頁回 429 + Retry-After）
+"""
+import os
+import threading
+from typing import Any, Dict
+
+from yocr.executor import EXECUTOR, OcrBusy  # noqa: F401  (不依賴 torch)
+
+APP_ROLE = os.environ.get("APP_ROLE", "all").strip().lower()
+OCR_ENABLED = APP_ROLE != "web"
+
+
+class OcrDisabled(RuntimeError):
+    """web 角色的行程不提供辨識。"""
+
+
+_lock = threading.Lock()
+_pipeline = None
+_ocr_utils = None
+
+
+def _load():
+    global _pipeline, _ocr_utils
+    if not OCR_ENABLED:
+        raise OcrDisabled("此行程為 APP_ROLE=web，不提供辨識功能")
+    if _pipeline is not None:
+        return
+    with _lock:
+        if _pipeline is not None:
+            return
+        # 只有一條流程（yocr）；快 / 準差異由 yocr/pipeline_profiles.json 的設定檔決定
+        import yocr.yolo as pipeline
+        import yocr.ocr_utils as ocr_utils
+        _ocr_utils = ocr_utils
+        _pipeline = pipeline
+
+
+def pipeline():
+    """回傳 YOLO + OCR 模組（yocr.yolo）。"""
+    _load()
+    return _pipeline
+
+
+def is_loaded() -> bool:
+    return _pipeline is not None
+
+
+def detect_and_ocr(*args, **kwargs) -> Dict[str, Any]:
+    return EXECUTOR.run(pipeline().detect_and_ocr, *args, **kwargs)
+
+
+def detect_and_ocr_batch(images, crops_dir=None, names=None, profile=None, source=""):
+    """一批（整頁切出的多張）算一件工作。"""
+    return EXECUTOR.run(pipeline().detect_and_ocr_batch, images, crops_dir=crops_dir, names=names,
+                        profile=profile, source=source)
+
+
+def profile_names():
+    """可選的流程設定檔（不必載入 torch）。"""
+    from yocr.pipeline_profiles import profile_names as _names
+    return _names()
+
+
+def find_invoice_regions(img_bgr):
+    """整頁多張：切出每張發票的區塊（yocr/sheet.py）。"""
+    _load()
+    from yocr.sheet import find_invoice_regions as _find
+    return _find(img_bgr)
+
+
+def pdf_to_images(*args, **kwargs):
+    _load()
+    return _ocr_utils.pdf_to_images(*args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Any]:
+    return EXECUTOR.stats()
+
+
+def model_pool_stats() -> Dict[str, Any]:
+    if not is_loaded():
+        return {"loaded": False, "role": APP_ROLE}
+    return dict(_pipeline.MODEL_POOL.stats(), loaded=True, role=APP_ROLE)
+
+
+def warm_up():
+    """worker 角色啟動時呼叫：載入模組並把 tr3 放進模型池。"""
+    p = pipeline()
+    try:
+        with p.MODEL_POOL.use("tr3"):
+            pass
+    except Exception as e:
+        print(f"[OCR] 預熱 tr3 失敗：{e}")
@@ -0,0 +1,214 @@
+# profiling.py
+# -*- coding: utf-8 -*-
+"""
+按需的請求效能剖析（sampling profiler）
+- 預設關閉；PROFILING_ENABLED=1 才會掛上
+- 觸發方式（任一）：
+    管理員登入狀態下，請求帶 header `X-Profile: 1` 或網址加 `?_profile=1`
+    PROFILE_SAMPLE_RATE=0.01 → 隨機抽 1% 的請求
+- 剖析期間背景執行緒每 PROFILE_INTERVAL_MS 抓一次該請求執行緒的 call stack（sys._current_frames），
+  對請求本身幾乎沒有額外負擔
+- 每個樣本標上類別：torch / opencv / tesseract / regex / python，方便一眼看出時間花在哪
+- 輸出 profiles/<時間>_<端點>_<毫秒>.folded（flamegraph.pl / speedscope 可直接讀）與同名 .json 摘要
+- 管理頁 /admin/profiles 列出檔案、可下載
+"""
+import json
+import linecache
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from flask import abort, g, render_template, request, send_from_directory, session
+
+from core_app import app
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000.0
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(app.config["ROOT_DIR"], "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))   # 最多保留幾份
+
+TAGS = ("torch", "opencv", "tesseract", "regex", "python")
+_SEP = os.sep
+
+
+# === 樣本分類 ===
+def _tag(frames: List[Any]) -> str:
+    """frames：由外到內。依外部函式庫 / 呼叫點判斷這個樣本在做什麼。"""
+    for f in frames:
+        fn = f.f_code.co_filename
+        if f"{_SEP}torch{_SEP}" in fn or f"{_SEP}yolov5{_SEP}" in fn or f"{_SEP}torchvision{_SEP}" in fn:
+            return "torch"
+        if f"{_SEP}pytesseract{_SEP}" in fn:
+            return "tesseract"   # 多半在等 tesseract 子行程
+    inner = frames[-1]
+    # cv2 / re 是 C 實作，抓不到它們自己的 frame；看最內層 Python 那一行在呼叫什麼
+    line = linecache.getline(inner.f_code.co_filename, inner.f_lineno)
+    if "cv2." in line:
+        return "opencv"
+    for f in frames:
+        fn = f.f_code.co_filename
+        if fn.endswith(f"{_SEP}re{_SEP}__init__.py") or fn.endswith(f"{_SEP}sre_compile.py") \
+                or fn.endswith(f"{_SEP}vendor_registry.py") or f.f_code.co_name.startswith("_clean"):
+            return "regex"
+    if "re." in line or ".search(" in line or ".finditer(" in line:
+        return "regex"
+    return "python"
+
+
+def _frame_label(f) -> str:
+    fn = f.f_code.co_filename
+    root = app.config["ROOT_DIR"]
+    if fn.startswith(root):
+        fn = os.path.relpath(fn, root)
+    else:
+        fn = os.path.basename(fn)
+    return f"{f.f_code.co_name} ({fn}:{f.f_code.co_firstlineno})".replace(";", ":")
+
+
+# === 取樣器 ===
+class Sampler(threading.Thread):
+    def __init__(self, target_ident: int, interval: float = PROFILE_INTERVAL):
+        super().__init__(daemon=True, name="profiler")
+        self.target = target_ident
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.tags: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            tag = _tag(frames)
+            key = ";".join(_frame_label(f) for f in frames) + f";[{tag}]"
+            self.stacks[key] += 1
+            self.tags[tag] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self.join(timeout=1)
+
+
+def _should_profile() -> bool:
+    if request.endpoint in (None, "static", "profiles_list", "profiles_file"):
+        return False
+    if session.get("role") == "admin" and (
+            request.headers.get("X-Profile") == "1" or request.args.get("_profile") == "1"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _prune():
+    try:
+        files = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".folded"))
+    except OSError:
+        return
+    for f in files[:-PROFILE_KEEP] if len(files) > PROFILE_KEEP else []:
+        for ext in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f[:-len(".folded")] + ext))
+            except OSError:
+                pass
+
+
+def _write(sampler: Sampler, wall: float, status: int) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    ms = int(wall * 1000)
+    base = f"{time.strftime('%Y%m%d_%H%M%S')}_{(request.endpoint or 'unknown').replace('.', '_')}_{ms}ms"
+    with open(os.path.join(PROFILE_DIR, base + ".folded"), "w", encoding="utf-8") as fp:
+        for stack, n in sampler.stacks.most_common():
+            fp.write(f"{stack} {n}\n")
+    total = max(1, sampler.samples)
+    summary = {
+        "path": request.full_path.rstrip("?"),
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "status": status,
+        "wall_ms": ms,
+        "samples": sampler.samples,
+        "interval_ms": sampler.interval * 1000,
+        "user_id": session.get("user_id"),
+        "tags_ms": {t: round(sampler.tags[t] * sampler.interval * 1000, 1) for t in TAGS},
+        "tags_pct": {t: round(100.0 * sampler.tags[t] / total, 1) for t in TAGS},
+        "created": time.time(),
+    }
+    with open(os.path.join(PROFILE_DIR, base + ".json"), "w", encoding="utf-8") as fp:
+        json.dump(summary, fp, ensure_ascii=False, indent=2)
+    _prune()
+    print(f"[PROFILE] {summary['path']} {ms}ms → {base}.folded {summary['tags_pct']}")
+    return base
+
+
+# === Flask hooks ===
+if PROFILING_ENABLED:
+    @app.before_request
+    def _profile_start():
+        if not _should_profile():
+            return
+        s = Sampler(threading.get_ident())
+        s.start()
+        g._profiler = (s, time.perf_counter())
+
+    @app.after_request
+    def _profile_stop(resp):
+        prof = g.pop("_profiler", None)
+        if prof is None:
+            return resp
+        sampler, t0 = prof
+        sampler.stop()
+        if resp.is_streamed:
+            return resp   # SSE 等串流回應只量到開始串流為止，不存檔
+        try:
+            name = _write(sampler, time.perf_counter() - t0, resp.status_code)
+            resp.headers["X-Profile-File"] = name
+        except Exception as e:
+            print(f"[PROFILE] 寫入失敗：{e}")
+        return resp
+
+
+# === 管理頁 ===
+def _list_profiles() -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    if not os.path.isdir(PROFILE_DIR):
+        return out
+    for f in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not f.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, f), "r", encoding="utf-8") as fp:
+                info = json.load(fp)
+        except (OSError, ValueError):
+            continue
+        info["name"] = f[:-len(".json")]
+        out.append(info)
+    return out
+
+
+@app.route("/admin/profiles", endpoint="profiles_list")
+def profiles_list():
+    if session.get("role") != "admin":
+        abort(403)
+    return render_template("admin_profiles.html", profiles=_list_profiles(), tags=TAGS,
+                           enabled=PROFILING_ENABLED, sample_rate=PROFILE_SAMPLE_RATE)
+
+
+@app.route("/admin/profiles/<path:filename>", endpoint="profiles_file")
+def profiles_file(filename: str):
+    if session.get("role") != "admin":
+        abort(403)
+    if not filename.endswith((".folded", ".json")):
+        abort(404)
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=filename.endswith(".folded"))
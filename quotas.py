@@ -0,0 +1,166 @@
+# quotas.py
+# -*- coding: utf-8 -*-
+"""
+每位使用者的辨識配額（/upload、/upload_camera、即時掃描）
+- 依角色設定（環境變數覆寫，例如 QUOTA_USER_PER_MIN=30）：
+    per_min     每分鐘可辨識幾張（token bucket，可先用掉一分鐘的量；0 = 不限）
+    concurrent  同時可以有幾個上傳請求在辨識
+- 請求開始時 QUOTAS.job()：同時進行的請求超過 concurrent、或額度已經用完 → QuotaExceeded（429 + Retry-After）
+- 真的要跑 YOLO + OCR 時才扣額度（QUOTAS.take()；重複圖片直接回舊結果不扣）；
+  額度不夠就丟 QuotaExceeded（不扣、不在請求執行緒裡 sleep 等額度）：
+  /upload 一次丟上千張時，超過額度的那幾張標成「稍後重試」（yr._busy_info），其餘照常回傳
+- job() 期間把 yocr.executor.OCR_OWNER 設成這位使用者，執行器據此公平排隊
+- 狀態給 /api/ocr_stats 與管理面板
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from yocr.executor import OCR_OWNER, OcrBusy
+
+_DEFAULT_LIMITS = {
+    "admin": {"per_min": 600, "concurrent": 4},
+    "user": {"per_min": 60, "concurrent": 2},
+}
+QUOTA_IDLE_SECONDS = 3600   # 閒置多久的使用者狀態從記憶體清掉
+
+
+def _limits_for(role: str) -> Dict[str, float]:
+    base = _DEFAULT_LIMITS.get(role) or _DEFAULT_LIMITS["user"]
+    prefix = f"QUOTA_{(role or 'user').upper()}_"
+    return {
+        "per_min": float(os.environ.get(prefix + "PER_MIN", base["per_min"])),
+        "concurrent": int(os.environ.get(prefix + "CONCURRENT", base["concurrent"])),
+    }
+
+
+class QuotaExceeded(OcrBusy):
+    """使用者自己的配額用完（與 OcrBusy 一樣回 429 + Retry-After）。"""
+
+
+class _UserState:
+    __slots__ = ("role", "tokens", "stamp", "active", "files", "rejected", "last_seen")
+
+    def __init__(self, role: str, per_min: float):
+        self.role = role
+        self.tokens = per_min
+        self.stamp = time.monotonic()
+        self.active = 0
+        self.files = 0
+        self.rejected = 0
+        self.last_seen = time.time()
+
+
+# 目前請求的 (使用者, 角色)；job() 外呼叫 take() 不扣額度（例如管理員看明細、背景工作）
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("quota_user", default=None)
+
+
+class QuotaManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[str, _UserState] = {}
+
+    def _state(self, user: str, role: str) -> Tuple[_UserState, Dict[str, float]]:
+        lim = _limits_for(role)
+        st = self._users.get(user)
+        if st is None:
+            st = self._users[user] = _UserState(role, lim["per_min"])
+        st.role = role
+        # 補額度
+        now = time.monotonic()
+        rate = lim["per_min"] / 60.0
+        st.tokens = min(lim["per_min"], st.tokens + (now - st.stamp) * rate)
+        st.stamp = now
+        st.last_seen = time.time()
+        return st, lim
+
+    @contextmanager
+    def job(self, user: str, role: str) -> Iterator[None]:
+        with self._lock:
+            st, lim = self._state(user, role)
+            if st.active >= lim["concurrent"]:
+                st.rejected += 1
+                raise QuotaExceeded(f"同時進行的辨識已達上限（{int(lim['concurrent'])} 個），請等目前的上傳完成", 5)
+            if lim["per_min"] > 0 and st.tokens < 1:
+                st.rejected += 1
+                wait = (1 - st.tokens) / (lim["per_min"] / 60.0)
+                raise QuotaExceeded(f"辨識額度已用完（每分鐘 {int(lim['per_min'])} 張），請稍後再試",
+                                    max(1, int(math.ceil(wait))))
+            st.active += 1
+            self._prune()
+        tok_user = _CURRENT.set((user, role))
+        tok_owner = OCR_OWNER.set(user)
+        try:
+            yield
+        finally:
+            OCR_OWNER.reset(tok_owner)
+            _CURRENT.reset(tok_user)
+            with self._lock:
+                st.active -= 1
+
+    def take(self, n: int = 1):
+        """扣 n 張額度；不夠就丟 QuotaExceeded（retry_after = 補滿 n 張要幾秒），不扣也不等。"""
+        cur = _CURRENT.get()
+        if cur is None or n <= 0:
+            return
+        user, role = cur
+        with self._lock:
+            st, lim = self._state(user, role)
+            if lim["per_min"] > 0:
+                if n > lim["per_min"]:
+                    st.rejected += 1
+                    raise QuotaExceeded(f"一次 {n} 張超過每分鐘額度（{int(lim['per_min'])} 張），請分批上傳", 60)
+                if st.tokens < n:
+                    st.rejected += 1
+                    wait = (n - st.tokens) / (lim["per_min"] / 60.0)
+                    raise QuotaExceeded(f"辨識額度已用完（每分鐘 {int(lim['per_min'])} 張），請稍後再試",
+                                        max(1, int(math.ceil(wait))))
+                st.tokens -= n
+            st.files += n
+
+    def _prune(self):
+        cutoff = time.time() - QUOTA_IDLE_SECONDS
+        for u in [u for u, s in self._users.items() if s.active == 0 and s.last_seen < cutoff]:
+            del self._users[u]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for u, s in self._users.items():
+                lim = _limits_for(s.role)
+                out[u] = {"role": s.role, "active": s.active, "concurrent": lim["concurrent"],
+                          "tokens": round(s.tokens, 1), "per_min": lim["per_min"],
+                          "files": s.files, "rejected": s.rejected,
+                          "last_seen": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s.last_seen))}
+            return {"limits": {r: _limits_for(r) for r in _DEFAULT_LIMITS}, "users": out}
+
+
+QUOTAS = QuotaManager()
+
+
+def identity() -> Tuple[str, str]:
+    """目前請求的 (使用者鍵, 角色)：登入者用 user_id，未登入用來源 IP。"""
+    from flask import request, session
+    uid: Optional[Any] = session.get("user_id")
+    role = session.get("role") or "user"
+    return (f"user:{uid}" if uid is not None else f"ip:{request.remote_addr}"), role
+
+
+def request_job():
+    """路由裡用：with request_job(): ..."""
+    return QUOTAS.job(*identity())
+
+
+def quota_limited(fn):
+    """整個請求算一個辨識工作（超過配額由 OcrBusy 的 errorhandler 回 429）。"""
+    from functools import wraps
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with request_job():
+            return fn(*args, **kwargs)
+    return wrapper
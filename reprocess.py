@@ -0,0 +1,467 @@
+# reprocess.py
+# -*- coding: utf-8 -*-
+"""
+已入庫發票重新辨識（換了 pc.pt / op.pt / mi.pt 或改了清洗規則之後用）
+- 管理員在 /admin/reprocess 依賣方統編 / 日期區間 / 來源 / 使用者篩選（條件同 admin_invoice_query），
+  背景重新跑 YOLO + OCR（來源 reprocess → accurate 設定檔），與資料庫現值比對
+- 差異報告：reprocess/<job_id>.jsonl（REPROCESS_DIR），每張一行 {id, file, changes: {欄位: [舊, 新]}, valid, error}；
+  工作狀態在同名 .json，任何行程都讀得到
+  報告 / 裁切圖有所有人的發票內容，不放在 /uploads 公開的資料夾，只能從管理員的 /admin/reprocess/... 下載
+- 確認後 POST /admin/reprocess/<job_id>/apply 批次寫回（預設只寫通過驗證的新值），並同步更新搜尋索引
+- 不搶線上流量：
+    REPROCESS_WORKERS        同時幾張（預設 1）
+    REPROCESS_RATE_PER_MIN   每分鐘最多幾張（0 = 不限）
+    REPROCESS_RESERVE        辨識執行器保留給網頁的名額（預設 1）；網頁有人排隊或名額不夠時先暫停
+  遇到 OcrBusy 依 Retry-After 等一下再試同一張
+- 一個行程同時只跑一個重新辨識工作
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from flask import abort, jsonify, render_template, request, send_from_directory, session
+
+from core_app import app
+
+REPROCESS_DIR = os.environ.get("REPROCESS_DIR", os.path.join(app.config["ROOT_DIR"], "reprocess"))
+_LEGACY_REPROCESS_DIR = os.path.join(app.config["UPLOAD_FOLDER"], "reprocess")   # 舊版放在公開的 uploads/ 底下
+REPROCESS_WORKERS = int(os.environ.get("REPROCESS_WORKERS", 1))
+REPROCESS_RATE_PER_MIN = float(os.environ.get("REPROCESS_RATE_PER_MIN", 30))
+REPROCESS_RESERVE = int(os.environ.get("REPROCESS_RESERVE", 1))
+REPROCESS_MAX_ROWS = int(os.environ.get("REPROCESS_MAX_ROWS", 5000))
+REPROCESS_BUSY_RETRIES = 5
+APPLY_BATCH = 200
+
+# 辨識欄位 → invoices 欄名
+FIELD_COLUMNS = {"num": "in_nu", "date": "in_date", "sun": "tax_id", "cash": "in_pri"}
+
+os.makedirs(REPROCESS_DIR, exist_ok=True)
+
+
+def _move_legacy_reports():
+    """舊版的報告搬到私有資料夾，不再能從 /uploads/reprocess/... 直接下載。"""
+    if not os.path.isdir(_LEGACY_REPROCESS_DIR) or os.path.abspath(_LEGACY_REPROCESS_DIR) == os.path.abspath(REPROCESS_DIR):
+        return
+    try:
+        for n in os.listdir(_LEGACY_REPROCESS_DIR):
+            src, dst = os.path.join(_LEGACY_REPROCESS_DIR, n), os.path.join(REPROCESS_DIR, n)
+            if os.path.exists(dst):
+                shutil.rmtree(src) if os.path.isdir(src) else os.remove(src)
+            else:
+                shutil.move(src, dst)
+        os.rmdir(_LEGACY_REPROCESS_DIR)
+    except OSError as e:
+        print(f"[REPROCESS] 搬移舊報告失敗：{e}")
+
+
+_move_legacy_reports()
+
+
+# === 篩選與取資料 ===
+def select_invoices(conn, filters: Dict[str, Any], limit: int = REPROCESS_MAX_ROWS,
+                    batch: int = 1000) -> List[Dict[str, Any]]:
+    """依 id 分批取出符合條件、有原圖路徑的發票。"""
+    from admin_invoice_query import BASIS_COLUMNS, INVOICE_TABLE, _where
+    col = BASIS_COLUMNS.get(filters.get("basis") or "in_date", "in_date")
+    conds, params = _where(filters, col)
+    conds.append("i.file_path IS NOT NULL AND i.file_path <> ''")
+    out: List[Dict[str, Any]] = []
+    last_id = 0
+    while len(out) < limit:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(
+                "SELECT i.id, i.tax_id, i.in_nu, i.in_date, i.in_pri, i.source, i.file_path "
+                f"FROM {INVOICE_TABLE} i WHERE {' AND '.join(conds + ['i.id > %s'])} "
+                "ORDER BY i.id LIMIT %s",
+                tuple(params + [last_id, min(batch, limit - len(out))]))
+            rows = cur.fetchall() or []
+        finally:
+            try: cur.close()
+            except Exception: pass
+        if not rows:
+            break
+        out.extend(rows)
+        last_id = rows[-1]["id"]
+    return out
+
+
+def _image_path(fp: str) -> str:
+    """file_path 可能是絕對路徑（批次工具）或只有檔名（網頁上傳，放在 uploads/）。"""
+    if not fp:
+        return ""
+    if os.path.isfile(fp):
+        return fp
+    alt = os.path.join(app.config["UPLOAD_FOLDER"], os.path.basename(fp))
+    return alt if os.path.isfile(alt) else ""
+
+
+# === 比對 ===
+def _norm(key: str, v: Any) -> str:
+    if v is None:
+        return ""
+    if key == "date":
+        if isinstance(v, (date, datetime)):
+            return v.strftime("%Y/%m/%d")
+        return str(v)[:10].replace("-", "/")
+    if key == "cash":
+        try:
+            return f"{float(str(v).replace(',', '')):.2f}"
+        except ValueError:
+            return str(v)
+    return str(v).strip().upper()
+
+
+def diff_fields(row: Dict[str, Any], info: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """{欄位: [舊值, 新值]}；新結果讀不到（空白）的欄位不算修正。"""
+    changes: Dict[str, List[Any]] = {}
+    for key, col in FIELD_COLUMNS.items():
+        new = info.get(key) or ""
+        if new and _norm(key, row.get(col)) != _norm(key, new):
+            old = row.get(col)
+            changes[key] = [old.isoformat() if isinstance(old, (date, datetime)) else old, new]
+    return changes
+
+
+# === 單張 ===
+def _reocr(row: Dict[str, Any], crops_dir: str, inv_type: str, profile: Optional[str]) -> Dict[str, Any]:
+    from ocr_runtime import detect_and_ocr, pdf_to_images
+    from ingest import pil_to_bgr
+    path = _image_path(row.get("file_path") or "")
+    if not path:
+        raise RuntimeError("找不到原圖")
+    kw = dict(crops_dir=crops_dir, inv_type=inv_type, profile=profile, source="reprocess")
+    if not path.lower().endswith(".pdf"):
+        return detect_and_ocr(path, **kw)
+    # PDF：資料庫沒記頁碼，單頁直接用；多頁找號碼對得上的那一頁
+    pages = pdf_to_images(path) or []
+    if not pages:
+        raise RuntimeError("PDF 轉圖失敗")
+    base = os.path.splitext(os.path.basename(path))[0]
+    want = _norm("num", row.get("in_nu"))
+    for n, page in enumerate(pages, 1):
+        info = detect_and_ocr(pil_to_bgr(page), name=f"{base}_p{n}.jpg", **kw)
+        if len(pages) == 1 or (want and _norm("num", info.get("num")) == want):
+            return info
+    raise RuntimeError(f"PDF 共 {len(pages)} 頁，找不到號碼 {row.get('in_nu')} 所在頁")
+
+
+# === 節流 ===
+class _Pacer:
+    """每分鐘最多 rate 張（各 worker 共用）。"""
+
+    def __init__(self, per_min: float):
+        self.interval = 60.0 / per_min if per_min > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, stop: threading.Event):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            stop.wait(at - now)
+
+
+def _yield_to_live(stop: threading.Event):
+    """網頁有人在排隊、或可用名額只剩保留給網頁的份時先暫停。"""
+    from ocr_runtime import executor_stats
+    while not stop.is_set():
+        st = executor_stats()
+        if st["waiting"] == 0 and st["running"] < max(1, st["max_running"] - REPROCESS_RESERVE):
+            return
+        stop.wait(0.5)
+
+
+# === 工作 ===
+def _state_path(job_id: str) -> str:
+    return os.path.join(REPROCESS_DIR, f"{job_id}.json")
+
+
+def _report_path(job_id: str) -> str:
+    return os.path.join(REPROCESS_DIR, f"{job_id}.jsonl")
+
+
+def read_state(job_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_state_path(job_id), "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(st: Dict[str, Any]):
+    tmp = f"{_state_path(st['id'])}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(st, fp, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, _state_path(st["id"]))
+
+
+def read_report(job_id: str) -> List[Dict[str, Any]]:
+    try:
+        with open(_report_path(job_id), "r", encoding="utf-8") as fp:
+            return [json.loads(line) for line in fp if line.strip()]
+    except OSError:
+        return []
+
+
+def list_jobs(limit: int = 30) -> List[Dict[str, Any]]:
+    names = sorted((n for n in os.listdir(REPROCESS_DIR) if n.endswith(".json")), reverse=True)
+    jobs = [read_state(n[:-5]) for n in names[:limit]]
+    return [j for j in jobs if j]
+
+
+class ReprocessJob:
+    def __init__(self, filters: Dict[str, Any], inv_type: str = "auto", profile: Optional[str] = None,
+                 limit: int = REPROCESS_MAX_ROWS, user_id: Any = None):
+        job_id = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.crops_dir = os.path.join(REPROCESS_DIR, job_id + "_crops")
+        self.state: Dict[str, Any] = {
+            "id": job_id, "status": "queued", "filters": filters, "inv_type": inv_type,
+            "profile": profile or "", "started_by": user_id, "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "finished": "", "total": 0, "done": 0, "changed": 0, "errors": 0, "applied": 0, "error": "",
+        }
+
+    def _one(self, row: Dict[str, Any], pacer: _Pacer, out) -> None:
+        from ocr_runtime import OcrBusy
+        from yocr.executor import OCR_OWNER
+        OCR_OWNER.set("reprocess")   # 執行器公平排隊時自成一份，不和網頁使用者搶
+        rec: Dict[str, Any] = {"id": row["id"], "file": row.get("file_path") or "", "changes": {}}
+        for attempt in range(REPROCESS_BUSY_RETRIES + 1):
+            if self.stop.is_set():
+                return
+            _yield_to_live(self.stop)
+            pacer.wait(self.stop)
+            try:
+                info = _reocr(row, self.crops_dir, self.state["inv_type"], self.state["profile"] or None)
+                rec.update(type=info.get("type", ""), changes=diff_fields(row, info),
+                           valid=info.get("valid") or {}, new={k: info.get(k, "") for k in FIELD_COLUMNS})
+                break
+            except OcrBusy as e:
+                if attempt == REPROCESS_BUSY_RETRIES:
+                    rec["error"] = str(e)
+                else:
+                    self.stop.wait(e.retry_after)
+            except Exception as e:
+                rec["error"] = str(e)
+                break
+        with self._lock:
+            out.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            st = self.state
+            st["done"] += 1
+            st["changed"] += 1 if rec["changes"] else 0
+            st["errors"] += 1 if rec.get("error") else 0
+            if st["done"] % 20 == 0:
+                _write_state(st)
+
+    def run(self):
+        from db import get_db
+        st = self.state
+        st["status"] = "running"
+        try:
+            conn = get_db()
+            if conn is None:
+                raise RuntimeError("資料庫連線失敗")
+            try:
+                rows = select_invoices(conn, st["filters"], self.limit)
+            finally:
+                conn.close()
+            st["total"] = len(rows)
+            _write_state(st)
+            print(f"[REPROCESS] {st['id']} 開始：{len(rows)} 張，workers={REPROCESS_WORKERS}")
+            os.makedirs(self.crops_dir, exist_ok=True)
+            pacer = _Pacer(REPROCESS_RATE_PER_MIN)
+            with open(_report_path(st["id"]), "a", encoding="utf-8") as out, \
+                    ThreadPoolExecutor(max_workers=max(1, REPROCESS_WORKERS)) as pool:
+                for f in [pool.submit(self._one, r, pacer, out) for r in rows]:
+                    f.result()
+            st["status"] = "cancelled" if self.stop.is_set() else "done"
+        except Exception as e:
+            st["status"], st["error"] = "error", str(e)
+            print(f"[REPROCESS] {st['id']} 失敗：{e}")
+        finally:
+            st["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            _write_state(st)
+            print(f"[REPROCESS] {st['id']} {st['status']}：{st['done']}/{st['total']}，"
+                  f"有差異 {st['changed']}，錯誤 {st['errors']}")
+
+
+_jobs: Dict[str, ReprocessJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(job: ReprocessJob) -> Optional[str]:
+    """已有工作在跑就回 None。"""
+    with _jobs_lock:
+        if any(j.state["status"] in ("queued", "running") for j in _jobs.values()):
+            return None
+        _jobs[job.state["id"]] = job
+    _write_state(job.state)
+    threading.Thread(target=job.run, name=f"reprocess-{job.state['id']}", daemon=True).start()
+    return job.state["id"]
+
+
+def job_state(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    return dict(job.state) if job else read_state(job_id)
+
+
+# === 寫回 ===
+def _cash(v: Any) -> Optional[float]:
+    try:
+        return float(str(v).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_changes(conn, records: List[Dict[str, Any]], ids: Optional[set] = None,
+                  fields: Optional[List[str]] = None, include_invalid: bool = False) -> int:
+    """把差異報告裡的新值寫回 invoices；每 APPLY_BATCH 張一個交易。回傳更新張數。"""
+    from invoice_search_index import index_invoice
+    fields = [k for k in (fields or FIELD_COLUMNS) if k in FIELD_COLUMNS]
+    todo = []
+    for rec in records:
+        if rec.get("error") or rec.get("applied") or (ids is not None and rec["id"] not in ids):
+            continue
+        vals = {k: new for k, (_old, new) in rec["changes"].items()
+                if k in fields and (include_invalid or (rec.get("valid") or {}).get(k))}
+        if vals:
+            todo.append((rec, vals))
+    n = 0
+    for i in range(0, len(todo), APPLY_BATCH):
+        cur = conn.cursor(dictionary=True)
+        try:
+            for rec, vals in todo[i:i + APPLY_BATCH]:
+                sets = ", ".join(f"{FIELD_COLUMNS[k]}=%s" for k in vals)
+                params = [_cash(v) if k == "cash" else v for k, v in vals.items()]
+                cur.execute(f"UPDATE invoices SET {sets} WHERE id=%s", tuple(params + [rec["id"]]))
+                if "num" in vals or "sun" in vals:
+                    cur.execute("SELECT in_nu, tax_id FROM invoices WHERE id=%s", (rec["id"],))
+                    cur_row = cur.fetchone() or {}
+                    index_invoice(conn, rec["id"], cur_row.get("in_nu") or "", cur_row.get("tax_id") or "",
+                                  commit=False)
+                rec["applied"] = sorted(vals)
+                n += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for rec, _vals in todo[i:i + APPLY_BATCH]:
+                rec.pop("applied", None)
+            raise
+        finally:
+            try: cur.close()
+            except Exception: pass
+    return n
+
+
+def _rewrite_report(job_id: str, records: List[Dict[str, Any]]):
+    tmp = _report_path(job_id) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        for rec in records:
+            fp.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp, _report_path(job_id))
+
+
+# === 管理頁 ===
+def _admin_only():
+    if session.get("role") != "admin":
+        abort(403)
+
+
+@app.route("/admin/reprocess", methods=["GET"], endpoint="reprocess_page")
+def reprocess_page():
+    _admin_only()
+    from ocr_runtime import profile_names
+    from yocr.vendor_registry import vendor_names
+    return render_template("admin_reprocess.html", jobs=list_jobs(), profiles=profile_names(),
+                           vendors=vendor_names(), max_rows=REPROCESS_MAX_ROWS)
+
+
+@app.route("/admin/reprocess", methods=["POST"], endpoint="reprocess_start")
+def reprocess_start():
+    _admin_only()
+    from admin_invoice_query import filters_from_args
+    filters = filters_from_args(request.form)
+    filters.pop("q", None)
+    try:
+        limit = min(REPROCESS_MAX_ROWS, int(request.form.get("limit") or REPROCESS_MAX_ROWS))
+    except ValueError:
+        limit = REPROCESS_MAX_ROWS
+    job = ReprocessJob(filters, inv_type=(request.form.get("inv_type") or "auto").lower(),
+                       profile=request.form.get("profile") or None, limit=limit,
+                       user_id=session.get("user_id"))
+    job_id = start_job(job)
+    if not job_id:
+        return jsonify({"error": "已有重新辨識工作在執行"}), 409
+    return jsonify({"job_id": job_id})
+
+
+@app.route("/admin/reprocess/<job_id>", methods=["GET"], endpoint="reprocess_status")
+def reprocess_status(job_id: str):
+    _admin_only()
+    st = job_state(job_id)
+    if not st:
+        abort(404)
+    rows = read_report(job_id)
+    if request.args.get("all") != "1":
+        rows = [r for r in rows if r["changes"] or r.get("error")]
+    return jsonify({"job": st, "rows": rows})
+
+
+@app.route("/admin/reprocess/<job_id>/report", methods=["GET"], endpoint="reprocess_report")
+def reprocess_report(job_id: str):
+    _admin_only()
+    if not job_state(job_id):
+        abort(404)
+    return send_from_directory(REPROCESS_DIR, f"{job_id}.jsonl", as_attachment=True)
+
+
+@app.route("/admin/reprocess/<job_id>/cancel", methods=["POST"], endpoint="reprocess_cancel")
+def reprocess_cancel(job_id: str):
+    _admin_only()
+    job = _jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "工作不在這個行程執行或已結束"}), 404
+    job.stop.set()
+    return jsonify({"ok": True})
+
+
+@app.route("/admin/reprocess/<job_id>/apply", methods=["POST"], endpoint="reprocess_apply")
+def reprocess_apply(job_id: str):
+    """body: {ids: [...]（不給 = 全部有差異的）, fields: [...], include_invalid: false}"""
+    _admin_only()
+    st = job_state(job_id)
+    if not st:
+        abort(404)
+    if st["status"] in ("queued", "running"):
+        return jsonify({"error": "工作尚未結束"}), 409
+    body = request.get_json(silent=True) or {}
+    ids = {int(i) for i in body["ids"]} if body.get("ids") is not None else None
+    records = read_report(job_id)
+    from db import get_db
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "資料庫連線失敗"}), 500
+    try:
+        n = apply_changes(conn, records, ids, body.get("fields"), bool(body.get("include_invalid")))
+    finally:
+        conn.close()
+        _rewrite_report(job_id, records)
+    st["applied"] = sum(1 for r in records if r.get("applied"))
+    job = _jobs.get(job_id)
+    if job:
+        job.state["applied"] = st["applied"]
+    _write_state(st)
+    print(f"[REPROCESS] {job_id} 寫回 {n} 張")
+    return jsonify({"ok": True, "updated": n, "applied": st["applied"]})
@@ -0,0 +1,358 @@
+# synth_invoices.py
+# -*- coding: utf-8 -*-
+"""
+合成發票產生器（含標準答案），給效能 / 準確率量測用，不需要真實客戶發票
+
+產生：
+    python synth_invoices.py generate --out synth/ --count 300 --types pc,op,mi --pdf-ratio 0.2 --seed 1
+    → synth/pc_00001.jpg ...、synth/labels.jsonl
+      每行：{"file", "type", "num", "date", "sun", "cash", "printed": {...}, "augment": {...}}
+      num/date/sun/cash 是清洗後「應該」得到的值（_clean_num / _clean_date / _clean_sun / _clean_cash 的輸出格式），
+      printed 是實際印在圖上的字
+量測：
+    python synth_invoices.py eval --dir synth/ [--limit 100] [--profile fast,accurate] [--json report.json]
+    → 每個流程設定檔各逐張跑一次 detect_and_ocr，統計各欄位正確率、票種正確率與每張耗時
+
+版面只模仿三家的欄位錨點（PChome 中文、OpenAI / Microsoft 英文），不是真實發票樣式
+中文字型：環境變數 SYNTH_FONT_CJK，否則依序找 Windows / Linux / macOS 常見字型
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from yocr.validators import ubn_ok as ubn_check_ok   # 統一編號檢查碼與辨識流程共用
+
+PAGE_W, PAGE_H = 1240, 1754   # A4 @150dpi
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+_CJK_FONTS = [
+    "C:/Windows/Fonts/msjh.ttc", "C:/Windows/Fonts/mingliu.ttc", "C:/Windows/Fonts/kaiu.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+_LATIN_FONTS = [
+    "C:/Windows/Fonts/arial.ttf", "C:/Windows/Fonts/calibri.ttf", "C:/Windows/Fonts/consola.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+]
+
+# 難度 → 干擾強度範圍
+DIFFICULTY = {
+    "easy":   {"rotate": 0.5, "blur": 0.3, "noise": 4,  "jpeg": (85, 95)},
+    "medium": {"rotate": 2.0, "blur": 0.9, "noise": 10, "jpeg": (60, 90)},
+    "hard":   {"rotate": 5.0, "blur": 1.6, "noise": 20, "jpeg": (35, 75)},
+}
+
+
+# === 欄位值（符合清洗函式的輸出格式） ===
+def make_ubn(rng: random.Random) -> str:
+    while True:
+        head = "".join(rng.choice("0123456789") for _ in range(7))
+        for last in "0123456789":
+            if ubn_check_ok(head + last):
+                return head + last
+
+
+def _letters(rng: random.Random, n: int, alphabet: str = "ABCDEFGHJKLMNPQRSTUVWXY") -> str:
+    return "".join(rng.choice(alphabet) for _ in range(n))
+
+
+def _digits(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice("0123456789") for _ in range(n))
+
+
+def _op_num(rng: random.Random) -> str:
+    # 英數-英數；避免「字母夾 0/9」（_clean_num_op 會把它當成 O）
+    while True:
+        head = "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ12345678") for _ in range(8))
+        if not any(a.isalpha() and b in "09" and c.isalpha() for a, b, c in zip(head, head[1:], head[2:])):
+            return f"{head}-{_digits(rng, 4)}"
+
+
+def make_fields(inv: str, rng: random.Random) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """回傳 (標準答案, 印在圖上的字)。"""
+    d = date(2023, 1, 1) + timedelta(days=rng.randint(0, 1000))
+    ymd = f"{d.year:04d}/{d.month:02d}/{d.day:02d}"
+    amount = rng.choice([rng.randint(50, 999), rng.randint(1000, 99999), rng.randint(100000, 999999)])
+    ubn = make_ubn(rng)
+    grouped = f"{amount:,}"
+    if inv == "pc":
+        num = _letters(rng, 2) + _digits(rng, 8)
+        printed = {"num": num, "date": ymd.replace("/", rng.choice("/-.")), "sun": ubn, "cash": grouped}
+    elif inv == "op":
+        num = _op_num(rng)
+        printed = {"num": num, "date": f"{MONTHS[d.month - 1]} {d.day}, {d.year}", "sun": ubn,
+                   "cash": f"NT${grouped}.00"}
+    else:  # mi
+        num = _letters(rng, 1, "EGHK") + _digits(rng, 9)
+        printed = {"num": num, "date": f"{d.year:04d}-{d.month:02d}-{d.day:02d}", "sun": ubn,
+                   "cash": grouped}
+    truth = {"num": num, "date": ymd, "sun": ubn, "cash": str(amount)}
+    return truth, printed
+
+
+# === 繪圖 ===
+_font_cache: Dict[Tuple[str, int], Any] = {}
+
+
+def _find_font(cjk: bool) -> str:
+    env = os.environ.get("SYNTH_FONT_CJK" if cjk else "SYNTH_FONT", "")
+    if env and os.path.isfile(env):
+        return env
+    for p in (_CJK_FONTS if cjk else _LATIN_FONTS + _CJK_FONTS):
+        if os.path.isfile(p):
+            return p
+    return ""
+
+
+def _font(size: int, cjk: bool = False):
+    from PIL import ImageFont
+    path = _find_font(cjk)
+    key = (path, size)
+    if key not in _font_cache:
+        if path:
+            _font_cache[key] = ImageFont.truetype(path, size)
+        else:
+            if cjk:
+                print("[SYNTH] 找不到中文字型，PC 版面的中文會是方框；請設定 SYNTH_FONT_CJK")
+            _font_cache[key] = ImageFont.load_default()
+    return _font_cache[key]
+
+
+_FILLER_EN = ["Description", "Qty", "Unit price", "Subtotal", "Tax", "Plan", "Usage", "Support", "Credits"]
+_FILLER_ZH = ["品名", "數量", "單價", "小計", "運費", "折扣", "備註", "訂單編號", "出貨日期"]
+
+
+def render(inv: str, printed: Dict[str, str], rng: random.Random):
+    """畫一張乾淨的發票（PIL RGB）。各家只保留欄位錨點文字與大致版面。"""
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (PAGE_W, PAGE_H), "white")
+    dr = ImageDraw.Draw(img)
+    cjk = inv == "pc"
+    big, mid, small = _font(44, cjk), _font(30, cjk), _font(24, cjk)
+    jx, jy = rng.randint(-30, 30), rng.randint(-30, 30)
+    x0, y = 90 + jx, 90 + jy
+
+    if inv == "pc":
+        dr.rectangle([x0, y, x0 + 220, y + 70], fill=(220, 30, 40))
+        dr.text((x0 + 20, y + 12), "PChome", font=big, fill="white")
+        dr.text((x0 + 300, y + 12), "電子發票證明聯", font=big, fill="black")
+        y += 140
+        rows = [("發票號碼：", printed["num"]), ("開立日期：", printed["date"]),
+                ("統一編號：", printed["sun"])]
+        for label, val in rows:
+            dr.text((x0, y), label + val, font=mid, fill="black")
+            y += 60
+        filler = _FILLER_ZH
+    elif inv == "op":
+        dr.text((x0, y), "OpenAI", font=big, fill="black")
+        dr.text((PAGE_W - 380 + jx, y), "Invoice", font=big, fill="black")
+        y += 120
+        rows = [("Invoice number ", printed["num"]), ("Date due ", printed["date"]),
+                ("VAT ", printed["sun"])]
+        for label, val in rows:
+            dr.text((x0, y), label, font=mid, fill=(90, 90, 90))
+            dr.text((x0 + 320, y), val, font=mid, fill="black")
+            y += 55
+        filler = _FILLER_EN
+    else:
+        dr.rectangle([x0, y, x0 + 36, y + 36], fill=(242, 80, 34))
+        dr.rectangle([x0 + 40, y, x0 + 76, y + 36], fill=(127, 186, 0))
+        dr.rectangle([x0, y + 40, x0 + 36, y + 76], fill=(0, 164, 239))
+        dr.rectangle([x0 + 40, y + 40, x0 + 76, y + 76], fill=(255, 185, 0))
+        dr.text((x0 + 100, y + 14), "Microsoft", font=big, fill=(80, 80, 80))
+        y += 140
+        rows = [("Invoice Number: ", printed["num"]), ("Invoice Date in UTC: ", printed["date"]),
+                ("VAT Reg. No.: ", printed["sun"])]
+        for label, val in rows:
+            dr.text((x0, y), label + val, font=mid, fill="black")
+            y += 55
+        filler = _FILLER_EN
+
+    # 明細表（干擾文字）
+    y += 60
+    dr.line([x0, y, PAGE_W - 90, y], fill="black", width=2)
+    y += 20
+    for _ in range(rng.randint(3, 12)):
+        cols = rng.sample(filler, 3)
+        dr.text((x0, y), cols[0], font=small, fill="black")
+        dr.text((x0 + 420, y), cols[1], font=small, fill="black")
+        dr.text((PAGE_W - 300, y), f"{rng.randint(1, 9999):,}", font=small, fill="black")
+        y += 40
+    dr.line([x0, y + 10, PAGE_W - 90, y + 10], fill="black", width=2)
+    y += 50
+
+    total_label = {"pc": "總計：", "op": "Amount due ", "mi": "Total Amount TWD "}[inv]
+    dr.text((PAGE_W - 620, y), total_label + printed["cash"], font=mid, fill="black")
+    return img
+
+
+def augment(img, rng: random.Random, level: str) -> Tuple[Any, Dict[str, Any]]:
+    """旋轉、模糊、雜訊；JPEG 壓縮在存檔時做。"""
+    from PIL import Image, ImageFilter
+    cfg = DIFFICULTY[level]
+    angle = round(rng.uniform(-cfg["rotate"], cfg["rotate"]), 2)
+    blur = round(rng.uniform(0, cfg["blur"]), 2)
+    noise = rng.randint(0, cfg["noise"])
+    if angle:
+        img = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor="white")
+    if blur > 0.05:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        import numpy as np
+        arr = np.asarray(img).astype(np.int16)
+        arr = arr + np.random.default_rng(rng.randint(0, 2 ** 31)).integers(-noise, noise + 1, arr.shape)
+        img = Image.fromarray(arr.clip(0, 255).astype("uint8"))
+    return img, {"rotate": angle, "blur": blur, "noise": noise}
+
+
+# === 產生 ===
+def generate(args) -> int:
+    rng = random.Random(args.seed)
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    os.makedirs(args.out, exist_ok=True)
+    labels_path = os.path.join(args.out, "labels.jsonl")
+    t0 = time.time()
+    with open(labels_path, "w", encoding="utf-8") as lf:
+        for i in range(args.count):
+            inv = types[i % len(types)]
+            truth, printed = make_fields(inv, rng)
+            img = render(inv, printed, rng)
+            img, aug = augment(img, rng, args.difficulty)
+            lo, hi = DIFFICULTY[args.difficulty]["jpeg"]
+            quality = rng.randint(lo, hi)
+            aug["jpeg_quality"] = quality
+            as_pdf = rng.random() < args.pdf_ratio
+            name = f"{inv}_{i + 1:05d}.{'pdf' if as_pdf else 'jpg'}"
+            path = os.path.join(args.out, name)
+            if as_pdf:
+                # 先過一次 JPEG 讓 PDF 內的圖也帶壓縮痕跡
+                from PIL import Image
+                buf = io.BytesIO()
+                img.save(buf, "JPEG", quality=quality)
+                Image.open(io.BytesIO(buf.getvalue())).save(path, "PDF", resolution=150)
+            else:
+                img.save(path, "JPEG", quality=quality)
+            lf.write(json.dumps({"file": name, "type": inv, **truth, "printed": printed,
+                                 "augment": aug}, ensure_ascii=False) + "\n")
+    print(f"[SYNTH] {args.count} 張 → {args.out}（{time.time() - t0:.1f}s），標準答案 {labels_path}")
+    return 0
+
+
+# === 量測 ===
+def _load_labels(d: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(d, "labels.jsonl"), "r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def _to_bgr(path: str):
+    from ingest import decode_image, pil_to_bgr
+    if path.lower().endswith(".pdf"):
+        from ocr_runtime import pdf_to_images
+        pages = pdf_to_images(path, dpi=150)
+        return pil_to_bgr(pages[0]) if pages else None
+    with open(path, "rb") as fp:
+        return decode_image(fp.read())
+
+
+def evaluate_profile(args, profile: str) -> Dict[str, Any]:
+    from ocr_runtime import detect_and_ocr
+    labels = _load_labels(args.dir)[: args.limit or None]
+    crops_dir = os.path.join(args.dir, "_crops")
+    keys = ("num", "date", "sun", "cash")
+    hit = {k: 0 for k in keys}
+    type_hit, all_hit, errors = 0, 0, 0
+    times: List[float] = []
+    per_type: Dict[str, Dict[str, int]] = {}
+    for i, lab in enumerate(labels, 1):
+        img = _to_bgr(os.path.join(args.dir, lab["file"]))
+        if img is None:
+            errors += 1
+            continue
+        t0 = time.perf_counter()
+        try:
+            out = detect_and_ocr(img, crops_dir=crops_dir, name=lab["file"], profile=profile)
+        except Exception as e:
+            print(f"[EVAL] {lab['file']} 失敗：{e}")
+            errors += 1
+            continue
+        times.append(time.perf_counter() - t0)
+        ok = {k: (out.get(k) or "") == lab[k] for k in keys}
+        for k in keys:
+            hit[k] += ok[k]
+        type_hit += out.get("type") == lab["type"]
+        all_hit += all(ok.values())
+        pt = per_type.setdefault(lab["type"], {"n": 0, "all": 0})
+        pt["n"] += 1
+        pt["all"] += all(ok.values())
+        if args.verbose and not all(ok.values()):
+            print(f"  ✗ {lab['file']}", {k: (out.get(k), lab[k]) for k in keys if not ok[k]})
+        if i % 20 == 0:
+            print(f"[EVAL {profile}] {i}/{len(labels)}")
+
+    n = len(times)
+    times.sort()
+    return {
+        "profile": profile,
+        "evaluated": n, "errors": errors,
+        "field_accuracy": {k: round(hit[k] / n, 4) if n else 0.0 for k in keys},
+        "type_accuracy": round(type_hit / n, 4) if n else 0.0,
+        "all_fields_accuracy": round(all_hit / n, 4) if n else 0.0,
+        "per_type_all_fields": {t: round(v["all"] / v["n"], 4) for t, v in per_type.items() if v["n"]},
+        "seconds_per_invoice": {
+            "mean": round(sum(times) / n, 3) if n else 0.0,
+            "p50": round(times[n // 2], 3) if n else 0.0,
+            "p95": round(times[min(n - 1, int(n * 0.95))], 3) if n else 0.0,
+        },
+    }
+
+
+def evaluate(args) -> int:
+    """每個流程設定檔（--profile fast,accurate）各跑一次同一批合成發票。"""
+    from ocr_runtime import profile_names
+    profiles = [p.strip() for p in (args.profile or ",".join(profile_names())).split(",") if p.strip()]
+    reps = [evaluate_profile(args, p) for p in profiles]
+    rep: Any = reps[0] if len(reps) == 1 else {"profiles": reps}
+    print(json.dumps(rep, ensure_ascii=False, indent=2))
+    if len(reps) > 1:
+        for r in reps:
+            print(f"[EVAL] {r['profile']:>10}: 全欄位 {r['all_fields_accuracy']:.2%}，"
+                  f"平均 {r['seconds_per_invoice']['mean']}s / 張")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(rep, fp, ensure_ascii=False, indent=2)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="合成發票產生 / 量測")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("generate")
+    g.add_argument("--out", default="synth")
+    g.add_argument("--count", type=int, default=300)
+    g.add_argument("--types", default="pc,op,mi")
+    g.add_argument("--pdf-ratio", type=float, default=0.1)
+    g.add_argument("--difficulty", choices=tuple(DIFFICULTY), default="medium")
+    g.add_argument("--seed", type=int, default=0)
+    e = sub.add_parser("eval")
+    e.add_argument("--dir", default="synth")
+    e.add_argument("--limit", type=int, default=0)
+    e.add_argument("--profile", default="", help="流程設定檔，逗號分隔（預設全部：fast,accurate）")
+    e.add_argument("--json", default="")
+    e.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+    return generate(args) if args.cmd == "generate" else evaluate(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
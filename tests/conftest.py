@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+共用 fixture：需要 Flask 的測試用 core_app 的 app（不啟動排程）
+config.py 是每台電腦各自的設定檔，不在版控裡；沒有就給空路徑
+路由要在第一個請求之前註冊完，所以 app.py 會載入的路由模組這裡先全部 import
+"""
+import os
+import sys
+import types
+
+import pytest
+
+ROUTE_MODULES = ("yr", "thumbs", "live_scan", "profiling", "reprocess", "export_routes")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def app():
+    pytest.importorskip("flask")
+    os.environ.setdefault("SCHEDULER_ENABLED", "0")
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        cfg = types.ModuleType("config")
+        cfg.TESSERACT_CMD = ""
+        cfg.POPPLER_PATH = ""
+        sys.modules["config"] = cfg
+    from core_app import app as flask_app
+    for m in ROUTE_MODULES:
+        __import__(m)
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
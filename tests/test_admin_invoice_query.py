@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+admin_invoice_query.py：keyset 游標編解碼、_seek 的 NULL 處理、整批翻頁每筆剛好出現一次
+（資料庫用 local_db.py 的 SQLite 替身；SQLite 與 MySQL 一樣把 NULL 排在 DESC 最後）
+"""
+from datetime import date, datetime
+
+import pytest
+
+import admin_invoice_query as aiq
+import local_db
+
+
+@pytest.fixture()
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_db, "LOCAL_DB_PATH", str(tmp_path / "t.db"))
+    monkeypatch.setattr(local_db, "_initialized", False)
+    c = local_db.get_db()
+    yield c
+    c.close()
+
+
+def test_cursor_roundtrip():
+    assert aiq.decode_cursor(aiq.encode_cursor("2026-01-02", 42)) == ("2026-01-02", 42)
+    assert aiq.decode_cursor(aiq.encode_cursor(None, 7)) == (None, 7)
+    # 日期 / 時間以 isoformat 存進游標
+    assert aiq.decode_cursor(aiq.encode_cursor(date(2026, 1, 2), 3)) == ("2026-01-02", 3)
+    assert aiq.decode_cursor(aiq.encode_cursor(datetime(2026, 1, 2, 3, 4, 5), 3)) == ("2026-01-02T03:04:05", 3)
+
+
+@pytest.mark.parametrize("token", ["", "!!!", "bm90IGpzb24", aiq.encode_cursor("x", 1)[:-3] + "zzz"])
+def test_bad_cursor_is_first_page(token):
+    assert aiq.decode_cursor(token) is None
+
+
+def test_seek_conditions():
+    assert aiq._seek("in_date", None) == ("", [])
+    sql, params = aiq._seek("in_date", (None, 9))
+    assert sql == "(i.in_date IS NULL AND i.id < %s)"
+    assert params == [9]
+    # 非 NULL 的游標之後還要接上整段 NULL
+    sql, params = aiq._seek("in_date", ("2026-01-02", 9))
+    assert "i.in_date IS NULL" in sql
+    assert params == ["2026-01-02", "2026-01-02", 9]
+
+
+def test_paging_visits_every_row_once(conn):
+    cur = conn.cursor()
+    dates = ["2026-01-03", None, "2026-01-01", "2026-01-03", None, "2026-01-02", "2026-01-01", None, "2026-01-03"]
+    for d in dates:
+        cur.execute("INSERT INTO invoices (user_id, tax_id, in_nu, in_date, in_pri, source, file_path) "
+                    "VALUES (1, '12345678', 'AB00000000', %s, 100, 'manual', '')", (d,))
+    conn.commit()
+    filters = {"basis": "in_date", "q_index": False}
+
+    seen, after, pages = [], "", 0
+    while True:
+        page = aiq.fetch_admin_invoices_page(conn, filters, after=after, limit=2)
+        assert page["has_prev"] == bool(after)
+        seen.extend((r["in_date"], r["id"]) for r in page["rows"])
+        pages += 1
+        after = page["next_cursor"]
+        if not after:
+            break
+
+    assert pages == 5
+    assert sorted(i for _, i in seen) == list(range(1, len(dates) + 1))
+    # DESC：有日期的依 (日期, id) 由大到小，NULL 全部在最後
+    dated = [(d, i) for d, i in seen if d is not None]
+    assert dated == sorted(dated, reverse=True)
+    assert [d for d, _ in seen[len(dated):]] == [None] * dates.count(None)
+    assert [i for d, i in seen if d is None] == [8, 5, 2]
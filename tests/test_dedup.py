@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+dedup.py：同版面、欄位不同的發票不能被當成重複；同一張重拍 / 重存要認得出來
+（用 synth_invoices.py 畫發票；欄位框依版面算，代替 YOLO 偵測）
+"""
+import random
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import dedup  # noqa: E402
+import synth_invoices as synth  # noqa: E402
+
+LAYOUT_SEED = 7
+
+
+def _boxes(inv: str, img):
+    """
+    與 synth_invoices.render 相同的版面 → 號碼 / 日期 / 統編那三列，框住實際有字的範圍（像 YOLO 的欄位框），
+    回傳比例座標；字型不同（環境沒有 TrueType 字型時是內建小字）也框得準
+    """
+    rng = random.Random(LAYOUT_SEED)
+    x0, y0 = 90 + rng.randint(-30, 30), 90 + rng.randint(-30, 30)
+    if inv == "op":
+        bands = [(x0 + 310, y0 + 115 + 55 * i, y0 + 165 + 55 * i) for i in range(3)]
+    elif inv == "mi":
+        bands = [(x0 - 10, y0 + 135 + 55 * i, y0 + 185 + 55 * i) for i in range(3)]
+    else:
+        bands = [(x0 - 10, y0 + 135 + 60 * i, y0 + 190 + 60 * i) for i in range(3)]
+    H, W = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    out = []
+    for key, (bx, by1, by2) in zip(("num", "date", "sun"), bands):
+        ys, xs = np.nonzero(gray[by1:by2, bx:W - 90] < 128)
+        x1, x2, y1, y2 = bx + xs.min() - 6, bx + xs.max() + 6, by1 + ys.min() - 4, by1 + ys.max() + 4
+        out.append({"key": key, "box": [x1 / W, y1 / H, x2 / W, y2 / H]})
+    return out
+
+
+def _invoice(inv: str, field_seed: int):
+    printed, _ = synth.make_fields(inv, random.Random(field_seed))
+    img = synth.render(inv, printed, random.Random(LAYOUT_SEED))
+    return cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2BGR), printed
+
+
+def _remember(index, img, inv, owner="user:1", name="a.jpg"):
+    ph, dh = dedup.hashes(img)
+    index.add(name, ph, dh, {"type": inv, "crops": _boxes(inv, img)}, owner=owner, img_bgr=img)
+
+
+@pytest.mark.parametrize("inv", ["pc", "op", "mi"])
+def test_same_layout_different_fields_not_duplicate(inv):
+    index = dedup.RecentHashIndex(path="")
+    first, p1 = _invoice(inv, 1)
+    _remember(index, first, inv)
+    for seed in range(2, 8):
+        other, p2 = _invoice(inv, seed)
+        assert p1["num"] != p2["num"]
+        ph, dh = dedup.hashes(other)
+        # 整張縮圖幾乎一樣（雜湊只能給候選）…
+        assert dedup.hamming(ph, dedup.phash(first)) <= dedup.PHASH_MAX_DIST
+        # …欄位比對要把它擋下來
+        assert index.find(ph, dh, owner="user:1", img_bgr=other) is None
+
+
+@pytest.mark.parametrize("inv", ["pc", "op", "mi"])
+def test_reshot_same_invoice_is_duplicate(inv):
+    index = dedup.RecentHashIndex(path="")
+    img, _ = _invoice(inv, 1)
+    _remember(index, img, inv)
+    # JPEG 重存 + 平移幾個像素（相機重拍的小晃動）
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 75])
+    again = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    again = cv2.warpAffine(again, np.float32([[1, 0, 4], [0, 1, -3]]), (again.shape[1], again.shape[0]),
+                           borderValue=(255, 255, 255))
+    hit = index.find(*dedup.hashes(again), owner="user:1", img_bgr=again)
+    assert hit is not None and hit["filename"] == "a.jpg"
+
+
+def test_other_owner_never_matches():
+    index = dedup.RecentHashIndex(path="")
+    img, _ = _invoice("op", 1)
+    _remember(index, img, "op", owner="user:1")
+    assert index.find(*dedup.hashes(img), owner="user:2", img_bgr=img) is None
+    assert index.find(*dedup.hashes(img), owner="user:1", img_bgr=img) is not None
+
+
+def test_same_filename_kept_separately():
+    index = dedup.RecentHashIndex(path="")
+    a, _ = _invoice("op", 1)
+    b, _ = _invoice("mi", 2)
+    _remember(index, a, "op", name="snapshot.jpg")
+    _remember(index, b, "mi", name="snapshot.jpg")
+    assert index.stats()["size"] == 2
+
+
+def test_no_field_boxes_is_never_duplicate():
+    index = dedup.RecentHashIndex(path="")
+    img, _ = _invoice("op", 1)
+    ph, dh = dedup.hashes(img)
+    index.add("a.jpg", ph, dh, {"type": "op", "crops": []}, owner="user:1", img_bgr=img)
+    assert index.find(ph, dh, owner="user:1", img_bgr=img) is None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+yocr/executor.py：名額 + 排隊有上限，滿了丟 OcrBusy；網頁端轉成 429 + Retry-After
+"""
+import threading
+
+import pytest
+
+from yocr.executor import InferenceExecutor, OcrBusy
+
+
+def _hold(ex: InferenceExecutor, n: int):
+    """開 n 條執行緒佔住執行器，回傳 (放行事件, 執行緒)。"""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def work():
+        started.release()
+        release.wait(5)
+
+    threads = [threading.Thread(target=ex.run, args=(work,)) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return release, threads, started
+
+
+def test_runs_inline_and_counts():
+    ex = InferenceExecutor(max_running=1, max_queue=0)
+    assert ex.run(lambda a, b=0: a + b, 1, b=2) == 3
+    assert ex.completed == 1 and ex.running == 0
+
+
+def test_full_queue_rejects():
+    ex = InferenceExecutor(max_running=1, max_queue=1, queue_timeout=5)
+    release, threads, started = _hold(ex, 1)
+    started.acquire(timeout=5)
+    waiter = threading.Thread(target=ex.run, args=(lambda: None,))
+    waiter.start()
+    for _ in range(500):
+        if ex.waiting == 1:
+            break
+        threading.Event().wait(0.01)
+    assert ex.running == 1 and ex.waiting == 1
+
+    with pytest.raises(OcrBusy) as e:
+        ex.run(lambda: None)
+    assert e.value.retry_after >= 1
+    assert ex.rejected == 1
+
+    release.set()
+    for t in threads + [waiter]:
+        t.join(5)
+    assert ex.completed == 2 and ex.running == 0 and ex.waiting == 0
+
+
+def test_queue_timeout():
+    ex = InferenceExecutor(max_running=1, max_queue=4, queue_timeout=0.05)
+    release, threads, started = _hold(ex, 1)
+    started.acquire(timeout=5)
+    with pytest.raises(OcrBusy):
+        ex.run(lambda: None)
+    assert ex.timeouts == 1 and ex.rejected == 0 and ex.waiting == 0
+    release.set()
+    for t in threads:
+        t.join(5)
+
+
+def test_busy_response_is_429(app):
+    import yr
+    with app.test_request_context():
+        resp, status = yr._ocr_busy(OcrBusy("辨識忙碌中，請稍後再試", 7))
+    assert status == 429
+    assert resp.headers["Retry-After"] == "7"
+    assert resp.get_json()["retry_after"] == 7
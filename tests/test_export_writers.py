@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+export_routes.py：CSV / XLSX 串流寫出（一段一段送出，接起來是完整的檔案）
+"""
+import csv
+import io
+import zipfile
+
+import pytest
+
+ROWS = [
+    [1, "AB12345678", "2026-01-02", 1234.5, "04595257", "公司<&>", "alice", "manual", "2026-01-02 03:04:05", "a.jpg"],
+    [2, "=HYPERLINK(\"x\")", "", 0, "", "", "bob", "auto", "", "b\x01.jpg"],
+]
+
+
+@pytest.fixture()
+def export(app, monkeypatch):
+    import export_routes
+    monkeypatch.setattr(export_routes, "EXPORT_CHUNK_ROWS", 1)
+    return export_routes
+
+
+def test_csv_chunks(export):
+    chunks = list(export.csv_chunks(iter(ROWS)))
+    assert len(chunks) == len(ROWS) + 1       # 每 EXPORT_CHUNK_ROWS 筆送出一段，最後再一段
+    text = b"".join(chunks).decode("utf-8")
+    assert text.startswith("\ufeff")
+    table = list(csv.reader(io.StringIO(text[1:])))
+    assert table[0] == [h for _, h, _ in export.COLUMNS]
+    assert table[1][1] == "AB12345678" and table[1][5] == "公司<&>"
+    assert table[2][1] == "'=HYPERLINK(\"x\")"    # 公式開頭加上 '
+    assert len(table) == len(ROWS) + 1
+
+
+def test_xlsx_chunks_is_valid_zip(export):
+    chunks = list(export.xlsx_chunks(iter(ROWS)))
+    assert len(chunks) > 2
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert zf.testzip() is None
+    assert set(zf.namelist()) >= {"[Content_Types].xml", "xl/workbook.xml", "xl/worksheets/sheet1.xml"}
+    sheet = zf.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert sheet.count("<row>") == len(ROWS) + 1
+    assert "<c><v>1234.5</v></c>" in sheet
+    assert "公司&lt;&amp;&gt;" in sheet
+    assert "\x01" not in sheet
+
+
+def test_xlsx_opens_in_openpyxl(export):
+    openpyxl = pytest.importorskip("openpyxl")
+    data = b"".join(export.WRITERS["xlsx"](iter(ROWS)))
+    ws = openpyxl.load_workbook(io.BytesIO(data), read_only=True).active
+    values = [list(r) for r in ws.iter_rows(values_only=True)]
+    assert values[0] == [h for _, h, _ in export.COLUMNS]
+    assert values[1][0] == 1 and values[1][3] == 1234.5
+    assert values[2][1] == "=HYPERLINK(\"x\")"
+    assert values[2][9] == "b.jpg"
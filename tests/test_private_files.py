@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+不該公開的檔案（跨使用者的索引、報表、排程狀態）不能放在 /uploads 提供的資料夾底下
+"""
+import os
+
+
+def _outside(path: str, folder: str) -> bool:
+    path, folder = os.path.abspath(path), os.path.abspath(folder)
+    return os.path.commonpath([path, folder]) != folder
+
+
+def test_dedup_index_not_served(app, client):
+    import dedup
+    assert _outside(dedup.INDEX_FILE, app.config["UPLOAD_FOLDER"])
+    created = not os.path.isfile(dedup.INDEX_FILE)
+    if created:
+        open(dedup.INDEX_FILE, "a").close()
+    try:
+        assert client.get("/uploads/phash_index.jsonl").status_code == 404
+        assert client.get("/uploads/../data/phash_index.jsonl").status_code == 404
+    finally:
+        if created:
+            os.remove(dedup.INDEX_FILE)
+
+
+def test_dedup_legacy_index_moved(tmp_path, monkeypatch):
+    import dedup
+    legacy = tmp_path / "uploads" / "phash_index.jsonl"
+    legacy.parent.mkdir()
+    legacy.write_text("", encoding="utf-8")
+    monkeypatch.setattr(dedup, "_LEGACY_INDEX_FILE", str(legacy))
+    dedup.RecentHashIndex(path=str(tmp_path / "data" / "phash_index.jsonl"))
+    assert not legacy.exists()
+    assert (tmp_path / "data" / "phash_index.jsonl").exists()
+
+
+def test_reprocess_report_only_via_admin_route(app, client):
+    import reprocess
+    assert _outside(reprocess.REPROCESS_DIR, app.config["UPLOAD_FOLDER"])
+    job_id = "19990101_000000_abcdef"
+    report = os.path.join(reprocess.REPROCESS_DIR, f"{job_id}.jsonl")
+    state = os.path.join(reprocess.REPROCESS_DIR, f"{job_id}.json")
+    with open(report, "w", encoding="utf-8") as fp:
+        fp.write('{"id": 1}\n')
+    with open(state, "w", encoding="utf-8") as fp:
+        fp.write('{"id": "%s", "status": "done"}' % job_id)
+    try:
+        assert client.get(f"/uploads/reprocess/{job_id}.jsonl").status_code == 404
+        assert client.get(f"/admin/reprocess/{job_id}/report").status_code == 403
+        with client.session_transaction() as s:
+            s["role"] = "admin"
+        assert client.get(f"/admin/reprocess/{job_id}/report").status_code == 200
+    finally:
+        os.remove(report)
+        os.remove(state)
+
+
+def test_export_file_only_via_download_route(app, client):
+    import json
+    import export_routes as ex
+    assert _outside(ex.EXPORT_DIR, app.config["UPLOAD_FOLDER"])
+    job_id = "0" * 31 + "1"
+    meta = {"id": job_id, "status": "done", "file": f"{job_id}.csv", "name": "invoices.csv", "owner": 7}
+    data = os.path.join(ex.EXPORT_DIR, meta["file"])
+    with open(data, "w", encoding="utf-8") as fp:
+        fp.write("ID\n1\n")
+    with open(ex._meta_path(job_id), "w", encoding="utf-8") as fp:
+        json.dump(meta, fp)
+    try:
+        assert client.get(f"/uploads/exports/{job_id}.csv").status_code == 404
+        assert client.get(f"/uploads/exports/{job_id}.json").status_code == 404
+        with client.session_transaction() as s:
+            s["user_id"] = 8
+        assert client.get(f"/export/jobs/{job_id}/download").status_code == 404
+        with client.session_transaction() as s:
+            s["user_id"] = 7
+        assert client.get(f"/export/jobs/{job_id}/download").status_code == 200
+    finally:
+        os.remove(data)
+        os.remove(ex._meta_path(job_id))
+
+
+def test_scheduler_status_not_served(app, client):
+    import core_app
+    assert _outside(core_app.SCHEDULER_STATUS, app.config["UPLOAD_FOLDER"])
+    assert _outside(core_app.SCHEDULER_LOCK, app.config["UPLOAD_FOLDER"])
+    assert client.get("/uploads/scheduler_status.json").status_code == 404
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+yocr/quality.py：清楚的發票 ok、偏暗只提示（warn）、模糊 / 太暗 / 解析度太低擋下（reject）
+（用 synth_invoices.py 畫發票）
+"""
+import random
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import synth_invoices as synth  # noqa: E402
+from yocr import quality  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def clean():
+    printed, _ = synth.make_fields("pc", random.Random(1))
+    img = synth.render("pc", printed, random.Random(7))
+    return cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def _codes(report):
+    return {i["code"] for i in report["issues"]}
+
+
+def test_clean_invoice_ok(clean):
+    r = quality.assess(clean)
+    assert r["level"] == "ok", r["issues"]
+    assert r["metrics"]["sharpness"] >= quality.QUALITY_SHARPNESS_WARN
+
+
+def test_blur_rejected(clean):
+    r = quality.assess(cv2.GaussianBlur(clean, (0, 0), 12))
+    assert r["level"] == "reject"
+    assert "blur" in _codes(r)
+
+
+def test_dark_rejected(clean):
+    r = quality.assess((clean * 0.1).astype(np.uint8))
+    assert r["level"] == "reject"
+    assert "dark" in _codes(r) or "blank" in _codes(r)
+
+
+def test_dim_warns(clean):
+    # 整體亮度壓在 DARK_MEAN ~ DIM_MEAN 之間
+    dim = (clean.astype(np.float32) * 0.22 + 10).astype(np.uint8)
+    r = quality.assess(dim, rendered=True)
+    mean = r["metrics"]["brightness"]
+    assert quality.QUALITY_DARK_MEAN <= mean < quality.QUALITY_DIM_MEAN, mean
+    assert r["level"] == "warn", r["issues"]
+    assert "dim" in _codes(r)
+
+
+def test_tiny_rejected(clean):
+    r = quality.assess(cv2.resize(clean, (200, 280), interpolation=cv2.INTER_AREA), rendered=True)
+    assert r["level"] == "reject"
+    assert "lowres" in _codes(r)
+
+
+def test_check_respects_force(clean, monkeypatch):
+    blurred = cv2.GaussianBlur(clean, (0, 0), 12)
+    monkeypatch.setattr(quality, "QUALITY_GATE", "reject")
+    monkeypatch.setattr(quality, "STATS", quality.QualityStats())
+    assert quality.check(blurred)["rejected"]
+    assert not quality.check(blurred, force=True)["rejected"]
+    s = quality.STATS.stats()
+    assert s["rejected"] == 1 and s["bypassed"] == 1
+    monkeypatch.setattr(quality, "QUALITY_GATE", "warn")
+    assert not quality.check(blurred)["rejected"]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+quotas.py：token bucket 額度、同時請求上限；額度不夠直接丟 QuotaExceeded，不在請求裡等待
+"""
+import time
+
+import pytest
+
+import quotas
+from quotas import QuotaExceeded, QuotaManager
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setenv("QUOTA_USER_PER_MIN", "60")
+    monkeypatch.setenv("QUOTA_USER_CONCURRENT", "1")
+
+
+def test_take_outside_job_is_free():
+    QuotaManager().take(1000)
+
+
+def test_bucket_rejects_instead_of_sleeping():
+    qm = QuotaManager()
+    with qm.job("u1", "user"):
+        qm.take(60)
+        t0 = time.monotonic()
+        with pytest.raises(QuotaExceeded) as e:
+            qm.take(5)
+        assert time.monotonic() - t0 < 0.5
+        assert 1 <= e.value.retry_after <= 6
+    st = qm.stats()["users"]["u1"]
+    assert st["files"] == 60 and st["rejected"] == 1
+
+
+def test_batch_larger_than_bucket():
+    qm = QuotaManager()
+    with qm.job("u1", "user"):
+        with pytest.raises(QuotaExceeded):
+            qm.take(61)
+        qm.take(1)   # 沒扣到的額度還在
+
+
+def test_bucket_refills(monkeypatch):
+    qm = QuotaManager()
+    now = [1000.0]
+    monkeypatch.setattr(quotas.time, "monotonic", lambda: now[0])
+    with qm.job("u1", "user"):
+        qm.take(60)
+        now[0] += 10       # 每秒補 1 張
+        qm.take(10)
+        with pytest.raises(QuotaExceeded):
+            qm.take(1)
+
+
+def test_job_rejects_when_empty_and_concurrent():
+    qm = QuotaManager()
+    with qm.job("u1", "user"):
+        with pytest.raises(QuotaExceeded):
+            with qm.job("u1", "user"):
+                pass
+        qm.take(60)
+    with pytest.raises(QuotaExceeded):
+        with qm.job("u1", "user"):
+            pass
+    with qm.job("u2", "user"):      # 別人不受影響
+        pass
+
+
+def test_unlimited_role(monkeypatch):
+    monkeypatch.setenv("QUOTA_ADMIN_PER_MIN", "0")
+    qm = QuotaManager()
+    with qm.job("a", "admin"):
+        qm.take(10000)
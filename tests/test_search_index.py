@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+invoice_search_index.py：OCR 容錯正規化、match_sql 子查詢、索引與 invoices 的同步
+（資料庫用 local_db.py 的 SQLite 替身）
+"""
+import pytest
+
+import invoice_search_index as isi
+import local_db
+
+
+@pytest.fixture()
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_db, "LOCAL_DB_PATH", str(tmp_path / "t.db"))
+    monkeypatch.setattr(local_db, "_initialized", False)
+    c = local_db.get_db()
+    yield c
+    c.close()
+
+
+def _insert(conn, num: str, tax_id: str = "12345678") -> int:
+    cur = conn.cursor()
+    cur.execute("INSERT INTO invoices (user_id, tax_id, in_nu, in_date, in_pri, source, file_path) "
+                "VALUES (1, %s, %s, '2026-01-01', 100, 'upload', '')", (tax_id, num))
+    iid = cur.lastrowid
+    conn.commit()
+    return iid
+
+
+def _match(conn, q: str, **kw):
+    sql, params = isi.match_sql(q, **kw)
+    if not sql:
+        return set()
+    cur = conn.cursor()
+    cur.execute(sql, tuple(params))
+    return {r[0] for r in cur.fetchall()}
+
+
+def test_normalize_folds_confusable_letters():
+    assert isi.normalize("ab-12 34") == "A81234"
+    assert isi.normalize("OBIZG") == "08126"
+    assert isi.normalize("OBIZG", fuzzy=False) == "OBIZG"
+    assert isi.grams("A812") == {"A81", "812"}
+    assert isi.grams("A8") == set()
+
+
+def test_match_sql_fuzzy_and_exact(conn):
+    a = _insert(conn, "AB12345678")
+    b = _insert(conn, "A812345678")
+    c = _insert(conn, "CD99999999", tax_id="87654321")
+    for iid in (a, b, c):
+        isi.sync_invoice(conn, iid)
+
+    assert _match(conn, "AB1234") == {a, b}              # B/8 折成同一個字
+    assert _match(conn, "ab1234", fuzzy=False) == {a}    # 不容錯只比英數字
+    assert _match(conn, "2345") == {a, b}                # 中段比對（3-gram）
+    assert _match(conn, "CD", prefix=True) == {c}        # 不足 3 碼走前綴
+    assert _match(conn, "8765", fields=("snu",)) == {c}
+    assert _match(conn, "8765", fields=("num",)) == set()
+    assert isi.match_sql("--") == ("", [])
+    assert isi.search_invoice_ids(conn, "AB12345678") == [a, b]   # 完全相同排前面
+
+
+def test_match_sql_is_not_capped(conn):
+    ids = [_insert(conn, f"XY{10000000 + i}") for i in range(1200)]
+    for iid in ids:
+        isi.sync_invoice(conn, iid, commit=False)
+    conn.commit()
+    assert _match(conn, "XY1000") == set(ids)
+
+
+def test_reconcile_picks_up_unhooked_writes(conn):
+    kept = _insert(conn, "AB11112222")
+    edited = _insert(conn, "AB33334444")
+    deleted = _insert(conn, "AB55556666")
+    isi.rebuild_index(conn)
+    new = _insert(conn, "AB77778888")                # 沒呼叫 sync_invoice 的新增
+    cur = conn.cursor()
+    cur.execute("UPDATE invoices SET in_nu=%s WHERE id=%s", ("ZZ00001111", edited))
+    cur.execute("DELETE FROM invoices WHERE id=%s", (deleted,))
+    conn.commit()
+
+    stats = isi.reconcile_index(conn)
+    assert stats == {"checked": 3, "reindexed": 2, "removed": 1}
+    assert _match(conn, "AB") == {kept, new}
+    assert _match(conn, "ZZ0000") == {edited}
+    assert isi.reconcile_index(conn)["reindexed"] == 0
+
+
+def test_sync_invoice_removes_deleted(conn):
+    iid = _insert(conn, "AB12121212")
+    isi.sync_invoice(conn, iid)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM invoices WHERE id=%s", (iid,))
+    conn.commit()
+    isi.sync_invoice(conn, iid)
+    assert _match(conn, "AB1212") == set()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+thumbs.py：只有網址版本等於原圖目前版本才給 immutable、WebP 要明確列在 Accept、舊版本縮圖會被清掉
+"""
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("PIL")
+
+
+@pytest.fixture()
+def source(app):
+    from PIL import Image
+    name = f"test_thumb_{uuid.uuid4().hex[:8]}.jpg"
+    path = os.path.join(app.config["UPLOAD_FOLDER"], name)
+    Image.new("RGB", (400, 300), (200, 30, 30)).save(path, "JPEG")
+    yield name, path
+    import thumbs
+    os.remove(path)
+    for size in thumbs.THUMB_SIZES:
+        d = os.path.join(thumbs.THUMB_FOLDER, size)
+        for n in os.listdir(d) if os.path.isdir(d) else []:
+            if n.startswith(name):
+                os.remove(os.path.join(d, n))
+
+
+def test_immutable_only_for_current_version(app, client, source):
+    import thumbs
+    name, _ = source
+    with app.test_request_context():
+        url = thumbs.thumb_url(name, "sm")
+    assert "v=" in url
+    r = client.get(url)
+    assert r.status_code == 200 and "immutable" in r.headers["Cache-Control"]
+    r = client.get(f"/thumb/sm/{name}")
+    assert "immutable" not in r.headers["Cache-Control"]
+    assert f"max-age={thumbs.THUMB_SHORT_MAX_AGE}" in r.headers["Cache-Control"]
+    r = client.get(f"/thumb/sm/{name}?v=0-0")
+    assert "immutable" not in r.headers["Cache-Control"]
+
+
+@pytest.mark.parametrize("accept, mimetype", [
+    ("image/avif,image/webp,*/*;q=0.8", "image/webp"),
+    ("image/*,*/*;q=0.8", "image/jpeg"),
+    ("*/*", "image/jpeg"),
+    ("image/webp;q=0,*/*", "image/jpeg"),
+])
+def test_webp_needs_explicit_accept(client, source, accept, mimetype):
+    name, _ = source
+    r = client.get(f"/thumb/sm/{name}", headers={"Accept": accept})
+    assert r.mimetype == mimetype
+
+
+def test_old_versions_pruned(client, source):
+    from PIL import Image
+    import thumbs
+    name, path = source
+    client.get(f"/thumb/sm/{name}")
+    Image.new("RGB", (500, 300), (30, 200, 30)).save(path, "JPEG")
+    os.utime(path, ns=(1, 1))
+    client.get(f"/thumb/sm/{name}")
+    files = [n for n in os.listdir(os.path.join(thumbs.THUMB_FOLDER, "sm")) if n.startswith(name)]
+    assert len(files) == 1
+
+
+def test_render_locks_are_bounded(app):
+    import thumbs
+    locks = {id(thumbs._lock_for(f"k{i}")) for i in range(1000)}
+    assert len(locks) <= thumbs._LOCK_STRIPES
+    assert thumbs._lock_for("same") is thumbs._lock_for("same")
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+yocr/validators.py：統一編號檢查碼（含第 7 碼為 7 的特例）
+"""
+import pytest
+
+from yocr.validators import ubn_ok
+
+
+@pytest.mark.parametrize("ubn", ["04595257", "22099131", "10458575", "10458574"])
+def test_ubn_valid(ubn):
+    assert ubn_ok(ubn)
+
+
+def test_ubn_seventh_digit_seven():
+    # 第 7 碼 7 × 4 = 28 → 2 + 8 = 10 也可當 1 + 0 = 1；兩種合計有一個被 5 整除就算
+    assert ubn_ok("10458575")   # 合計 30
+    assert ubn_ok("10458574")   # 合計 29，+1 後 30
+    assert not ubn_ok("10458571")
+
+
+@pytest.mark.parametrize("ubn", ["12345678", "04595256", "1234567", "123456789", "abcdefgh", "", None])
+def test_ubn_invalid(ubn):
+    # 04595256 只有「+1」才會通過，但第 7 碼不是 7
+    assert not ubn_ok(ubn)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+yocr/vendor_registry.py：錨點取值要與逐一 re.search 每個錨點的結果相同（錨點互相重疊時也一樣）
+"""
+import re
+
+from yocr.vendor_registry import VendorTemplate, load_templates
+
+
+def _baseline(tpl: VendorTemplate, text: str):
+    out = {k: "" for k in tpl.fields}
+    for k, rule in tpl.fields.items():
+        if not rule.anchor:
+            continue
+        m = re.search(rule.anchor, text, re.I)
+        if not m:
+            continue
+        seg = text[m.end():m.end() + rule.window]
+        mv = rule.value.search(seg) if rule.value is not None else None
+        out[k] = (mv.group(0).strip() if mv else "") if rule.value is not None else seg.strip()
+    return out
+
+
+def test_overlapping_anchors_match_separate_search():
+    # date 的錨點「號碼日期」與 num 的錨點「發票號碼」重疊：合成一條 regex 時 date 會漏掉或落到後面
+    tpl = VendorTemplate({"code": "xx", "fields": {
+        "num": {"anchor": "發票號碼", "value": r"[A-Z]{2}\d{8}"},
+        "date": {"anchor": "號碼日期", "value": r"\d{4}-\d{2}-\d{2}"},
+        "cash": {"anchor": "總計", "value": r"\d+"},
+    }})
+    text = "發票號碼日期 2026-01-02 AB12345678 ... 號碼日期 2025-12-31 總計 300"
+    got = tpl.extract_raw(text)
+    assert got == _baseline(tpl, text)
+    assert got["date"] == "2026-01-02"
+    assert got["num"] == "AB12345678"
+
+
+def test_same_position_anchors():
+    tpl = VendorTemplate({"code": "xx", "fields": {
+        "num": {"anchor": "號碼", "value": r"\d+"},
+        "sun": {"anchor": "號", "value": r"\d+"},
+    }})
+    text = "號碼 123 號 456"
+    assert tpl.extract_raw(text) == _baseline(tpl, text) == {"num": "123", "sun": "123"}
+
+
+def test_shipped_templates_match_baseline():
+    text = ("電子發票證明聯 發 票 號 碼：AB-12345678 開立日期：2026-01-02 "
+            "統一編號：12345678 賣方 統一編號 87654321 總計：1,234 元 發票號碼 CD99999999")
+    for tpl in load_templates().values():
+        assert tpl.extract_raw(text) == _baseline(tpl, text), tpl.code
@@ -0,0 +1,170 @@
+# thumbs.py
+# -*- coding: utf-8 -*-
+"""
+上傳圖片的縮圖 / 預覽圖（衍生圖）服務
+- /thumb/<size>/<filename>：固定尺寸（sm/md/lg），瀏覽器支援就給 WebP，否則 JPEG
+- 產生後快取在 uploads/thumbs/，原圖更新（mtime/size 變了）才重做；重做時把舊版本的縮圖刪掉
+- 強 ETag；網址的 ?v= 等於原圖目前版本才給一年 immutable，沒帶 / 舊版本只快取 THUMB_SHORT_MAX_AGE 秒
+- PDF 取第一頁做縮圖；原檔本身仍由 /uploads 提供（支援 Range 分段下載）
+模板用法：{{ row.filename|thumb('sm') }}，也可傳 '/uploads/xxx.jpg' 這種網址；程式裡用 thumb_url()
+"""
+import hashlib
+import os
+import re
+import threading
+from urllib.parse import unquote
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+from core_app import app
+
+# 長邊像素
+THUMB_SIZES = {"sm": 160, "md": 640, "lg": 1280}
+THUMB_MAX_AGE = 365 * 24 * 3600
+THUMB_SHORT_MAX_AGE = 300   # 網址沒帶目前版本：原圖之後可能更新，不能 immutable
+THUMB_FOLDER = os.path.join(app.config["UPLOAD_FOLDER"], "thumbs")
+app.config.setdefault("THUMB_FOLDER", THUMB_FOLDER)
+os.makedirs(THUMB_FOLDER, exist_ok=True)
+
+_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg":  ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# 同一張縮圖同時被多個請求要求時，只做一次；固定數量的分段鎖，不會隨縮圖數量一直長
+_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+def _lock_for(key: str) -> threading.Lock:
+    return _locks[hash(key) % _LOCK_STRIPES]
+
+
+def _source_path(filename: str) -> str:
+    p = safe_join(app.config["UPLOAD_FOLDER"], filename)
+    if not p or not os.path.isfile(p):
+        return ""
+    # 不對縮圖再做縮圖
+    if os.path.abspath(p).startswith(os.path.abspath(THUMB_FOLDER) + os.sep):
+        return ""
+    return p
+
+
+def _version(st) -> str:
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _open_source(src: str):
+    from PIL import Image
+    if src.lower().endswith(".pdf"):
+        from pdf2image import convert_from_path
+        kwargs = {"dpi": 72, "first_page": 1, "last_page": 1}
+        if app.config.get("POPPLER_PATH"):
+            kwargs["poppler_path"] = app.config["POPPLER_PATH"]
+        pages = convert_from_path(src, **kwargs)
+        if not pages:
+            raise RuntimeError("PDF 轉圖失敗")
+        return pages[0]
+    return Image.open(src)
+
+
+def _render(src: str, out_path: str, long_edge: int, fmt: str):
+    from PIL import Image, ImageOps
+    pil_fmt, _, save_kw = _FORMATS[fmt]
+    with _open_source(src) as im:
+        im.draft("RGB", (long_edge, long_edge))  # JPEG 直接用 DCT 縮小解碼，比全尺寸解碼快很多
+        im = ImageOps.exif_transpose(im)   # 手機直拍照片
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        im.thumbnail((long_edge, long_edge), Image.LANCZOS)
+        tmp = f"{out_path}.{threading.get_ident()}.tmp"
+        im.save(tmp, pil_fmt, **save_kw)
+    os.replace(tmp, out_path)
+
+
+def _prune_versions(out_dir: str, safe_name: str, ver: str):
+    """刪掉同一張原圖其他版本的縮圖（原圖被覆寫後舊版本不會再被要求）。"""
+    pat = re.compile(re.escape(safe_name) + r"\.([0-9a-f]+-[0-9a-f]+)\.(?:" + "|".join(_FORMATS) + r")")
+    for n in os.listdir(out_dir):
+        m = pat.fullmatch(n)
+        if m and m.group(1) != ver:
+            try:
+                os.remove(os.path.join(out_dir, n))
+            except OSError:
+                pass
+
+
+def _wants_webp() -> bool:
+    # 只認明確列出的 image/webp；quality() 會把 image/* 與 */* 也算進去，不支援 WebP 的瀏覽器也會送這些
+    return any(mt.lower() == "image/webp" and q > 0 for mt, q in request.accept_mimetypes)
+
+
+def _filename_from(value: str) -> str:
+    """接受檔名或 /uploads/... 網址。"""
+    v = unquote(str(value or "")).split("?", 1)[0]
+    for prefix in ("/uploads/", "uploads/"):
+        if v.startswith(prefix):
+            return v[len(prefix):]
+    return v.lstrip("/")
+
+
+# === 模板工具 ===
+def thumb_url(filename: str, size: str = "md") -> str:
+    """帶 ?v=原圖版本的縮圖網址（可長快取）；原檔不在或尺寸不對回空字串。"""
+    src = _source_path(filename) if filename else ""
+    if not src or size not in THUMB_SIZES:
+        return ""
+    return url_for("thumb", size=size, filename=filename, v=_version(os.stat(src)))
+
+
+@app.template_filter("thumb")
+def thumb_filter(value, size: str = "md") -> str:
+    filename = _filename_from(value)
+    if not filename:
+        return ""
+    # 找不到原檔（例如舊資料）就維持原本的網址
+    return thumb_url(filename, size) or (value if str(value).startswith("/") else url_for("uploads", filename=filename))
+
+
+# === 縮圖端點 ===
+@app.route("/thumb/<size>/<path:filename>", endpoint="thumb")
+def thumb(size: str, filename: str):
+    long_edge = THUMB_SIZES.get(size)
+    if not long_edge:
+        abort(404)
+    src = _source_path(filename)
+    if not src:
+        abort(404)
+
+    fmt = "webp" if _wants_webp() else "jpg"
+    st = os.stat(src)
+    ver = _version(st)
+    safe_name = filename.replace("/", "__").replace("\\", "__")
+    out_dir = os.path.join(THUMB_FOLDER, size)
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{safe_name}.{ver}.{fmt}")
+
+    if not os.path.isfile(out_path):
+        with _lock_for(out_path):
+            if not os.path.isfile(out_path):
+                try:
+                    _render(src, out_path, long_edge, fmt)
+                except Exception as e:
+                    print(f"[THUMB] 產生縮圖失敗 {filename}: {e}")
+                    abort(404)
+                _prune_versions(out_dir, safe_name, ver)
+
+    etag = hashlib.sha1(f"{filename}|{size}|{fmt}|{ver}".encode("utf-8")).hexdigest()
+    pinned = request.args.get("v") == ver
+    max_age = THUMB_MAX_AGE if pinned else THUMB_SHORT_MAX_AGE
+    resp = send_file(out_path, mimetype=_FORMATS[fmt][1], etag=etag,
+                     max_age=max_age, conditional=True)
+    if pinned:
+        # 網址帶 ?v=原圖目前版本，內容不會變
+        resp.headers["Cache-Control"] = f"public, max-age={THUMB_MAX_AGE}, immutable"
+    else:
+        # 沒帶版本（例如 _result_row 的 thumbUrl）或版本已舊：短快取，之後靠 ETag 重新驗證
+        resp.headers["Cache-Control"] = f"public, max-age={THUMB_SHORT_MAX_AGE}"
+    resp.vary.add("Accept")
+    return resp
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+辨識執行器（有上限的並行 + 排隊 + 拒絕）
+- 同時最多 OCR_MAX_CONCURRENCY 件辨識在跑，再多 OCR_MAX_QUEUE 件排隊等
+- 排隊也滿了（或等超過 OCR_QUEUE_TIMEOUT 秒）就丟 OcrBusy，網頁回 429 + Retry-After
+  （一陣上傳潮不會讓每個請求都變慢，也不會同時載一堆圖把記憶體撐爆）
+- 工作在呼叫端自己的執行緒跑，執行器只管名額；Retry-After 用最近平均耗時估
+- 公平排隊：每件工作帶「擁有者」（OCR_OWNER，網頁請求由 quotas.py 設成使用者），
+  有名額空出來時先給目前佔用最少名額的擁有者，同樣多就給最久沒輪到的；
+  一個人整批上傳時，其他人單張上傳不必排在整批後面
+- 模型只透過這裡進出：YOLO 門檻是每次呼叫的參數（yocr/yolo.py 偵測後再過濾），不改共用模型的屬性
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+
+OCR_MAX_CONCURRENCY = int(os.environ.get("OCR_MAX_CONCURRENCY", 2))
+OCR_MAX_QUEUE = int(os.environ.get("OCR_MAX_QUEUE", 8))
+OCR_QUEUE_TIMEOUT = float(os.environ.get("OCR_QUEUE_TIMEOUT", 60))
+
+# 這次辨識算誰的（公平排隊用）；沒設定的都算同一個匿名擁有者
+OCR_OWNER: contextvars.ContextVar = contextvars.ContextVar("ocr_owner", default="")
+
+
+class OcrBusy(RuntimeError):
+    """辨識名額與排隊都滿了；retry_after 是建議幾秒後再試。"""
+
+    def __init__(self, msg: str, retry_after: int):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("owner", "granted")
+
+    def __init__(self, owner: str):
+        self.owner = owner
+        self.granted = False
+
+
+class InferenceExecutor:
+    def __init__(self, max_running: int = OCR_MAX_CONCURRENCY, max_queue: int = OCR_MAX_QUEUE,
+                 queue_timeout: float = OCR_QUEUE_TIMEOUT):
+        self.max_running = max(1, max_running)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.avg_seconds = 3.0   # 最近工作耗時（指數平均），估 Retry-After 用
+        self._queues: Dict[str, Deque[_Ticket]] = {}   # 擁有者 → 排隊中的工作
+        self._running_by: Dict[str, int] = {}
+        self._last_grant: Dict[str, int] = {}          # 擁有者最後一次拿到名額的序號
+        self._seq = 0
+
+    def retry_after(self) -> int:
+        rounds = math.ceil((self.waiting + 1) / self.max_running)
+        return max(1, int(math.ceil(rounds * self.avg_seconds)))
+
+    def _dispatch(self):
+        """有空名額就依公平順序發給排隊中的工作（呼叫端持有 _cond）。"""
+        granted = False
+        while self.running < self.max_running and self._queues:
+            owner = min(self._queues, key=lambda o: (self._running_by.get(o, 0), self._last_grant.get(o, 0)))
+            q = self._queues[owner]
+            t = q.popleft()
+            if not q:
+                del self._queues[owner]
+            self.waiting -= 1
+            t.granted = granted = True
+            self._grant(owner)
+        if granted:
+            self._cond.notify_all()
+
+    def _grant(self, owner: str):
+        self._seq += 1
+        self.running += 1
+        self._running_by[owner] = self._running_by.get(owner, 0) + 1
+        self._last_grant[owner] = self._seq
+
+    def _acquire(self, owner: str):
+        with self._cond:
+            if self.running >= self.max_running and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise OcrBusy("辨識忙碌中，請稍後再試", self.retry_after())
+            t = _Ticket(owner)
+            self._queues.setdefault(owner, deque()).append(t)
+            self.waiting += 1
+            self._dispatch()
+            deadline = time.monotonic() + self.queue_timeout
+            while not t.granted:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    q = self._queues.get(owner)
+                    q.remove(t)
+                    if not q:
+                        del self._queues[owner]
+                    self.waiting -= 1
+                    self.timeouts += 1
+                    raise OcrBusy("辨識排隊逾時，請稍後再試", self.retry_after())
+                self._cond.wait(left)
+
+    def _release(self, owner: str, seconds: float):
+        with self._cond:
+            self.running -= 1
+            n = self._running_by.get(owner, 1) - 1
+            if n > 0:
+                self._running_by[owner] = n
+            else:
+                self._running_by.pop(owner, None)
+            if len(self._last_grant) > 1000:
+                # 只留還在跑 / 排隊的；整批上傳的人在兩張之間仍保有紀錄，不會被當成新來的插到前面
+                self._last_grant = {o: n for o, n in self._last_grant.items()
+                                    if o in self._running_by or o in self._queues}
+            self.completed += 1
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+            self._dispatch()
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """拿到名額才執行 fn；名額滿就排隊，排隊也滿丟 OcrBusy。擁有者取自 OCR_OWNER。"""
+        owner = OCR_OWNER.get()
+        self._acquire(owner)
+        t0 = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(owner, time.monotonic() - t0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_running": self.max_running,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_ms": int(self.avg_seconds * 1000),
+                "owners": {o or "-": {"running": self._running_by.get(o, 0), "waiting": len(self._queues.get(o, ()))}
+                           for o in set(self._running_by) | set(self._queues)},
+            }
+
+
+EXECUTOR = InferenceExecutor()
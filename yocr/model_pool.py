@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+YOLO 模型池（有記憶體上限的 LRU）
+- 模型第一次用到才載入，之後留在記憶體重複使用（不再每張圖 torch.hub.load 一次）
+- 使用中的模型會被 pin 住，不會被踢掉
+- 總大小超過上限時，踢掉最久沒用、且沒被 pin 的模型
+- hits / misses / evictions 計數，給管理頁觀察
+上限用環境變數 YOLO_POOL_BUDGET_MB 設定（0 = 不限制）
+"""
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_BUDGET_MB = float(os.environ.get("YOLO_POOL_BUDGET_MB", 1024))
+
+
+def estimate_model_bytes(model: Any, path: str = "") -> int:
+    """參數 + buffer 的實際大小；拿不到就用權重檔大小估。"""
+    try:
+        total = 0
+        for t in list(model.parameters()) + list(model.buffers()):
+            total += t.numel() * t.element_size()
+        if total:
+            return int(total)
+    except Exception:
+        pass
+    try:
+        return int(os.path.getsize(path)) if path else 0
+    except OSError:
+        return 0
+
+
+class _Entry:
+    __slots__ = ("model", "nbytes", "pins", "last_used")
+
+    def __init__(self, model: Any, nbytes: int):
+        self.model = model
+        self.nbytes = nbytes
+        self.pins = 0
+        self.last_used = time.time()
+
+
+class ModelPool:
+    def __init__(self, loader: Callable[[str], Any], paths: Dict[str, str],
+                 budget_mb: float = DEFAULT_BUDGET_MB):
+        self._loader = loader
+        self._paths = paths
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- 內部 ---
+    def _total_bytes(self) -> int:
+        return sum(e.nbytes for e in self._entries.values())
+
+    def _evict_locked(self):
+        if self.budget_bytes <= 0:
+            return
+        evicted = False
+        while self._total_bytes() > self.budget_bytes:
+            victim: Optional[str] = None
+            for key, e in self._entries.items():   # OrderedDict：最前面是最久沒用的
+                if e.pins == 0:
+                    victim = key
+                    break
+            if victim is None:
+                # 全部都在使用中：暫時超過上限，等釋放後再踢
+                break
+            e = self._entries.pop(victim)
+            e.model = None
+            self.evictions += 1
+            evicted = True
+            print(f"[MODEL POOL] evict {victim} ({e.nbytes / 1048576:.1f} MB)")
+        if evicted:
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except Exception:
+                pass
+
+    def _load_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lk = self._load_locks.get(key)
+            if lk is None:
+                lk = self._load_locks[key] = threading.Lock()
+            return lk
+
+    # --- 對外 ---
+    def acquire(self, key: str) -> Any:
+        """取得模型並 pin 住；用完一定要 release()（建議用 use()）。"""
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None:
+                e.pins += 1
+                e.last_used = time.time()
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return e.model
+
+        # 載入很慢，不占用全域鎖；同一個 key 只載一次
+        with self._load_lock(key):
+            with self._lock:
+                e = self._entries.get(key)
+                if e is not None:
+                    e.pins += 1
+                    e.last_used = time.time()
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return e.model
+            path = self._paths[key]
+            model = self._loader(path)
+            e = _Entry(model, estimate_model_bytes(model, path))
+            with self._lock:
+                self.misses += 1
+                e.pins = 1
+                self._entries[key] = e
+                self._entries.move_to_end(key)
+                self._evict_locked()
+            return model
+
+    def release(self, key: str):
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                return
+            e.pins = max(0, e.pins - 1)
+            e.last_used = time.time()
+            if e.pins == 0:
+                self._evict_locked()
+
+    @contextmanager
+    def use(self, key: str):
+        model = self.acquire(key)
+        try:
+            yield model
+        finally:
+            self.release(key)
+
+    def clear(self):
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.pins == 0]:
+                self._entries.pop(key)
+        gc.collect()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget_bytes / 1048576, 1),
+                "resident_mb": round(self._total_bytes() / 1048576, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": {
+                    k: {"mb": round(e.nbytes / 1048576, 1), "pins": e.pins,
+                        "idle_s": round(time.time() - e.last_used, 1)}
+                    for k, e in self._entries.items()
+                },
+            }
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+每個 (廠商, 欄位) 的 tesseract 設定檔：yocr/ocr_profile.json（由 ocr_autotune.py 產生）
+- 內容：oem / psm / lang / whitelist / scale，以及量測到的正確率、平均耗時
+- 只有 "meets": true（正確率達門檻）的項目會被辨識流程採用：該欄位直接用調好的設定讀裁切圖，
+  不必再走「拼接大文本 + 錨點」；一家廠商四個欄位都調好時，慢的 chi_tra+eng 整段讀取整個省掉
+- 檔案不存在 = 沒有調校，流程與原本完全相同
+- 路徑可用環境變數 OCR_PROFILE_PATH 指定
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+OCR_PROFILE_PATH = os.environ.get(
+    "OCR_PROFILE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_profile.json"),
+)
+
+_lock = threading.Lock()
+_profile: Optional[Dict[str, Any]] = None
+
+
+def load_profile(path: str = OCR_PROFILE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except Exception as e:
+        print(f"[OCR PROFILE] 載入失敗 {path}: {e}")
+        return {}
+    used = [f"{v}.{k}" for v, fs in (data.get("fields") or {}).items() for k, c in fs.items() if c.get("meets")]
+    print(f"[OCR PROFILE] {os.path.basename(path)}：採用 {used or '無'}")
+    return data
+
+
+def profile() -> Dict[str, Any]:
+    global _profile
+    if _profile is None:
+        with _lock:
+            if _profile is None:
+                _profile = load_profile()
+    return _profile
+
+
+def reload_profile(path: str = OCR_PROFILE_PATH) -> Dict[str, Any]:
+    global _profile
+    with _lock:
+        _profile = load_profile(path)
+    return _profile
+
+
+def field_config(vendor: str, key: str) -> Optional[Dict[str, Any]]:
+    """回傳調好的設定；沒有調校或正確率未達門檻回 None。"""
+    cfg = ((profile().get("fields") or {}).get((vendor or "").lower()) or {}).get(key)
+    return cfg if cfg and cfg.get("meets") else None
+
+
+def tesseract_config(cfg: Dict[str, Any]) -> str:
+    """{"oem": 1, "psm": 7, "whitelist": "0123456789"} → "--oem 1 --psm 7 -c tessedit_char_whitelist=0123456789" """
+    parts = [f"--oem {int(cfg.get('oem', 3))}", f"--psm {int(cfg.get('psm', 7))}"]
+    wl = cfg.get("whitelist") or ""
+    if wl:
+        # 白名單含空白時 tesseract 的參數會被切開，空白一律拿掉
+        parts.append(f"-c tessedit_char_whitelist={wl.replace(' ', '')}")
+    return " ".join(parts)
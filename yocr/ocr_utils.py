@@ -2,11 +2,20 @@
 """
 YOLO 已裁切小圖 → OCR(eng) → 依版型(mi/op/pc)錨點規則擷取
 """
-from typing import Dict, Optional, Tuple, Union
+from typing import Dict, Optional
 import re
 import os
 import pytesseract
 
+# tesseract.exe 路徑由 core_app.configure_ocr_env() 放在環境變數
+if os.environ.get("TESSERACT_CMD"):
+    pytesseract.pytesseract.tesseract_cmd = os.environ["TESSERACT_CMD"]
+
+from yocr.vendor_registry import cleaner, get_template
+from yocr.ocr_profile import field_config, tesseract_config
+import yocr.validators  # noqa: F401  登記 @validator（ubn / date / amount）
+from yocr.pipeline_profiles import resolve_profile
+
 try:
     import cv2
 except Exception:
@@ -51,13 +60,14 @@ _MONTH = {"jan":1,"feb":2,"mar":3,"apr":4,"may":5,"jun":6,"jul":7,"aug":8,"sep":
 
 
 # --- 取代原本的 _preprocess 與 _read_as_text ---
-def _preprocess(img):
+def _preprocess(img, scale: Optional[int] = None):
     if img is None: 
         return None
     g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    # 小圖放大一點（對細字、點陣 PDF 很有幫助）
+    # 小圖放大一點（對細字、點陣 PDF 很有幫助）；scale 由 ocr_profile 指定時照用
     h, w = g.shape[:2]
-    scale = 3 if max(h, w) < 300 else 2
+    if not scale:
+        scale = 3 if max(h, w) < 300 else 2
     g = cv2.resize(g, (w*scale, h*scale), interpolation=cv2.INTER_CUBIC)
     # 提升對比（CLAHE）+ 二值化 + 去噪
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
@@ -66,7 +76,7 @@ def _preprocess(img):
     g = cv2.medianBlur(g, 3)
     return g
 
-def _read_as_text(img_path: str, lang: str = "eng", config: str = "") -> str:
+def _read_as_text(img_path: str, lang: str = "eng", config: str = "", oem: int = 3, psm: int = 7) -> str:
     if pytesseract is None or cv2 is None:
         return ""
     img = cv2.imread(img_path)
@@ -75,21 +85,36 @@ def _read_as_text(img_path: str, lang: str = "eng", config: str = "") -> str:
     proc = _preprocess(img)
     if proc is None:
         return ""
-    # 與 main.py/detector_batch.py 一致：oem=3, psm=7
-    base_cfg = "--oem 3 --psm 7"
+    # 預設 oem=3, psm=7（單行）；accurate 設定檔用 oem=1, psm=6
+    base_cfg = f"--oem {oem} --psm {psm}"
     if config:
         base_cfg = f"{base_cfg} {config}"
     t = pytesseract.image_to_string(proc, lang=lang, config=base_cfg)
     return (t or "").strip()
 
+def _read_tuned(img_path: str, cfg: Dict) -> str:
+    """依 ocr_profile 調好的設定（oem/psm/lang/whitelist/scale）讀一塊裁切圖。"""
+    if pytesseract is None or cv2 is None:
+        return ""
+    img = cv2.imread(img_path)
+    proc = _preprocess(img, cfg.get("scale")) if img is not None else None
+    if proc is None:
+        return ""
+    t = pytesseract.image_to_string(proc, lang=cfg.get("lang") or "eng", config=tesseract_config(cfg))
+    return (t or "").strip()
+
+def _whitelist_cfg(wl: str) -> str:
+    # 要加 -c 才是設定參數；只寫 tessedit_char_whitelist=... 會被 tesseract 當成設定檔名而忽略
+    return f"-c tessedit_char_whitelist={wl.replace(' ', '')}" if wl else ""
+
 # 針對數字/英數欄位的便捷讀取
 def _read_digits(img_path: str) -> str:
-    return _read_as_text(img_path, lang="eng", config="tessedit_char_whitelist=0123456789")
+    return _read_as_text(img_path, lang="eng", config=_whitelist_cfg("0123456789"))
 
 def _read_alnum(img_path: str) -> str:
     return _read_as_text(
         img_path, lang="eng",
-        config="tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-"
+        config=_whitelist_cfg("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-")
     )
 
 
@@ -150,55 +175,51 @@ def _deconfuse_alnum_for_op(s: str) -> str:
     # 例如 L9X -> LOX、AB0C -> ABOC
     return re.sub(r"(?<=[A-Z])[09](?=[A-Z])", "O", s)
 
-def _clean_num(raw: str, inv_type: str) -> str:
-    raw = (raw or "").strip().upper()
-    if not raw:
-        return ""
-    if inv_type == "mi":
-        s = re.sub(r"[^A-Z0-9]", "", (raw or "").upper())
+# ========== 清洗函式（依名稱登記，廠商樣板 JSON 的 "cleaner" 指定用哪一個） ==========
+_DIGIT_TO_ALPHA = {"0": "O", "6": "G", "8": "B", "1": "I", "2": "Z"}
 
-        if not s:
-            return ""
-
-        # ✅ 如果第一碼是數字 → 依照規則轉換
-        if s[0].isdigit():
-            mapping = {"0": "O", "6": "G", "8": "B", "1": "I", "2": "Z"}
-            first = mapping.get(s[0], s[0])
-        else:
-            first = s[0]
-
-        # 後 9 碼只保留數字
-        digits = re.sub(r"\D", "", s[1:])
-        digits = digits[:9]
+@cleaner("num_mi")
+def _clean_num_mi(raw: str) -> str:
+    s = re.sub(r"[^A-Z0-9]", "", (raw or "").strip().upper())
+    if not s:
+        return ""
+    # ✅ 如果第一碼是數字 → 依照規則轉換
+    first = _DIGIT_TO_ALPHA.get(s[0], s[0]) if s[0].isdigit() else s[0]
+    # 後 9 碼只保留數字（不足9碼就返回現有）
+    digits = re.sub(r"\D", "", s[1:])[:9]
+    return first + digits
 
-        if len(digits) < 9:
-            return first + digits  # 不足9碼就返回現有
+@cleaner("num_op")
+def _clean_num_op(raw: str) -> str:
+    raw = (raw or "").strip().upper()
+    # 專門抓 "英數混合-英數混合" 格式 (至少3碼-至少2碼)
+    m = re.search(r"[A-Z0-9]{3,}-[A-Z0-9]{2,}", raw)
+    if m:
+        return _deconfuse_alnum_for_op(m.group(0))
+    # 備援：允許至少 6 碼以上的英數混合 (避免沒抓到)
+    m = re.search(r"[A-Z0-9\-]{6,}", raw)
+    if m:
+        return _deconfuse_alnum_for_op(m.group(0))
+    return ""
 
-        return first + digits
+@cleaner("num_pc")
+def _clean_num_pc(raw: str) -> str:
+    raw = (raw or "").strip().upper()
+    # 放寬 PC 發票號碼格式：英數字 + 可含破折號，至少 6 碼
+    m = re.search(r"[A-Z0-9\-]{6,}", raw)
+    if m:
+        return fix_pc_invoice_num(m.group(0))
+    return ""
 
-    if inv_type == "op":
-        # 專門抓 "英數混合-英數混合" 格式 (至少3碼-至少2碼)
-        m = re.search(r"[A-Z0-9]{3,}-[A-Z0-9]{2,}", raw)
-        if m:
-            fixed = _deconfuse_alnum_for_op(m.group(0))
-            return fixed
-
-        # 備援：允許至少 6 碼以上的英數混合 (避免沒抓到)
-        m = re.search(r"[A-Z0-9\-]{6,}", raw)
-        if m:
-            fixed = _deconfuse_alnum_for_op(m.group(0))
-            return fixed
-    if inv_type == "pc":
-        # 放寬 PC 發票號碼格式：英數字 + 可含破折號，至少 6 碼
-        m = re.search(r"[A-Z0-9\-]{6,}", raw)
-        if m:
-            candidate = m.group(0)
-            return fix_pc_invoice_num(candidate)
+def _clean_num(raw: str, inv_type: str) -> str:
+    return get_template(inv_type).clean("num", raw)
 
+@cleaner("sun")
 def _clean_sun(raw: str) -> str:
     m = re.search(r"(?<!\d)\d{8}(?!\d)", raw or "")
     return m.group(0) if m else _keep_digits(raw)[:8]
 
+@cleaner("date")
 def _clean_date(raw: str) -> str:
     # 統一回傳 YYYY/MM/DD 格式，無法解析則回空字串
     s = (raw or "").strip()
@@ -213,136 +234,182 @@ def _clean_date(raw: str) -> str:
     date_str = _clean_year_range(_parse_date(s))
     return date_str if date_str else ""
 
-def _clean_cash(raw: str, inv_type: str = "") -> str:
+@cleaner("cash_mi")
+def _clean_cash_mi(raw: str) -> str:
     if not raw:
         return ""
-    if inv_type == "mi":
-        # 自動補空格：TWD6925 → TWD 6925
-        s = re.sub(r"([A-Z]{2,4})(\d{2,})", r"\1 \2", raw)
-        # 若同時有日期和金額，先分割
-        # 例：2025/07/09 TWD 6925 或 20250709TWD6925
-        date_pat = r"(\d{4}[./-]\d{2}[./-]\d{2}|\d{8})"
-        cash_pat = r"\d{1,3}(?:,\d{3})*(?:\.\d+)?"
-        m = re.search(date_pat + r"\s*([A-Z]{2,4}\s*\d{1,})", s)
-        if m:
-            s = m.group(2)
-        # 只抓數字部分
-        m = re.search(cash_pat, s)
-        if m:
-            return m.group(0).replace(",", "")
+    # 自動補空格：TWD6925 → TWD 6925
+    s = re.sub(r"([A-Z]{2,4})(\d{2,})", r"\1 \2", raw)
+    # 若同時有日期和金額，先分割
+    # 例：2025/07/09 TWD 6925 或 20250709TWD6925
+    date_pat = r"(\d{4}[./-]\d{2}[./-]\d{2}|\d{8})"
+    cash_pat = r"\d{1,3}(?:,\d{3})*(?:\.\d+)?"
+    m = re.search(date_pat + r"\s*([A-Z]{2,4}\s*\d{1,})", s)
+    if m:
+        s = m.group(2)
+    # 只抓數字部分
+    m = re.search(cash_pat, s)
+    if m:
+        return m.group(0).replace(",", "")
+    return ""
+
+@cleaner("cash_pc")
+def _clean_cash_pc(raw: str) -> str:
+    if not raw:
         return ""
-    if inv_type == "pc":
-        # 只抓「總計:」後面的數字（純數字，不含元）
-        nums = re.findall(r"\d{1,3}(?:,\s?\d{3})*(?:\.\d+)?", raw)
-        if nums:
-            return re.sub(r"[,\\s]", "", nums[-1])  # ← 同時移除逗號與空白
+    # 只抓「總計:」後面的數字（純數字，不含元）
+    nums = re.findall(r"\d{1,3}(?:,\s?\d{3})*(?:\.\d+)?", raw)
+    if nums:
+        return re.sub(r"[,\\s]", "", nums[-1])  # ← 同時移除逗號與空白
+    return ""
+
+@cleaner("cash")
+def _clean_cash_generic(raw: str) -> str:
+    if not raw:
         return ""
-    # 其他票種維持原本邏輯
     s = re.sub(r"[^\d.,]", "", raw)
     m = re.search(r"\d{1,3}(?:[,\d]{0,})", s)
     if not m:
         return ""
     return m.group(0).replace(",", "")
 
+def _clean_cash(raw: str, inv_type: str = "") -> str:
+    return get_template(inv_type).clean("cash", raw)
 
-# ========== 版型錨點規則 ==========
-# 規則 tuple 支援 (anchor, value) 或 (anchor, value, window)
-_MI_RULES: Dict[str, Union[Tuple[str,str], Tuple[str,str,int]]] = {
-    "num":  (r"\binvoice\s*number\b",              r"[A-Z0-9\-]+"),
-    "date": (r"\binvoice\s*date\s*in\s*utc\b",     r"[A-Za-z]+\s+\d{1,2},\s*\d{4}|\d{4}[./-]\d{1,2}[./-]\d{1,2}|\d{1,2}/\d{1,2}/\d{4}"),
-    "sun":  (r"\bvat\s*reg\.\s*no\.?\b",           r"\d{6,12}"),
-    "cash": (r"\btotal\s*amount\s*twd\b",          r"\d[\d,]*(?:\.\d+)?"),
-}
-
-_OP_RULES: Dict[str, Union[Tuple[str,str], Tuple[str,str,int]]] = {
-    "num":  (r"\b(invoicenumber|invoice\s*number)\b", r"[A-Z0-9\-]+"),
-    "date": (r"\bdate\s*due\b",                        r"[A-Za-z]+\s+\d{1,2},\s*\d{4}|\d{4}[./-]\d{1,2}[./-]\d{1,2}|\d{1,2}/\d{1,2}/\d{4}"),
-    "sun":  (r"\bvat\b",                               r"\d{6,12}"),
-    "cash": (r"\bamount\s*due\b",                      r"\d[\d,]*(?:\.\d+)?"),
-}
-
-_PC_RULES: Dict[str, Union[Tuple[str,str], Tuple[str,str,int]]] = {
-    # 發票號碼：允許「發票號碼」或「發 票 號 碼」
-    "num":  (r"(發\s*票\s*號\s*碼|發票號碼)[:：]?\s*", r"[A-Z0-9]{2}\d{8}|[A-Z0-9\-]+"),
-
-    # 開立日期：允許「開立日期」或「開 立 日 期」
-    "date": (r"(開\s*立\s*日\s*期|開立日期)[:：]?\s*", r"\d{4}[./-]\d{1,2}[./-]\d{1,2}|\d{1,2}/\d{1,2}/\d{4}"),
 
-    # 統一編號：允許「統一編號」或「統 一 編 號」
-    "sun":  (r"(統\s*一\s*編\s*號|統一編號)[:：]?\s*", r"\d{8}"),
+# ========== 版型錨點規則 ==========
+# 錨點 / 取值 regex、視窗大小都在 yocr/vendors/<code>.json，啟動時編譯一次
+def _apply_rules(text: str, inv_type: str) -> Dict[str, str]:
+    return get_template(inv_type).extract(text)
 
-    # 交易金額：允許「交易金額」或「交 易 金 額」
-    "cash": (r"總\s*計\s*[:：]\s*", r"\d{1,3}(?:,\s?\d{3})*(?:\.\d+)?", 50),
-}
 
+# ========== 拼接畫布：所有裁切圖一次 OCR ==========
+# 設定檔 ocr_mode=stitched（fast）：四塊裁切圖上下拼成一張，只啟動一次 tesseract，
+#   用 image_to_data 的字框 y 座標分回各欄位；失敗的欄位才用白名單重讀
+# ocr_mode=per_crop（accurate）：每塊各讀一次（oem / psm 由設定檔決定）
+_STITCH_GAP = 48      # 欄位之間的空白帶（px，前處理放大後的尺寸）
+_STITCH_MARGIN = 24
 
-def _apply_rules(text: str, inv_type: str) -> Dict[str, str]:
-    inv = (inv_type or "").lower()
-    rules = _MI_RULES if inv == "mi" else _OP_RULES if inv == "op" else _PC_RULES
-    out = {}
-    for key, rule in rules.items():
-        if len(rule) == 2:
-            anchor, vr = rule  # type: ignore
-            raw = _after_anchor(text, anchor, vr)
-        else:
-            anchor, vr, win = rule  # type: ignore
-            raw = _after_anchor(text, anchor, vr, window=win)
-        out[key] = raw if raw else ""
-    out["num"]  = _clean_num(out.get("num",""), inv)
-    out["sun"]  = _clean_sun(out.get("sun",""))
-    out["cash"] = _clean_cash(out.get("cash",""), inv)
-    out["date"] = _clean_date(out.get("date",""))
-    return out
 
-
-def ocr_fields_from_crops(crops: Dict[str, str], inv_type: str) -> Dict[str, str]:
-    inv = (inv_type or "pc").lower()
+def _stitch_crops(crops: Dict[str, str]):
+    """回傳 (畫布, [(key, y0, y1), ...])；畫布是白底黑字的二值圖。"""
+    import numpy as np
+    parts = []
+    for k in ("num", "date", "sun", "cash"):
+        p = crops.get(k)
+        if not p:
+            continue
+        img = cv2.imread(p)
+        proc = _preprocess(img) if img is not None else None
+        if proc is not None:
+            parts.append((k, proc))
+    if not parts:
+        return None, []
+    width = max(im.shape[1] for _, im in parts) + 2 * _STITCH_MARGIN
+    height = sum(im.shape[0] for _, im in parts) + _STITCH_GAP * (len(parts) - 1) + 2 * _STITCH_MARGIN
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    spans = []
+    y = _STITCH_MARGIN
+    for k, im in parts:
+        h, w = im.shape[:2]
+        canvas[y:y + h, _STITCH_MARGIN:_STITCH_MARGIN + w] = im
+        spans.append((k, y, y + h))
+        y += h + _STITCH_GAP
+    return canvas, spans
+
+
+def _read_stitched(crops: Dict[str, str], lang: str) -> Dict[str, str]:
+    """一次 image_to_data，依字框中心點的 y 座標把字分回各欄位，回傳 {key: 文字}。"""
+    canvas, spans = _stitch_crops(crops)
+    texts = {k: "" for k, _, _ in spans}
+    if canvas is None:
+        return texts
+    data = pytesseract.image_to_data(canvas, lang=lang, config="--oem 3 --psm 6",
+                                     output_type=pytesseract.Output.DICT)
+    lines: Dict[str, Dict[tuple, list]] = {k: {} for k in texts}
+    for i, word in enumerate(data.get("text", [])):
+        word = (word or "").strip()
+        if not word:
+            continue
+        cy = data["top"][i] + data["height"][i] / 2.0
+        key = next((k for k, y0, y1 in spans if y0 - _STITCH_GAP / 2 <= cy < y1 + _STITCH_GAP / 2), "")
+        if not key:
+            continue
+        line_id = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines[key].setdefault(line_id, []).append((data["left"][i], word))
+    for k, by_line in lines.items():
+        texts[k] = "\n".join(" ".join(w for _, w in sorted(ws)) for _, ws in sorted(by_line.items()))
+    return texts
+
+
+# 驗證沒過的欄位依序換這些設定重讀裁切圖（讀到通過驗證就停，最多設定檔 retry_max 種）；
+# whitelist=None 表示用樣板白名單
+_RETRY_VARIANTS = [
+    {"oem": 3, "psm": 7, "lang": "eng", "whitelist": None, "scale": 0},   # 原本的白名單補讀
+    {"oem": 1, "psm": 7, "lang": "eng", "whitelist": None, "scale": 3},
+    {"oem": 3, "psm": 13, "lang": "eng", "whitelist": None, "scale": 3},
+    {"oem": 1, "psm": 6, "lang": "", "whitelist": "", "scale": 2},       # lang 空 = 樣板語言
+]
+
+
+def _take(tpl, out: Dict[str, str], k: str, v: str) -> bool:
+    """候選值 v：目前沒值、或 v 通過驗證而目前的沒過 → 採用。回傳 out[k] 是否已通過驗證。"""
+    if v and (not out.get(k) or (tpl.validate(k, v) and not tpl.validate(k, out[k]))):
+        out[k] = v
+    return tpl.validate(k, out.get(k, ""))
+
+
+def ocr_fields_from_crops(crops: Dict[str, str], inv_type: str, profile=None) -> Dict[str, str]:
+    """profile：PipelineProfile 或設定檔名稱（None = 預設）。"""
+    tpl = get_template(inv_type or "pc")
+    prof = resolve_profile(profile)
     out = {"num":"", "date":"", "sun":"", "cash":""}
 
-    # 先把四塊拼成一個大文本，配你已經寫好的錨點規則跑一次
-    segs = []
-    for k in ("num","date","sun","cash"):
-        p = crops.get(k)
-        if p:
-            # mi 和 op 只用英文包，pc 保持原設定
-            lang_pool = "eng" if inv in ("mi", "op") else "chi_tra+eng"
-            segs.append(_read_as_text(p, lang=lang_pool))
-    pool = "\n".join([s for s in segs if s])
+    # ocr_autotune.py 調好的欄位：直接用該欄位最快且達正確率門檻的設定讀，通過驗證就不進大文本
+    for k in ("num", "date", "sun", "cash"):
+        cfg = field_config(tpl.code, k) if crops.get(k) and prof.use_tuned else None
+        if cfg:
+            out[k] = tpl.clean(k, _read_tuned(crops[k], cfg))
+    rest = {k: p for k, p in crops.items() if p and not tpl.validate(k, out.get(k, ""))}
+
+    # 其餘欄位拼成一個大文本，配你已經寫好的錨點規則跑一次
+    # 大文本用樣板語言（mi/op 只用英文包，pc 用 chi_tra+eng），不限白名單（保留 anchor）
+    raw_texts: Dict[str, str] = {}
+    if rest and prof.ocr_mode == "stitched" and cv2 is not None:
+        try:
+            raw_texts = _read_stitched(rest, tpl.lang)
+        except Exception as e:
+            print(f"[OCR] 拼接畫布 OCR 失敗，改逐塊讀取：{e}")
+            raw_texts = {}
+    if rest and not raw_texts:
+        for k in ("num","date","sun","cash"):
+            p = rest.get(k)
+            if p:
+                raw_texts[k] = _read_as_text(p, lang=tpl.lang, oem=prof.crop_oem, psm=prof.crop_psm)
+    pool = "\n".join([raw_texts[k] for k in ("num","date","sun","cash") if raw_texts.get(k)])
     if pool:
-        out.update(_apply_rules(pool, inv))
-
-    # 接著逐欄位補強：針對各欄位使用對應的 tesseract 白名單
-    if crops.get("num") and not out["num"]:
-        if inv in ("mi", "op"):
-            # mi 和 op 使用純英文包
-            out["num"] = _clean_num(_read_alnum(crops["num"]), inv)
-        else:  # pc
-            out["num"] = _clean_num(_read_alnum(crops["num"]), inv)
-
-    if crops.get("sun") and not out["sun"]:
-        out["sun"] = _clean_sun(_read_digits(crops["sun"]))
-
-    if crops.get("cash") and not out["cash"]:
-        # 金額允許逗點與小數點，先用英數白名單抓，再交給 _clean_cash
-        cash_raw = _read_as_text(crops["cash"], lang="eng",
-                                 config="tessedit_char_whitelist=0123456789.,元NTWD")
-        out["cash"] = _clean_cash(cash_raw, inv)
-
-    if crops.get("date") and not out["date"]:
-        # 日期保留英文字母（月名）與分隔符號
-        date_raw = _read_as_text(crops["date"], lang="eng",
-                                 config="tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789/.-, ")
-        out["date"] = _clean_date(date_raw)
-    # ---- 最後補強 PC 發票號碼格式 ----
-    if inv == "pc" and out.get("num"):
-        out["num"] = fix_pc_invoice_num(out["num"])
-
-    # === 若 OCR 結果為空，自動補原始裁切圖 OCR ===
+        for k, v in tpl.extract(pool).items():
+            if k in rest:
+                _take(tpl, out, k, v)
+
+    # 接著逐欄位補強：只重讀「沒通過驗證」的欄位（檢查碼、號碼格式、日期範圍、金額），換設定直到通過
+    retried = []
+    for k in ("num", "sun", "cash", "date"):
+        if not rest.get(k) or tpl.validate(k, out[k]):
+            continue
+        retried.append(k)
+        for v in _RETRY_VARIANTS[:prof.retry_max]:
+            cfg = dict(v, whitelist=tpl.whitelist(k) if v["whitelist"] is None else v["whitelist"],
+                       lang=v["lang"] or tpl.lang)
+            if _take(tpl, out, k, tpl.clean(k, _read_tuned(rest[k], cfg))):
+                break
+    if retried:
+        print(f"[OCR] {tpl.code} 重讀欄位 {retried} → 通過 {[k for k in retried if tpl.validate(k, out[k])]}")
+
+    # === 若 OCR 結果為空，自動補原始裁切圖 OCR（第一輪已經用同樣的語言讀過，直接沿用） ===
     for k in ("num", "date", "sun", "cash"):
         if crops.get(k) and not out.get(k):
-            # mi 和 op 只用英文包，pc 保持原設定
-            lang_fallback = "eng" if inv in ("mi", "op") else "chi_tra+eng"
-            out[k] = _read_as_text(crops[k], lang=lang_fallback)
+            out[k] = raw_texts.get(k) or ""
 
     return out
 
@@ -379,15 +446,8 @@ def fix_mi_invoice_num(text: str) -> str:
 def fullpage_anchor_ocr(img_bgr, inv_type: str):
     if cv2 is None:
         return {"num":"", "date":"", "sun":"", "cash":""}
-    inv = (inv_type or "").lower()
-    # mi 和 op 只用英文包，pc 保持原設定
-    lang = "eng" if inv in ("mi", "op") else "chi_tra+eng"
+    tpl = get_template(inv_type)
     proc = _preprocess(img_bgr)
-    txt = pytesseract.image_to_string(proc, lang=lang, config="--oem 1 --psm 6") if proc is not None else ""
-    out = _apply_rules(txt or "", inv)
-    # 再跑一次清洗，確保格式
-    out["num"]  = _clean_num(out.get("num",""), inv)
-    out["sun"]  = _clean_sun(out.get("sun",""))
-    out["cash"] = _clean_cash(out.get("cash",""), inv)
-    out["date"] = _clean_date(out.get("date",""))
-    return out
+    txt = pytesseract.image_to_string(proc, lang=tpl.lang, config="--oem 1 --psm 6") if proc is not None else ""
+    # 樣板 extract 已經做過清洗
+    return tpl.extract(txt or "")
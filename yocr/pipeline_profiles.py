@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+辨識流程設定檔（yocr/pipeline_profiles.json）
+- 一份設定 = 一組 YOLO 輸入尺寸 / 門檻、裁切圖處理、OCR 讀法、重讀次數與整頁補抓策略
+    fast      網頁上傳、鏡頭（原 yocr/yolo.py 的 640/640、拼接讀取）
+    accurate  批次補登、Email、重新辨識（原根目錄 yolo.py 的 960/1280、逐塊 oem 1 / psm 6）
+- 選擇順序：呼叫端指定的名稱 → 來源（"sources"：camera → fast、batch → accurate…）→ "default"
+- 新增設定 = 在 JSON 加一段，不用改程式；路徑可用 PIPELINE_PROFILES_PATH 指定
+- YOLO_CONF / OCR_CROP_MODE 環境變數仍可整體覆寫（相容舊設定）
+- 信心門檻是偵測後才套用的過濾條件；NMS 的 IoU（YOLO_IOU）在模型載入時就定好，不屬於設定檔
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+PIPELINE_PROFILES_PATH = os.environ.get(
+    "PIPELINE_PROFILES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_profiles.json"),
+)
+
+FALLBACK_POLICIES = ("never", "empty", "invalid")
+
+_DEFAULTS: Dict[str, Any] = {
+    "description": "",
+    "tr3_size": 640,
+    "tr3_conf": 0.10,
+    "field_size": 640,
+    "field_conf": 0.30,
+    "crop_height": 128,      # 裁切圖縮放到固定高度；0 = 保留原尺寸
+    "ocr_mode": "stitched",  # stitched：拼成一張讀一次；per_crop：逐塊讀
+    "crop_oem": 3,
+    "crop_psm": 7,
+    "use_tuned": True,       # 採用 ocr_profile.json（ocr_autotune.py）調好的欄位設定
+    "retry_max": 3,          # 驗證沒過的欄位最多換幾種設定重讀
+    "fallback": "invalid",   # 整頁補抓：never / empty（欄位空白）/ invalid（沒通過驗證）
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    v = os.environ.get(name)
+    return float(v) if v else float(default)
+
+
+class PipelineProfile:
+    """一組辨識流程設定。"""
+
+    def __init__(self, name: str, cfg: Dict[str, Any]):
+        c = dict(_DEFAULTS, **cfg)
+        self.name = name
+        self.description: str = c["description"]
+        self.tr3_size = int(c["tr3_size"])
+        self.field_size = int(c["field_size"])
+        self.tr3_conf = _env_float("YOLO_CONF", c["tr3_conf"])
+        self.field_conf = _env_float("YOLO_CONF", c["field_conf"])
+        self.crop_height = int(c["crop_height"])
+        self.ocr_mode: str = os.environ.get("OCR_CROP_MODE") or c["ocr_mode"]
+        self.crop_oem = int(c["crop_oem"])
+        self.crop_psm = int(c["crop_psm"])
+        self.use_tuned = bool(c["use_tuned"])
+        self.retry_max = int(c["retry_max"])
+        self.fallback: str = c["fallback"] if c["fallback"] in FALLBACK_POLICIES else "invalid"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in ("name", *_DEFAULTS)}
+
+
+# === 登錄表 ===
+_lock = threading.Lock()
+_loaded: Optional[Dict[str, Any]] = None
+
+
+def load_profiles(path: str = PIPELINE_PROFILES_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except Exception as e:
+        print(f"[PIPELINE] 設定檔載入失敗 {path}: {e}，改用內建預設")
+        data = {}
+    profiles = {n: PipelineProfile(n, c) for n, c in (data.get("profiles") or {}).items()}
+    if not profiles:
+        profiles = {"fast": PipelineProfile("fast", {})}
+    default = data.get("default") if data.get("default") in profiles else next(iter(profiles))
+    sources = {s: n for s, n in (data.get("sources") or {}).items() if n in profiles}
+    print(f"[PIPELINE] 設定 {list(profiles)}，預設 {default}")
+    return {"profiles": profiles, "default": default, "sources": sources}
+
+
+def _registry() -> Dict[str, Any]:
+    global _loaded
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                _loaded = load_profiles()
+    return _loaded
+
+
+def reload_profiles() -> Dict[str, Any]:
+    global _loaded
+    with _lock:
+        _loaded = load_profiles()
+    return _loaded
+
+
+def profile_names() -> List[str]:
+    return list(_registry()["profiles"])
+
+
+def resolve_profile(profile: Any = None, source: str = "") -> PipelineProfile:
+    """profile 可以是 PipelineProfile、名稱或 None；名稱不認得時依來源 / 預設。"""
+    if isinstance(profile, PipelineProfile):
+        return profile
+    reg = _registry()
+    name = (profile or "").strip().lower()
+    if name not in reg["profiles"]:
+        name = reg["sources"].get((source or "").lower(), reg["default"])
+    return reg["profiles"][name]
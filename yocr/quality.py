@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+影像品質快篩（進 YOLO 之前）
+- 模糊、太暗 / 過曝、解析度太低、發票只佔畫面一小角的照片，跑完 tr3 + 欄位偵測 + 八次 OCR + 整頁備援
+  最後也只會回空欄位；這裡先在縮小的副本（長邊 QUALITY_CHECK_EDGE）上花幾毫秒量：
+    清晰度   Laplacian 變異數
+    曝光     平均亮度、對比（標準差）；完全沒有內容（低對比且沒有邊緣）才算空白
+    反光     紙張區域裡飽和（> 250）像素的比例，而且紙張本身不是白底（中位數 < QUALITY_PAPER_WHITE）；
+             掃描檔、PDF 轉圖整頁幾乎都是白紙，不能用「白色佔多少」判斷，PDF 轉圖（rendered）不檢查
+    解析度   原圖短邊太小才 reject；發票四邊形可信時用「短邊 × √面積比」估發票本身的解析度，最多只給 warn
+    版面     最大四邊形佔畫面比例：相機照片（camera）才用；其他來源只有四邊形夠大（QUALITY_QUAD_TRUST）
+             才相信它是紙張，避免把表格內框當成整頁（整頁多張不檢查）
+- 每項結果分 ok / warn / reject；QUALITY_GATE 決定怎麼處理：
+    reject（預設）reject 直接回原因不辨識，warn 照常辨識但附上提示
+    warn          一律照常辨識，只附提示
+    off           不檢查
+  呼叫端 force=True（前端送 force=1）時不擋，只附提示
+- 統計（檢查 / 警告 / 拒絕次數、各原因次數、平均耗時）給 /api/ocr_stats
+- 只用 cv2 / numpy，不碰 torch；cv2 第一次檢查才 import
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "reject").strip().lower()
+QUALITY_CHECK_EDGE = int(os.environ.get("QUALITY_CHECK_EDGE", 640))
+QUALITY_SHARPNESS_MIN = float(os.environ.get("QUALITY_SHARPNESS_MIN", 15))     # 低於 → reject
+QUALITY_SHARPNESS_WARN = float(os.environ.get("QUALITY_SHARPNESS_WARN", 60))   # 低於 → warn
+QUALITY_DARK_MEAN = float(os.environ.get("QUALITY_DARK_MEAN", 40))             # 平均亮度低於 → reject
+QUALITY_DIM_MEAN = float(os.environ.get("QUALITY_DIM_MEAN", 70))               # 平均亮度低於 → warn
+QUALITY_GLARE_MAX = float(os.environ.get("QUALITY_GLARE_MAX", 0.4))            # 紙張區域飽和比例高於 → reject
+QUALITY_GLARE_WARN = float(os.environ.get("QUALITY_GLARE_WARN", 0.1))
+QUALITY_PAPER_WHITE = float(os.environ.get("QUALITY_PAPER_WHITE", 235))        # 紙張中位數亮度以上視為白底，不判反光
+QUALITY_CONTRAST_MIN = float(os.environ.get("QUALITY_CONTRAST_MIN", 12))       # 亮度標準差低於（且沒有邊緣）→ reject
+QUALITY_MIN_EDGE = int(os.environ.get("QUALITY_MIN_EDGE", 320))                # 原圖短邊像素低於 → reject
+QUALITY_WARN_EDGE = int(os.environ.get("QUALITY_WARN_EDGE", 600))              # 發票短邊（估計）低於 → warn
+QUALITY_MIN_AREA = float(os.environ.get("QUALITY_MIN_AREA", 0.15))             # 相機照片發票佔畫面比例低於 → warn
+QUALITY_QUAD_TRUST = float(os.environ.get("QUALITY_QUAD_TRUST", 0.3))          # 非相機來源：四邊形至少佔這麼多才算紙張
+
+_LEVELS = {"ok": 0, "warn": 1, "reject": 2}
+
+
+# === 量測（live_scan.py 也用）===
+def sharpness(gray) -> float:
+    import cv2
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def document_quad(gray) -> Optional[Any]:
+    """找畫面中最大的四邊形（發票紙張）；找不到回 None。"""
+    import cv2
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blur, 50, 150)
+    edges = cv2.dilate(edges, None, iterations=1)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    c = max(contours, key=cv2.contourArea)
+    approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+    return approx if len(approx) == 4 else None
+
+
+def exposure(gray) -> Dict[str, float]:
+    return {"brightness": round(float(gray.mean()), 1), "contrast": round(float(gray.std()), 1)}
+
+
+def exposure_issue(m: Dict[str, float]) -> Optional[Dict[str, str]]:
+    """曝光量測（加上 sharpness）→ 最嚴重的一項問題（沒有回 None）。"""
+    if m["contrast"] < QUALITY_CONTRAST_MIN and m["sharpness"] < QUALITY_SHARPNESS_MIN:
+        return {"code": "blank", "level": "reject", "message": "畫面幾乎沒有內容（空白或全黑）"}
+    if m["brightness"] < QUALITY_DARK_MEAN:
+        return {"code": "dark", "level": "reject", "message": "影像太暗，請開燈或換到明亮處"}
+    if m["brightness"] < QUALITY_DIM_MEAN:
+        return {"code": "dim", "level": "warn", "message": "影像偏暗，辨識可能不準"}
+    return None
+
+
+def glare(gray, mask=None) -> Dict[str, float]:
+    """紙張區域（mask；None = 整張）的中位數亮度與飽和像素比例。"""
+    import numpy as np
+    px = gray[mask > 0] if mask is not None else gray.ravel()
+    if px.size == 0:
+        return {"paper": 0.0, "glare": 0.0}
+    return {"paper": float(np.median(px)), "glare": round(float((px > 250).sum()) / px.size, 3)}
+
+
+def glare_issue(m: Dict[str, float]) -> Optional[Dict[str, str]]:
+    # 白底（掃描 / 白紙滿版）本來就接近飽和，不算反光
+    if m["paper"] >= QUALITY_PAPER_WHITE:
+        return None
+    if m["glare"] > QUALITY_GLARE_MAX:
+        return {"code": "glare", "level": "reject", "message": "影像有大片反光，請避開直射光"}
+    if m["glare"] > QUALITY_GLARE_WARN:
+        return {"code": "glare_warn", "level": "warn", "message": "影像有反光，辨識可能不準"}
+    return None
+
+
+def assess(img_bgr, check_area: bool = True, camera: bool = False, rendered: bool = False) -> Dict[str, Any]:
+    """
+    :param img_bgr:    BGR numpy array（原圖）
+    :param check_area: 是否找發票四邊形估版面比例（整頁多張時關掉）
+    :param camera:     相機照片：四邊形一律當成紙張，太小會提示靠近
+    :param rendered:   PDF 轉出的圖：不檢查反光
+    :return: {level: ok/warn/reject, issues: [{code, level, message}], hint, metrics, ms}
+    """
+    import cv2
+    import numpy as np
+    t0 = time.perf_counter()
+    h, w = img_bgr.shape[:2]
+    scale = QUALITY_CHECK_EDGE / float(max(h, w))
+    small = cv2.resize(img_bgr, (max(1, int(w * scale)), max(1, int(h * scale))),
+                       interpolation=cv2.INTER_AREA) if scale < 1 else img_bgr
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    issues: List[Dict[str, str]] = []
+    metrics: Dict[str, Any] = {"width": w, "height": h}
+
+    sharp = sharpness(gray)
+    metrics["sharpness"] = round(sharp, 1)
+    exp = exposure(gray)
+    metrics.update(exp)
+    issue = exposure_issue(dict(exp, sharpness=sharp))
+    if issue:
+        issues.append(issue)
+    # 空白 / 全黑的畫面 Laplacian 本來就低，不再重複報模糊
+    if not issue or issue["code"] != "blank":
+        if sharp < QUALITY_SHARPNESS_MIN:
+            issues.append({"code": "blur", "level": "reject", "message": "影像模糊，請對焦後重拍"})
+        elif sharp < QUALITY_SHARPNESS_WARN:
+            issues.append({"code": "soft", "level": "warn", "message": "影像不夠清晰，辨識可能不準"})
+
+    # 紙張：四邊形夠大（或相機照片）才相信它是整張發票，否則當作滿版
+    mask = None
+    edge = float(min(h, w))
+    if check_area:
+        quad = document_quad(gray)
+        if quad is not None:
+            area = cv2.contourArea(quad) / float(gray.shape[0] * gray.shape[1])
+            metrics["area"] = round(area, 3)
+            if camera or area >= QUALITY_QUAD_TRUST:
+                mask = np.zeros(gray.shape[:2], np.uint8)
+                cv2.fillPoly(mask, [quad.reshape(-1, 2)], 255)
+                edge *= max(area, 1e-6) ** 0.5
+                if camera and area < QUALITY_MIN_AREA:
+                    issues.append({"code": "small", "level": "warn", "message": "發票在畫面中太小，請靠近一點"})
+
+    if not rendered:
+        g = glare(gray, mask)
+        metrics.update(g)
+        issue = glare_issue(g)
+        if issue:
+            issues.append(issue)
+
+    # 解析度：原圖本身太小才擋；面積估出來的發票解析度只提示
+    metrics["doc_edge"] = int(edge)
+    if min(h, w) < QUALITY_MIN_EDGE:
+        issues.append({"code": "lowres", "level": "reject", "message": "解析度太低，請靠近或用較高解析度拍攝"})
+    elif edge < QUALITY_WARN_EDGE:
+        issues.append({"code": "lowres_warn", "level": "warn", "message": "解析度偏低，辨識可能不準"})
+
+    level = max((i["level"] for i in issues), key=_LEVELS.get, default="ok")
+    return {"level": level, "issues": issues, "hint": "；".join(i["message"] for i in issues),
+            "metrics": metrics, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+# === 統計 ===
+class QualityStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.warned = 0
+        self.rejected = 0
+        self.bypassed = 0     # 該擋但 force / QUALITY_GATE=warn 放行
+        self.by_code: Dict[str, int] = {}
+        self.avg_ms = 0.0
+
+    def record(self, report: Dict[str, Any], rejected: bool):
+        with self._lock:
+            self.checked += 1
+            if rejected:
+                self.rejected += 1
+            elif report["level"] == "reject":
+                self.bypassed += 1
+            elif report["level"] == "warn":
+                self.warned += 1
+            for i in report["issues"]:
+                self.by_code[i["code"]] = self.by_code.get(i["code"], 0) + 1
+            self.avg_ms = report["ms"] if self.checked == 1 else 0.9 * self.avg_ms + 0.1 * report["ms"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": QUALITY_GATE, "checked": self.checked, "warned": self.warned,
+                    "rejected": self.rejected, "bypassed": self.bypassed,
+                    "by_code": dict(self.by_code), "avg_ms": round(self.avg_ms, 1)}
+
+
+STATS = QualityStats()
+
+
+def check(img_bgr, force: bool = False, check_area: bool = True, name: str = "",
+          camera: bool = False, rendered: bool = False) -> Dict[str, Any]:
+    """
+    依 QUALITY_GATE 檢查一張圖並計入統計；回傳 assess() 的結果加上 rejected（True = 不要辨識）。
+    QUALITY_GATE=off 時回 level ok、不量測。
+    """
+    if QUALITY_GATE == "off":
+        return {"level": "ok", "issues": [], "hint": "", "metrics": {}, "ms": 0.0, "rejected": False}
+    report = assess(img_bgr, check_area=check_area, camera=camera, rendered=rendered)
+    rejected = report["level"] == "reject" and QUALITY_GATE == "reject" and not force
+    report["rejected"] = rejected
+    STATS.record(report, rejected)
+    if rejected:
+        print(f"[QUALITY] 拒絕 {name or '-'}：{report['hint']} {report['metrics']} ({report['ms']}ms)")
+    return report
+
+
+def rejected_info(report: Dict[str, Any]) -> Dict[str, Any]:
+    """被擋下的圖片：與 detect_and_ocr 相同格式的空結果，附上品質報告。"""
+    return {"type": "", "num": "", "date": "", "sun": "", "cash": "", "crops": [], "conf": {},
+            "valid": {}, "quality": report, "rejected": True}
+
+
+def stats() -> Dict[str, Any]:
+    return STATS.stats()
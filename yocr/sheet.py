@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+整頁掃描（一張 A4 上放 4～8 張紙本發票）→ 切出每張發票的區塊
+做法（只用 OpenCV，不需要另外訓練模型）：
+    1) 縮小到長邊 SHEET_WORK_EDGE 加速
+    2) 灰階 → 梯度（文字、表格線的邊緣）→ Otsu 二值化
+    3) 大核心 closing 把同一張發票上的字連成一塊；發票之間的空白夠寬就不會黏在一起
+    4) 外輪廓 → 外框，過濾太小的雜點、合併重疊的框，依閱讀順序（上到下、左到右）排序
+找不到兩塊以上時回傳整頁一塊，呼叫端照單張流程處理
+"""
+import os
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+SHEET_WORK_EDGE = int(os.environ.get("SHEET_WORK_EDGE", 1600))
+SHEET_MIN_AREA = float(os.environ.get("SHEET_MIN_AREA", 0.02))     # 區塊至少佔整頁比例
+SHEET_GAP = float(os.environ.get("SHEET_GAP", 0.012))              # 發票之間最小空白（相對長邊）
+SHEET_PAD = float(os.environ.get("SHEET_PAD", 0.01))               # 切出來的區塊外擴比例
+
+Box = Tuple[int, int, int, int]
+
+
+def _overlap(a: Box, b: Box) -> bool:
+    return not (a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1])
+
+
+def _merge(boxes: List[Box]) -> List[Box]:
+    boxes = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        out: List[Box] = []
+        while boxes:
+            a = boxes.pop()
+            for i, b in enumerate(out):
+                if _overlap(a, b):
+                    out[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    changed = True
+                    break
+            else:
+                out.append(a)
+        boxes = out
+    return boxes
+
+
+def _reading_order(boxes: List[Box]) -> List[Box]:
+    """同一列（垂直方向重疊超過一半）由左到右，列與列由上到下。"""
+    rows: List[List[Box]] = []
+    for b in sorted(boxes, key=lambda b: b[1]):
+        for row in rows:
+            r = row[0]
+            ov = min(b[3], r[3]) - max(b[1], r[1])
+            if ov > 0.5 * min(b[3] - b[1], r[3] - r[1]):
+                row.append(b)
+                break
+        else:
+            rows.append([b])
+    return [b for row in rows for b in sorted(row, key=lambda b: b[0])]
+
+
+def find_invoice_regions(img_bgr) -> List[Box]:
+    """回傳原圖座標的 (x1, y1, x2, y2) list；至少一塊（整頁）。"""
+    H, W = img_bgr.shape[:2]
+    scale = min(1.0, SHEET_WORK_EDGE / float(max(H, W)))
+    small = cv2.resize(img_bgr, (int(W * scale), int(H * scale)), interpolation=cv2.INTER_AREA) if scale < 1 else img_bgr
+    h, w = small.shape[:2]
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    # closing 核心略小於發票之間的空白，讓同一張的字黏起來、不同張分開
+    k = max(5, int(max(h, w) * SHEET_GAP))
+    blob = cv2.morphologyEx(bw, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+    contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = SHEET_MIN_AREA * w * h
+    boxes: List[Box] = []
+    for c in contours:
+        x, y, bw_, bh_ = cv2.boundingRect(c)
+        if bw_ * bh_ < min_area:
+            continue
+        boxes.append((x, y, x + bw_, y + bh_))
+    boxes = _merge(boxes)
+    if len(boxes) <= 1:
+        return [(0, 0, W, H)]
+
+    pad = int(max(W, H) * SHEET_PAD)
+    out: List[Box] = []
+    for x1, y1, x2, y2 in _reading_order(boxes):
+        out.append((max(0, int(x1 / scale) - pad), max(0, int(y1 / scale) - pad),
+                    min(W, int(x2 / scale) + pad), min(H, int(y2 / scale) + pad)))
+    return out
+
+
+def crop_regions(img_bgr, boxes: List[Box]) -> List[np.ndarray]:
+    return [img_bgr[y1:y2, x1:x2].copy() for x1, y1, x2, y2 in boxes]
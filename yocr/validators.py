@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+欄位驗證（廠商樣板 JSON 的 "validator" 指定名稱）
+- ubn    統一編號：8 碼 + 檢查碼（權數 1,2,1,2,1,2,4,1，乘積各位數相加可被 5 整除；第 7 碼為 7 時加 1 也算）
+- date   YYYY/MM/DD 是真的日期，且落在 VALID_DATE_MIN ~ 今天 + VALID_DATE_FUTURE_DAYS
+- amount 正數、最多兩位小數、不超過 VALID_CASH_MAX
+發票號碼的形狀用樣板的 "format" regex 檢查（PC 2 英 + 8 數、MI 1 英 + 9 數、OP 英數-英數）
+驗證通過的欄位直接採用；沒通過的才換 OCR 設定重讀裁切圖，最後才整頁補抓
+"""
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict
+
+from yocr.vendor_registry import FIELD_KEYS, get_template, validator
+
+VALID_DATE_MIN = os.environ.get("VALID_DATE_MIN", "2000/01/01")
+VALID_DATE_FUTURE_DAYS = int(os.environ.get("VALID_DATE_FUTURE_DAYS", 31))
+VALID_CASH_MAX = float(os.environ.get("VALID_CASH_MAX", 100_000_000))
+
+_UBN_WEIGHTS = (1, 2, 1, 2, 1, 2, 4, 1)
+
+
+@validator("ubn")
+def ubn_ok(ubn: str) -> bool:
+    if len(ubn or "") != 8 or not ubn.isdigit():
+        return False
+    total = 0
+    for d, w in zip(ubn, _UBN_WEIGHTS):
+        p = int(d) * w
+        total += p // 10 + p % 10
+    return total % 5 == 0 or (ubn[6] == "7" and (total + 1) % 5 == 0)
+
+
+@validator("date")
+def date_ok(s: str) -> bool:
+    try:
+        d = datetime.strptime(s or "", "%Y/%m/%d").date()
+        lo = datetime.strptime(VALID_DATE_MIN, "%Y/%m/%d").date()
+    except ValueError:
+        return False
+    return lo <= d <= date.today() + timedelta(days=VALID_DATE_FUTURE_DAYS)
+
+
+_AMOUNT = re.compile(r"\d+(?:\.\d{1,2})?")
+
+
+@validator("amount")
+def amount_ok(s: str) -> bool:
+    if not _AMOUNT.fullmatch(s or ""):
+        return False
+    return 0 < float(s) <= VALID_CASH_MAX
+
+
+def validate_fields(inv_type: str, fields: Dict[str, str]) -> Dict[str, bool]:
+    tpl = get_template(inv_type)
+    return {k: tpl.validate(k, fields.get(k, "")) for k in FIELD_KEYS}
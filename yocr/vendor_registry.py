@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+廠商（發票版型）樣板登錄表
+- 每家廠商一個 yocr/vendors/<code>.json：顯示名稱、欄位模型、錨點/取值規則、視窗、
+  裁切 padding、tesseract 白名單、清洗函式名稱
+- 啟動時讀一次並預先編譯：每個錨點各自一條 regex（各自 search，錨點互相重疊時結果與逐一比對相同）
+- 新增第 4～40 家廠商 = 新增一個 JSON（+ 對應的 .pt 欄位模型），不用改程式
+- 清洗函式用 @cleaner("名稱") 登記（見 ocr_utils.py），JSON 只寫名稱
+- 驗證：欄位可寫 "format"（整串要符合的 regex）與 "validator"（@validator 登記的名稱，見 validators.py）
+"""
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+FIELD_KEYS = ("num", "date", "sun", "cash")
+
+VENDOR_DIR = os.environ.get(
+    "VENDOR_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendors"),
+)
+
+# 沒指定時的欄位預設值
+_FIELD_DEFAULTS = {
+    "window": 300,
+    "pad": [0.10, 0.10, 0.10, 0.10],   # l, t, r, b（相對框寬/高）
+    "whitelist": "",
+    "cleaner": "",
+    "format": "",
+    "validator": "",
+}
+
+# === 清洗函式登記 ===
+CLEANERS: Dict[str, Callable[[str], str]] = {}
+
+
+def cleaner(name: str):
+    """登記清洗函式：@cleaner("num_pc") def ...(raw) -> str"""
+    def deco(fn):
+        CLEANERS[name] = fn
+        return fn
+    return deco
+
+
+# === 驗證函式登記 ===
+VALIDATORS: Dict[str, Callable[[str], bool]] = {}
+
+
+def validator(name: str):
+    """登記驗證函式：@validator("ubn") def ...(value) -> bool"""
+    def deco(fn):
+        VALIDATORS[name] = fn
+        return fn
+    return deco
+
+
+# === 樣板 ===
+class FieldRule:
+    __slots__ = ("key", "anchor", "value", "window", "pad", "whitelist", "cleaner", "format", "validator")
+
+    def __init__(self, key: str, cfg: Dict):
+        c = dict(_FIELD_DEFAULTS, **cfg)
+        self.key = key
+        self.anchor = c.get("anchor") or ""
+        self.value = re.compile(c["value"], re.I) if c.get("value") else None
+        self.window = int(c["window"])
+        self.pad: Tuple[float, float, float, float] = tuple(float(x) for x in c["pad"])  # type: ignore
+        self.whitelist = c["whitelist"]
+        self.cleaner = c["cleaner"]
+        self.format = re.compile(c["format"]) if c["format"] else None
+        self.validator = c["validator"]
+
+
+class VendorTemplate:
+    """一家廠商的編譯後樣板。"""
+
+    def __init__(self, cfg: Dict):
+        self.code: str = cfg["code"].lower()
+        self.name: str = cfg.get("name", self.code)
+        self.order: int = int(cfg.get("order", 100))
+        model = cfg.get("model") or {}
+        self.model_env: str = model.get("env", f"YOLO_{self.code.upper()}")
+        self.model_file: str = model.get("file", f"{self.code}.pt")
+        self.lang: str = cfg.get("lang", "eng")
+        self.fields: Dict[str, FieldRule] = {
+            k: FieldRule(k, v) for k, v in (cfg.get("fields") or {}).items()
+        }
+
+        # 錨點各自編譯；合成一條 finditer 的話，重疊的錨點會被前一個吃掉（落到後面的出現位置）
+        self._anchors = {k: re.compile(r.anchor, re.I) for k, r in self.fields.items() if r.anchor}
+
+    # --- 錨點擷取 ---
+    def _anchor_ends(self, text: str) -> Dict[str, int]:
+        """每個欄位第一次出現錨點的結束位置。"""
+        ends: Dict[str, int] = {}
+        for k, rx in self._anchors.items():
+            m = rx.search(text)
+            if m:
+                ends[k] = m.end()
+        return ends
+
+    def extract_raw(self, text: str) -> Dict[str, str]:
+        """錨點後的視窗內取值（未清洗）。"""
+        out = {k: "" for k in self.fields}
+        if not text:
+            return out
+        for k, end in self._anchor_ends(text).items():
+            rule = self.fields[k]
+            seg = text[end:end + rule.window]
+            if rule.value is not None:
+                mv = rule.value.search(seg)
+                out[k] = mv.group(0).strip() if mv else ""
+            else:
+                out[k] = seg.strip()
+        return out
+
+    # --- 清洗 ---
+    def clean(self, key: str, raw: str) -> str:
+        rule = self.fields.get(key)
+        fn = CLEANERS.get(rule.cleaner) if rule and rule.cleaner else None
+        if fn is None:
+            return (raw or "").strip()
+        return fn(raw or "") or ""
+
+    # --- 驗證 ---
+    def validate(self, key: str, value: str) -> bool:
+        """清洗後的值是否可信：非空、符合 format、通過 validator（檢查碼 / 日期範圍 / 金額合理性）。"""
+        if not value:
+            return False
+        rule = self.fields.get(key)
+        if rule is None:
+            return True
+        if rule.format is not None and not rule.format.fullmatch(value):
+            return False
+        fn = VALIDATORS.get(rule.validator) if rule.validator else None
+        return fn(value) if fn is not None else True
+
+    def extract(self, text: str) -> Dict[str, str]:
+        raw = self.extract_raw(text)
+        return {k: self.clean(k, raw.get(k, "")) for k in FIELD_KEYS}
+
+    # --- 其他設定 ---
+    def pad(self, key: str) -> Tuple[float, float, float, float]:
+        rule = self.fields.get(key)
+        return rule.pad if rule else tuple(_FIELD_DEFAULTS["pad"])  # type: ignore
+
+    def whitelist(self, key: str) -> str:
+        rule = self.fields.get(key)
+        return rule.whitelist if rule else ""
+
+
+# === 登錄表 ===
+_lock = threading.Lock()
+_templates: Optional[Dict[str, VendorTemplate]] = None
+
+
+def load_templates(vendor_dir: str = VENDOR_DIR) -> Dict[str, VendorTemplate]:
+    out: Dict[str, VendorTemplate] = {}
+    for fn in sorted(os.listdir(vendor_dir)):
+        if not fn.endswith(".json"):
+            continue
+        path = os.path.join(vendor_dir, fn)
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                t = VendorTemplate(json.load(fp))
+        except Exception as e:
+            # 單一檔案寫錯不影響其他廠商
+            print(f"[VENDOR] 樣板載入失敗 {fn}: {e}")
+            continue
+        out[t.code] = t
+    return dict(sorted(out.items(), key=lambda kv: (kv[1].order, kv[0])))
+
+
+def templates() -> Dict[str, VendorTemplate]:
+    global _templates
+    if _templates is None:
+        with _lock:
+            if _templates is None:
+                _templates = load_templates()
+                print("[VENDOR TEMPLATES]", list(_templates))
+    return _templates
+
+
+def reload_templates() -> Dict[str, VendorTemplate]:
+    global _templates
+    with _lock:
+        _templates = load_templates()
+    return _templates
+
+
+def vendor_codes() -> List[str]:
+    return list(templates())
+
+
+def default_vendor() -> str:
+    codes = vendor_codes()
+    return codes[0] if codes else "pc"
+
+
+def get_template(code: str) -> VendorTemplate:
+    """找不到就回預設廠商（與原本 _apply_rules 落到 PC 規則的行為一致）。"""
+    ts = templates()
+    return ts.get((code or "").lower()) or ts[default_vendor()]
+
+
+def vendor_names() -> Dict[str, str]:
+    return {c: t.name for c, t in templates().items()}
@@ -13,6 +13,10 @@ from typing import Any, Dict, Optional, List, Tuple
 import os
 import uuid
 from yocr.ocr_utils import ocr_fields_from_crops
+from yocr.vendor_registry import templates, vendor_codes, default_vendor, get_template
+from yocr.model_pool import ModelPool
+from yocr.validators import validate_fields
+from yocr.pipeline_profiles import profile_names, resolve_profile
 import cv2
 
 # 依賴
@@ -38,15 +42,17 @@ def _env_or_default(name: str, filename: str) -> str:
     alt = os.path.join(weights_dir, filename)
     return alt if os.path.isfile(alt) else filename
 
-MODEL_PATHS = {
-    "tr3": _env_or_default("YOLO_TR3", "tr3.pt"),
-    "pc":  _env_or_default("YOLO_PC",  "pc.pt"),
-    "op":  _env_or_default("YOLO_OP",  "op.pt"),
-    "mi":  _env_or_default("YOLO_MI",  "mi.pt"),
-}
+# tr3 判斷票種；各廠商的欄位模型由 yocr/vendors/*.json 的 "model" 指定
+MODEL_PATHS = {"tr3": _env_or_default("YOLO_TR3", "tr3.pt")}
+MODEL_PATHS.update({code: _env_or_default(t.model_env, t.model_file) for code, t in templates().items()})
 
 DEFAULT_KEY_ORDER = ["num", "date", "sun", "cash"]
 
+# 模型跨執行緒共用，門檻不能每次呼叫前改 model.conf / model.iou：
+# 載入時把 conf 設成所有設定檔裡最低的，偵測後再依設定檔過濾（NMS 先留高分框，低門檻再過濾結果相同）；
+# IoU 影響 NMS 本身，只能在載入時定
+YOLO_IOU = float(os.environ.get("YOLO_IOU", 0.45))
+
 # 啟動時印出路徑確認
 print("[YOLO MODEL PATHS]", MODEL_PATHS)
 
@@ -77,11 +83,35 @@ def _load_yolo_model(model_path: str):
         raise FileNotFoundError(f"找不到 YOLO 模型：{model_path}")
     # 先試 local，沒有再用 github（需要 Git/可連外）
     try:
-        return torch.hub.load("ultralytics/yolov5", "custom",
-                              path=model_path, source="local", force_reload=False)
+        model = torch.hub.load("ultralytics/yolov5", "custom",
+                               path=model_path, source="local", force_reload=False)
     except Exception:
-        return torch.hub.load("ultralytics/yolov5", "custom",
-                              path=model_path, source="github", force_reload=False)
+        model = torch.hub.load("ultralytics/yolov5", "custom",
+                               path=model_path, source="github", force_reload=False)
+    # 門檻只在這裡設一次，之後不再改共用模型的屬性
+    model.conf = _conf_floor()
+    model.iou = YOLO_IOU
+    return model
+
+
+def _conf_floor() -> float:
+    """所有流程設定檔中最低的信心門檻（YOLO_CONF_FLOOR 可直接指定）。"""
+    v = os.environ.get("YOLO_CONF_FLOOR")
+    if v:
+        return float(v)
+    profs = [resolve_profile(n) for n in profile_names()]
+    return min([min(p.tr3_conf, p.field_conf) for p in profs] or [0.10])
+
+
+def _above(det, conf: float):
+    """依這次呼叫的門檻過濾偵測框（det: N×6 tensor）。"""
+    if det is None or det.shape[0] == 0:
+        return det
+    return det[det[:, 4] >= conf]
+
+
+# 模型池：用到才載入、用完留在記憶體；超過 YOLO_POOL_BUDGET_MB 時踢掉最久沒用的廠商模型
+MODEL_POOL = ModelPool(_load_yolo_model, MODEL_PATHS)
 
 
 def _map_class_to_key(model) -> Dict[int, str]:
@@ -97,7 +127,7 @@ def _map_class_to_key(model) -> Dict[int, str]:
             return "sun"
         if any(k in n_lower for k in ("cash", "amount", "price", "total", "交易金額", "金額")):
             return "cash"
-        if n_lower in ("pc", "op", "mi"):
+        if n_lower in templates():
             return n_lower
         return ""
 
@@ -118,15 +148,16 @@ def _map_class_to_key(model) -> Dict[int, str]:
 def _choose_invoice_type(det, mapping_from_names: Dict[int, str]) -> str:
     import torch as _torch
     if det is None or det.shape[0] == 0:
-        return "pc"
+        return default_vendor()
     confs = det[:, 4]
     idx = int(_torch.argmax(confs).item())
     cls_idx = int(det[idx, -1].item())
     name = mapping_from_names.get(cls_idx, "")
-    if name in ("pc", "op", "mi"):
+    if name in templates():
         return name
-    fallback = ["pc", "op", "mi"]
-    return fallback[cls_idx] if cls_idx < len(fallback) else "pc"
+    # tr3 的類別名稱不是廠商代碼時，依樣板 order 對應類別序號
+    fallback = vendor_codes()
+    return fallback[cls_idx] if cls_idx < len(fallback) else default_vendor()
 
 def _pad_box(x1, y1, x2, y2, W, H, l=0.0, t=0.0, r=0.0, b=0.0):
     """依比例對框做左右上下 padding；比例是相對於框寬/高。"""
@@ -151,28 +182,32 @@ def _crop(img_bgr, box: Tuple[int, int, int, int], out_path: str) -> bool:
 
 
 # ---------- 主流程 ----------
-def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type: str = "auto", **kwargs) -> Dict[str, Any]:
+def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type: str = "auto",
+                   name: str = "", profile: Any = None, source: str = "", **kwargs) -> Dict[str, Any]:
     """
-    :param img_or_path: 僅允許圖片路徑（str）或 cv2.imread 讀進來的 numpy array (BGR)
+    :param img_or_path: 圖片路徑（str）或已解碼的 numpy array (BGR，例如 cv2.imdecode 上傳串流)
     :param crops_dir:   裁切輸出資料夾
     :param inv_type:    'auto' / 'pc' / 'op' / 'mi'
-    :return: { type, num, date, sun, cash, crops: [{key,path,web_path}, ...] }
+    :param name:        傳 array 時用來命名裁切圖的原檔名（不給就用隨機名）
+    :param profile:     流程設定檔名稱（'fast' / 'accurate'，見 pipeline_profiles.json）
+    :param source:      呼叫來源（camera / upload / batch…），沒指定 profile 時依來源選
+    :return: { type, num, date, sun, cash, crops: [{key,path,web_path}, ...], conf, valid, profile }
     """
-    # 圖片來源與 batch 工具完全一致
-
-    # 只允許圖片路徑（str），直接丟給 YOLO，與 batch 工具一致
-    if not isinstance(img_or_path, (str, bytes)):
-        raise ValueError("img_or_path 必須是圖片路徑（str）")
-    img_bgr = cv2.imread(img_or_path)
-    # 存下送進 YOLO 的圖片內容（debug 用）
-    debug_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"debug_web_{os.path.basename(str(img_or_path))}")
-    cv2.imwrite(debug_path, img_bgr)
-    need_fallback = False
-    missing = []
-    fields = {}
+    prof = resolve_profile(profile, source)
+    # 路徑：直接丟給 YOLO，與 batch 工具一致；array：不落地，轉 RGB 後直接偵測
+    img_bgr = _load_bgr(img_or_path)
     if img_bgr is None:
         raise RuntimeError("載入圖片失敗（OpenCV 無法讀取）。")
-
+    if isinstance(img_or_path, (str, bytes)):
+        yolo_src = img_or_path
+        src_name = name or os.path.basename(str(img_or_path))
+    else:
+        yolo_src = img_bgr[:, :, ::-1]   # YOLOv5 的 numpy 輸入是 RGB
+        src_name = name or f"mem_{uuid.uuid4().hex[:8]}.jpg"
+    # 存下送進 YOLO 的圖片內容（debug 用，設 YOLO_DEBUG=1 才寫）
+    if os.environ.get("YOLO_DEBUG") == "1":
+        debug_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"debug_web_{src_name}")
+        cv2.imwrite(debug_path, img_bgr)
     if crops_dir:
         _ensure_dir(crops_dir)
     else:
@@ -180,29 +215,44 @@ def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type:
         crops_dir = os.path.join(here, "..", "uploads", "cropped")
         _ensure_dir(crops_dir)
 
-    base_name = os.path.splitext(os.path.basename(str(img_or_path)))[0]
+    base_name = os.path.splitext(src_name)[0]
     nonce = uuid.uuid4().hex[:6]
 
-    # 1) 判斷公司型別
-    tr3 = _load_yolo_model(MODEL_PATHS["tr3"])
-    class_map = _map_class_to_key(tr3)
-    with torch.no_grad():
-        tr3.conf = float(os.environ.get("YOLO_CONF", 0.10))
-        tr3.iou  = float(os.environ.get("YOLO_IOU", 0.45))
-    res_tr3 = tr3(img_or_path, size=640)
-    det_tr3 = res_tr3.xyxy[0]
-    inv = _choose_invoice_type(det_tr3, class_map) if inv_type == "auto" else inv_type.lower()
-    if inv not in ("pc", "op", "mi"):
-        inv = "pc"
+    # 1) 判斷公司型別（模型由模型池提供，使用期間 pin 住不會被踢掉）；呼叫端已指定就不跑 tr3
+    if inv_type == "auto":
+        with MODEL_POOL.use("tr3") as tr3:
+            class_map = _map_class_to_key(tr3)
+            with torch.no_grad():
+                res_tr3 = tr3(yolo_src, size=prof.tr3_size)
+        det_tr3 = _above(res_tr3.xyxy[0], prof.tr3_conf)
+        inv = _choose_invoice_type(det_tr3, class_map)
+    else:
+        inv = inv_type.lower()
+    if inv not in templates() or inv not in MODEL_PATHS:
+        inv = default_vendor()
 
     # 2) 用對應模型偵測欄位（直接用 YOLO class name，不做 mapping function）
-    model_inv = _load_yolo_model(MODEL_PATHS[inv])
-    with torch.no_grad():
-        model_inv.conf = float(os.environ.get("YOLO_CONF", 0.3))  # 與 batch 一致
-        model_inv.iou = float(os.environ.get("YOLO_IOU", 0.45))
-        res_fields = model_inv(img_or_path, size=640)
-    det = res_fields.xyxy[0]
-    names = model_inv.names  # YOLO class name dict/list
+    #    pin 只包 forward；之後的裁切 / OCR 只用偵測結果與類別名稱的副本，不再碰模型（踢掉後權重才放得掉）
+    with MODEL_POOL.use(inv) as model_inv:
+        with torch.no_grad():
+            res_fields = model_inv(yolo_src, size=prof.field_size)
+        names = _names_of(model_inv)
+    return _fields_from_detections(img_bgr, _above(res_fields.xyxy[0], prof.field_conf), names, inv,
+                                   crops_dir, base_name, nonce, src_name, prof)
+
+
+def _names_of(model):
+    """YOLO class name dict/list 的副本（離開 MODEL_POOL.use 之後不能再留著模型的參照）。"""
+    names = getattr(model, "names", None)
+    if isinstance(names, dict):
+        return dict(names)
+    return list(names) if names is not None else []
+
+
+def _fields_from_detections(img_bgr, det, names, inv: str, crops_dir: str,
+                            base_name: str, nonce: str, src_name: str, prof) -> Dict[str, Any]:
+    """欄位框 → 裁切 → OCR → 清洗（單張與批次/整頁多張共用）。names 是欄位模型的類別名稱。"""
+    tpl = get_template(inv)
     # 自動建立 class index 對應表
     class_map = {}
     if isinstance(names, (list, tuple)):
@@ -253,44 +303,44 @@ def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type:
         # 取 conf 最大的那個框
         best = max(boxes, key=lambda r: r[4])
         x1, y1, x2, y2, conf, cls = best
-        # 所有類型都做 padding + resize（mi 類也一致處理）
-        if cls_name == "date":
-            pad_l = pad_r = 0.20
-            pad_t = pad_b = 0.20
-        elif cls_name == "num":
-            pad_l = pad_r = 0.15
-            pad_t = pad_b = 0.15
-        elif cls_name == "cash":
-            pad_l = pad_r = 0.0
-            pad_t = pad_b = 0.0
-        else:
-            pad_l = pad_r = 0.10
-            pad_t = pad_b = 0.10
+        # 所有類型都做 padding + resize；padding 比例由廠商樣板的欄位設定決定
+        pad_l, pad_t, pad_r, pad_b = tpl.pad(cls_name)
         x1p, y1p, x2p, y2p = _pad_box(x1, y1, x2, y2, W, H, l=pad_l, t=pad_t, r=pad_r, b=pad_b)
         crop_img = img_bgr[int(y1p):int(y2p), int(x1p):int(x2p)].copy()
-        # resize 到定高度（如128），保持長寬比
-        target_h = 128
+        # resize 到設定檔的固定高度（fast = 128），保持長寬比；0 = 原尺寸
+        target_h = prof.crop_height
         ch, cw = crop_img.shape[:2]
         scale = target_h / ch if ch > 0 else 1.0
         new_w = int(cw * scale)
-        if ch > 0 and cw > 0:
+        if target_h and ch > 0 and cw > 0:
             crop_img = cv2.resize(crop_img, (new_w, target_h), interpolation=cv2.INTER_CUBIC)
         out_file = f"{base_name}_{nonce}_{cls_name}.jpg"
         out_path = os.path.join(crops_dir, out_file)
         if cv2.imwrite(out_path, crop_img):
-            crops.append({"key": cls_name, "path": out_file, "conf": float(conf)})
+            # box：裁切範圍（含 padding）佔整張圖的比例，dedup.py 用來比對欄位內容
+            crops.append({"key": cls_name, "path": out_file, "conf": float(conf),
+                          "box": [round(x1p / W, 4), round(y1p / H, 4), round(x2p / W, 4), round(y2p / H, 4)]})
 
     # 4) OCR辨識裁切圖文字
     crop_dict = {c["key"]: os.path.join(crops_dir, c["path"]) for c in crops}
-    fields = ocr_fields_from_crops(crop_dict, inv)
-    # 若有欄位 YOLO 沒偵測出來，直接用全頁OCR補抓
-    from yocr.ocr_utils import fullpage_anchor_ocr
-    for k in ("num", "date", "sun", "cash"):
-        if k not in crop_dict or not fields.get(k):
-            # 用全頁OCR補抓該欄位
-            fullpage = fullpage_anchor_ocr(img_bgr, inv)
-            if fullpage.get(k):
-                fields[k] = fullpage[k]
+    fields = ocr_fields_from_crops(crop_dict, inv, prof)
+    # 裁切圖重讀後仍沒通過驗證（或 YOLO 沒偵測到）的欄位，整頁 OCR 一次補抓（設定檔 fallback 決定範圍）
+    valid = validate_fields(inv, fields)
+    if prof.fallback == "never":
+        missing = []
+    elif prof.fallback == "empty":
+        missing = [k for k in ("num", "date", "sun", "cash") if not fields.get(k)]
+    else:
+        missing = [k for k in ("num", "date", "sun", "cash") if not valid[k]]
+    if missing:
+        from yocr.ocr_utils import fullpage_anchor_ocr
+        fullpage = fullpage_anchor_ocr(img_bgr, inv)
+        for k in missing:
+            v = fullpage.get(k) or ""
+            if v and (tpl.validate(k, v) or not fields.get(k)):
+                fields[k] = v
+        valid = validate_fields(inv, fields)
+        print(f"[OCR] 整頁補抓 {missing} → 仍未通過 {[k for k in missing if not valid[k]]}")
 
     # 5) 裝上前端可用網址
     web_base = "/uploads/cropped"
@@ -301,7 +351,8 @@ def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type:
 
     # --- 新增：辨識後存偵測框圖片 ---
     try:
-        save_yolo_box_image(model_inv, img_or_path)
+        # det / class_map 都在這裡的區域變數，save_yolo_box_image 直接畫框，不需要模型
+        save_yolo_box_image(None, img_bgr, name=src_name)
     except Exception as e:
         print(f"[YOLO偵測框存檔失敗] {e}")
 
@@ -313,9 +364,58 @@ def detect_and_ocr(img_or_path: Any, crops_dir: Optional[str] = None, inv_type:
         "cash": fields.get("cash", ""),
         "crops": crops,
         "conf": conf_map,
+        "valid": valid,
+        "profile": prof.name,
     }
 
 
+def detect_and_ocr_batch(images: List[Any], crops_dir: Optional[str] = None,
+                         names: Optional[List[str]] = None, profile: Any = None,
+                         source: str = "") -> List[Dict[str, Any]]:
+    """
+    多張圖一起辨識（整頁多張發票切出來的區塊、批次工具）：
+    tr3 一次 forward 全部判斷票種，再依廠商分組，各廠商欄位模型也各只 forward 一次
+    :param images: BGR numpy array list
+    :param names:  每張的檔名（命名裁切圖用）
+    :return: 與 detect_and_ocr 相同格式的 list，順序與 images 一致
+    """
+    import numpy as np
+    prof = resolve_profile(profile, source)
+    if not images:
+        return []
+    if not crops_dir:
+        crops_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads", "cropped")
+    _ensure_dir(crops_dir)
+    names = names or [f"mem_{uuid.uuid4().hex[:8]}.jpg" for _ in images]
+    rgb = [np.ascontiguousarray(im[:, :, ::-1]) for im in images]
+
+    # 1) 票種：一次 forward
+    with MODEL_POOL.use("tr3") as tr3:
+        class_map = _map_class_to_key(tr3)
+        with torch.no_grad():
+            res_tr3 = tr3(rgb, size=prof.tr3_size)
+    invs = []
+    for i in range(len(images)):
+        inv = _choose_invoice_type(_above(res_tr3.xyxy[i], prof.tr3_conf), class_map)
+        invs.append(inv if inv in templates() and inv in MODEL_PATHS else default_vendor())
+
+    # 2) 欄位：同廠商的一起 forward
+    out: List[Optional[Dict[str, Any]]] = [None] * len(images)
+    groups: Dict[str, List[int]] = {}
+    for i, inv in enumerate(invs):
+        groups.setdefault(inv, []).append(i)
+    for inv, idxs in groups.items():
+        with MODEL_POOL.use(inv) as model_inv:
+            with torch.no_grad():
+                res_fields = model_inv([rgb[i] for i in idxs], size=prof.field_size)
+            class_names = _names_of(model_inv)
+        for j, i in enumerate(idxs):
+            base_name = os.path.splitext(names[i])[0]
+            out[i] = _fields_from_detections(images[i], _above(res_fields.xyxy[j], prof.field_conf), class_names, inv,
+                                             crops_dir, base_name, uuid.uuid4().hex[:6], names[i], prof)
+    return out  # type: ignore
+
+
 def visualize_yolo_results(model, img_path: str, save_path: str = "debug.jpg"):
     import cv2
     results = model(img_path)  # YOLO 預測
@@ -333,13 +433,17 @@ def visualize_yolo_results(model, img_path: str, save_path: str = "debug.jpg"):
     cv2.imwrite(save_path, img)
     return save_path
 
-def save_yolo_box_image(model, img_path: str, save_path: str = None):
+def save_yolo_box_image(model, img_or_path: Any, save_path: str = None, name: str = ""):
     """
     YOLO偵測後將所有框畫在原圖並存檔，save_path預設存到 /uploads/cropped/box_{原檔名}.jpg
+    img_or_path 可以是路徑或 BGR array（array 時請給 name）
     """
     import cv2, os
-    results = model(img_path)
-    img = cv2.imread(img_path)
+    img = _load_bgr(img_or_path)
+    if img is None:
+        return ""
+    img = img.copy()
+    img_path = name or os.path.basename(str(img_or_path))
     import inspect
     frame = inspect.currentframe().f_back
     det = frame.f_locals.get('det', None)
@@ -359,7 +463,8 @@ def save_yolo_box_image(model, img_path: str, save_path: str = None):
             cv2.putText(img, f"{cls_name} {conf:.2f}", (x1, y1-5),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
     else:
-        # fallback 舊行為
+        # fallback 舊行為（呼叫端沒有偵測結果才重跑一次模型）
+        results = model(img_or_path if isinstance(img_or_path, (str, bytes)) else img[:, :, ::-1])
         for *xyxy, conf, cls in results.xyxy[0]:
             x1, y1, x2, y2 = map(int, xyxy)
             cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 0), 2)
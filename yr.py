@@ -4,7 +4,7 @@ import os, uuid, sys, glob
 from typing import Dict, Any, List
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from flask import request, jsonify, render_template, url_for, flash, send_from_directory
+from flask import request, jsonify, render_template, url_for, flash, send_from_directory, session, Response, stream_with_context
 from core_app import app  # 只使用 core_app 的 app
 # === Email 附件管理 API 與頁面 ===
 from flask import jsonify, request, render_template
@@ -81,19 +81,20 @@ CROPS_DIR.mkdir(parents=True, exist_ok=True)
 if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
-# YOLO / OCR
-try:
-    from yocr.yolo import detect_and_ocr
-    from yocr.ocr_utils import pdf_to_images
-except ModuleNotFoundError:
-    from yolo import detect_and_ocr
-    from ocr_utils import pdf_to_images
+# YOLO / OCR：延遲載入（torch / cv2 第一次辨識才 import），APP_ROLE=web 時不提供
+from ocr_runtime import (detect_and_ocr, detect_and_ocr_batch, find_invoice_regions, pdf_to_images,
+                         model_pool_stats, executor_stats, OcrDisabled, OcrBusy)
 
-VENDOR_NAME_MAP = {
-    'mi': 'Microsoft',
-    'op': 'OpenAI',
-    'pc': 'PChome',
-}
+from ingest import (read_upload, decode_image, pil_to_bgr, persist_async, persist_jpeg_async,
+                    persist_bgr_async, wait_persisted)
+from dedup import find_duplicate, remember, duplicate_info
+from quotas import QUOTAS, quota_limited, identity
+from yocr import quality
+from job_events import EVENTS
+
+# 廠商顯示名稱由 yocr/vendors/*.json 的 "name" 提供
+from yocr.vendor_registry import vendor_names
+VENDOR_NAME_MAP = vendor_names()
 
 def _enrich_vendor_name(one: dict):
     # 可能有的鍵名：label / cls / type，依你的回傳結構調整
@@ -105,13 +106,40 @@ def _enrich_vendor_name(one: dict):
 # === 內部工具 ===
 PROGRESS: Dict[str, Dict[str, Any]] = {}
 LAST_RESULTS: List[Dict[str, Any]] = []
+_IN_FLIGHT: Dict[str, Dict[str, Any]] = {}   # 上傳中已推送的列（filename → row），給 yr_result 用
 
+# 進度同時寫進 PROGRESS（給 /progress/<job_id> 輪詢）與 EVENTS（給 SSE 串流）
 def _progress_start(job_id: str, total: int):
     PROGRESS[job_id] = {"status": "running", "total": total, "done": 0, "error": "", "finished": False}
+    EVENTS.publish(job_id, "progress", PROGRESS[job_id].copy())
 
-def _progress_step(job_id: str):
+def _progress_step(job_id: str, row: Dict[str, Any] = None):
     d = PROGRESS.get(job_id)
-    if d: d["done"] = int(d.get("done", 0)) + 1
+    if not d: return
+    d["done"] = int(d.get("done", 0)) + 1
+    if row is not None:
+        EVENTS.publish(job_id, "row", {"index": d["done"] - 1, "row": row})
+    EVENTS.publish(job_id, "progress", d.copy())
+
+def _progress_grow(job_id: str, extra: int):
+    """整頁多張：一個檔案切出 N 張發票時，總數跟著加 N-1。"""
+    d = PROGRESS.get(job_id)
+    if not d or extra <= 0: return
+    d["total"] = int(d.get("total", 0)) + extra
+    EVENTS.publish(job_id, "progress", d.copy())
+
+def _add_row(job_id: str, results: List[Dict[str, Any]], row: Dict[str, Any], saved=()):
+    """
+    一筆辨識完成：等這列的原檔寫好（saved）才推 row 事件，前端收到會馬上載 imageUrl / thumbUrl；
+    整批完成前結果頁從 _IN_FLIGHT 找得到這列，LAST_RESULTS 等整批成功才換掉
+    """
+    wait_persisted(saved)
+    # 原檔寫好才知道版本：帶 ?v= 的縮圖網址才能長快取
+    from thumbs import thumb_url
+    row["thumbUrl"] = thumb_url(row["filename"], "sm") or url_for("thumb", size="sm", filename=row["filename"])
+    results.append(row)
+    _IN_FLIGHT[row["filename"]] = row
+    _progress_step(job_id, row)
 
 def _progress_finish(job_id: str, error: str = ""):
     d = PROGRESS.get(job_id)
@@ -119,6 +147,96 @@ def _progress_finish(job_id: str, error: str = ""):
     d["status"] = "error" if error else "ok"
     d["error"]  = error
     d["finished"] = True
+    EVENTS.publish(job_id, "done", d.copy(), final=True)
+
+def _ocr_or_duplicate(img, name: str, crops_dir: str, force: bool = False,
+                      inv_type: str = "auto", profile: str = None, source: str = "upload",
+                      rendered: bool = False) -> Dict[str, Any]:
+    """
+    先比對感知雜湊：近似重複就直接回先前結果（標記 duplicate），不重跑 YOLO + OCR。
+    force=True（前端送 force=1）時一律重跑。
+    inv_type：已知廠商時（例如即時掃描已跑過 tr3）直接指定，省掉一次票種判斷。
+    profile / source：流程設定檔（fast / accurate），沒指定時依來源選（見 yocr/pipeline_profiles.json）。
+    最前面先做影像品質快篩（yocr/quality.py）：模糊 / 太暗 / 解析度太低直接回原因（rejected），不佔辨識名額也不扣額度。
+    rendered：PDF 轉出的圖（白紙滿版，不檢查反光）。
+    name 要是實際存檔的（唯一）檔名，duplicate_of 會指向它；重複只比對同一位使用者自己的紀錄。
+    """
+    q = quality.check(img, force=force, name=name, camera=(source == "camera"), rendered=rendered)
+    if q["rejected"]:
+        return quality.rejected_info(q)
+    owner = identity()[0]
+    prior, hs = find_duplicate(img, owner=owner)
+    if prior and not force:
+        return duplicate_info(prior)
+    QUOTAS.take()   # 重複的不扣額度
+    info = detect_and_ocr(img, crops_dir=crops_dir, inv_type=inv_type, name=name,
+                          profile=profile, source=source)
+    remember(name, hs, info, img_bgr=img, owner=owner)
+    if q["level"] != "ok":
+        info["quality"] = q
+    return info
+
+def _ocr_regions(img, base: str, crops_dir: str, force: bool = False, profile: str = None):
+    """
+    整頁多張：切出每張發票 → 各自比對重複 → 沒看過的一起丟 detect_and_ocr_batch。
+    回傳 ([{"filename", "region", "info"}], 寫檔 futures)；順序與頁面上的閱讀順序一致；區塊圖在背景寫進 uploads/。
+    """
+    boxes = find_invoice_regions(img)
+    owner = identity()[0]
+    regions, pending = [], []
+    todo_imgs, todo_idx = [], []
+    for n, (x1, y1, x2, y2) in enumerate(boxes, 1):
+        crop = img[y1:y2, x1:x2].copy()
+        name = f"{base}_r{n}.jpg"
+        pending.append(persist_bgr_async(crop, str(UPLOAD_DIR / name)))
+        prior, hs = find_duplicate(crop, owner=owner)
+        r = {"filename": name, "region": [x1, y1, x2, y2], "hashes": hs, "info": None}
+        if prior and not force:
+            r["info"] = duplicate_info(prior)
+        else:
+            todo_imgs.append(crop)
+            todo_idx.append(len(regions))
+        regions.append(r)
+    if todo_imgs:
+        QUOTAS.take(len(todo_imgs))
+        infos = detect_and_ocr_batch(todo_imgs, crops_dir=crops_dir,
+                                     names=[regions[i]["filename"] for i in todo_idx],
+                                     profile=profile, source="upload")
+        for i, crop, info in zip(todo_idx, todo_imgs, infos):
+            regions[i]["info"] = info
+            remember(regions[i]["filename"], regions[i].pop("hashes"), info, img_bgr=crop, owner=owner)
+    for r in regions:
+        r.pop("hashes", None)
+    return regions, pending
+
+def _result_row(raw: str, out_name: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "origin":   raw,
+        "filename": out_name,
+        "imageUrl": url_for("uploads", filename=out_name),
+        "type":     info.get("type", ""),
+        "num":      info.get("num", ""),
+        "sun":      info.get("sun", ""),
+        "date":     info.get("date", ""),
+        "cash":     info.get("cash", ""),
+        "score":    info.get("conf", {}),  # 直接回傳 YOLO信心分數 dict
+        "bnu":      "",
+        "name":     VENDOR_NAME_MAP.get((info.get("type") or "").lower(), ""),
+        "add":      "",
+        "duplicate":    bool(info.get("duplicate")),
+        "duplicate_of": info.get("duplicate_of", ""),
+        "rejected":     bool(info.get("rejected")),
+        "quality":      (info.get("quality") or {}).get("level", "ok"),
+        "quality_hint": (info.get("quality") or {}).get("hint", ""),
+        "busy":         bool(info.get("busy")),
+        "retry_after":  info.get("retry_after", 0),
+        "error":        info.get("error", ""),
+    }
+
+def _busy_info(e: OcrBusy) -> Dict[str, Any]:
+    """辨識名額 / 配額滿：這張沒辨識，標記稍後重試（整批其他張照常回傳）。"""
+    return {"type": "", "num": "", "date": "", "sun": "", "cash": "", "crops": [], "conf": {},
+            "busy": True, "retry_after": e.retry_after, "error": str(e)}
 
 def _find_crop(filename: str, key: str) -> str:
     base = os.path.splitext(filename)[0]
@@ -135,22 +253,28 @@ def yr_home():
 
 # === 上傳與辨識 ===
 @app.route("/upload", methods=["POST"], endpoint="yr_upload")
+@quota_limited
 def yr_upload():
     job_id = (request.form.get("job_id") or request.values.get("job_id") or uuid.uuid4().hex)
     files = request.files.getlist("files")
+    force = (request.form.get("force") or "") == "1"
+    sheet = (request.form.get("sheet") or "") == "1"   # 一張掃描裡有多張發票
+    profile = request.form.get("profile") or None       # fast / accurate；不給依來源（upload → fast）
     if not files:
         flash("請選擇檔案再上傳")
         return jsonify({"error": "沒有選擇檔案"}), 400
 
     _progress_start(job_id, total=len(files))
     results: List[Dict[str, Any]] = []
+    pending = []  # 背景寫檔中的原圖
 
     try:
         for f in files:
             raw = secure_filename(f.filename or f"img_{uuid.uuid4().hex}.jpg")
             base, ext = os.path.splitext(raw)
+            rendered = ext.lower() == ".pdf"
 
-            if ext.lower() == ".pdf":
+            if rendered:
                 tmp_pdf = str(UPLOAD_DIR / f"{base}_{uuid.uuid4().hex}.pdf")
                 f.save(tmp_pdf)
                 pil_imgs = pdf_to_images(tmp_pdf)
@@ -158,73 +282,157 @@ def yr_upload():
                     raise RuntimeError("PDF 轉圖失敗")
                 out_name = f"{base}_{uuid.uuid4().hex}.jpg"
                 out_path = str(UPLOAD_DIR / out_name)
-                pil_imgs[0].save(out_path, "JPEG", quality=95)
+                img = pil_to_bgr(pil_imgs[0])
+                saved = persist_jpeg_async(pil_imgs[0], out_path, quality=95)
             else:
+                # 直接從上傳串流解碼，原檔在背景寫入、同時開始偵測
                 out_name = f"{base}_{uuid.uuid4().hex}{ext or '.jpg'}"
                 out_path = str(UPLOAD_DIR / out_name)
-                f.save(out_path)
-
-            info = detect_and_ocr(out_path, crops_dir=str(CROPS_DIR))
-            conf = info.get("conf", {})  # YOLO信心分數 dict
-            row = {
-                "origin":   raw,
-                "filename": out_name,
-                "imageUrl": url_for("uploads", filename=out_name),
-                "type":     info.get("type", ""),
-                "num":      info.get("num", ""),
-                "sun":      info.get("sun", ""),
-                "date":     info.get("date", ""),
-                "cash":     info.get("cash", ""),
-                "score":    conf,  # 直接回傳 YOLO信心分數 dict
-                "bnu":      "",
-                "name":     VENDOR_NAME_MAP.get((info.get("type") or "").lower(), ""),
-                "add":      "",
-            }
-            results.append(row)
-            _progress_step(job_id)
-
+                data = read_upload(f)
+                img = decode_image(data)
+                if img is None:
+                    raise RuntimeError(f"無法讀取圖片：{raw}")
+                saved = persist_async(data, out_path)
+            pending.append(saved)
+
+            if sheet:
+                # 整頁多張：先看整頁品質（不檢查版面比例），不合格整頁一列回原因
+                q = quality.check(img, force=force, check_area=False, name=out_name, rendered=rendered)
+                if q["rejected"]:
+                    _add_row(job_id, results, _result_row(raw, out_name, quality.rejected_info(q)), [saved])
+                    continue
+                # 每張發票一列，sheet_of 指回整頁原圖
+                try:
+                    regions, written = _ocr_regions(img, os.path.splitext(out_name)[0], str(CROPS_DIR),
+                                                    force=force, profile=profile)
+                except OcrBusy as e:
+                    _add_row(job_id, results, _result_row(raw, out_name, _busy_info(e)), [saved])
+                    continue
+                pending.extend(written)
+                _progress_grow(job_id, len(regions) - 1)
+                for r in regions:
+                    row = _result_row(raw, r["filename"], r["info"])
+                    row["region"] = r["region"]
+                    row["sheet_of"] = out_name
+                    _add_row(job_id, results, row, [saved] + written)
+                continue
+
+            try:
+                info = _ocr_or_duplicate(img, out_name, str(CROPS_DIR), force=force, profile=profile,
+                                         rendered=rendered)
+            except OcrBusy as e:
+                # 排隊滿 / 配額用完只影響這張，已辨識的照常回傳
+                info = _busy_info(e)
+            _add_row(job_id, results, _result_row(raw, out_name, info), [saved])
+
+        wait_persisted(pending)
+        # 整批成功才換掉上一批的結果；中途失敗首頁仍是上一批完整的結果
         LAST_RESULTS.clear()
         LAST_RESULTS.extend(results)
         _progress_finish(job_id)  # 這行會把 finished 設 True
         first_url = url_for("yr_result", filename=results[0]["filename"]) if results else url_for("invoice_auto")
-        return jsonify({"results": results, "job_id": job_id, "open": "results", "first": first_url})
-    
+        busy = [r for r in results if r["busy"]]
+        resp = jsonify({"results": results, "job_id": job_id, "open": "results", "first": first_url,
+                        "busy": len(busy)})
+        if busy:
+            resp.headers["Retry-After"] = str(max(r["retry_after"] for r in busy))
+        return resp
+
+    except OcrDisabled as e:
+        # 交給 errorhandler 回 503，不當成一般錯誤回 500
+        wait_persisted(pending)
+        _progress_finish(job_id, str(e))
+        raise
     except Exception as e:
+        wait_persisted(pending)
         _progress_finish(job_id, str(e))
         return jsonify({"error": str(e), "job_id": job_id}), 500
+    finally:
+        for r in results:
+            _IN_FLIGHT.pop(r["filename"], None)
 
 # === 進度查詢 ===
 @app.route("/progress/<job_id>", methods=["GET"], endpoint="yr_progress")
 def yr_progress(job_id: str):
     return jsonify(PROGRESS.get(job_id) or {"status": "missing", "total": 0, "done": 0, "error": "", "finished": True})
 
+# 串流版：每辨識完一張就推送 row 事件，前端不必等整批 /upload 回應
+@app.route("/progress/<job_id>/stream", methods=["GET"], endpoint="yr_progress_stream")
+def yr_progress_stream(job_id: str):
+    try:
+        last_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_id = None
+    resp = Response(stream_with_context(EVENTS.stream(job_id, last_id)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx 不要緩衝
+    return resp
+
+# === 辨識服務狀態（管理員）===
+@app.route("/api/ocr_stats", methods=["GET"])
+def api_ocr_stats():
+    if session.get('role') != 'admin':
+        return jsonify({"error": "forbidden"}), 403
+    from dedup import INDEX
+    return jsonify({"model_pool": model_pool_stats(), "executor": executor_stats(),
+                    "quotas": QUOTAS.stats(), "quality": quality.stats(), "dedup": INDEX.stats()})
+
+@app.errorhandler(OcrDisabled)
+def _ocr_disabled(e):
+    return jsonify({"error": str(e)}), 503
+
+@app.errorhandler(OcrBusy)
+def _ocr_busy(e):
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
 # === 相機 ===
 @app.route('/camera')
 def camera():
     return render_template('camera.html')
 
 @app.route("/upload_camera", methods=["POST"])
+@quota_limited
 def upload_camera():
     f = request.files.get("file")
     if not f:
         return jsonify({"error": "沒有收到檔案"}), 400
 
-    raw = secure_filename(f.filename or f"camera_{uuid.uuid4().hex}.jpg")
-    out_path = os.path.join(app.config["UPLOAD_FOLDER"], raw)
-    f.save(out_path)
-
-    # 直接跑 YOLO + OCR
-    info = detect_and_ocr(out_path, crops_dir=app.config["CROPPED_FOLDER"])
+    raw = secure_filename(f.filename or "camera.jpg")
+    # 前端每次都送 snapshot.jpg：存檔名加上 uuid，不覆蓋上一張（重複比對的 duplicate_of 也指向它）
+    base, ext = os.path.splitext(raw)
+    out_name = f"{base}_{uuid.uuid4().hex}{ext or '.jpg'}"
+    out_path = os.path.join(app.config["UPLOAD_FOLDER"], out_name)
+    data = read_upload(f)
+    img = decode_image(data)
+    if img is None:
+        return jsonify({"error": "無法讀取圖片"}), 400
+
+    # 原圖背景寫入，同時直接跑 YOLO + OCR（不用等寫檔再讀回來）
+    saving = persist_async(data, out_path)
+    force = (request.form.get("force") or "") == "1"
+    try:
+        info = _ocr_or_duplicate(img, out_name, app.config["CROPPED_FOLDER"], force=force,
+                                 profile=request.form.get("profile") or None, source="camera")
+    finally:
+        wait_persisted([saving])
+    if info.get("rejected"):
+        # 品質不合格：立刻回原因，前端提示重拍
+        return jsonify({"error": info["quality"]["hint"], "quality": info["quality"]}), 422
     row = {
-        "filename": raw,
-        "imageUrl": url_for("uploads", filename=raw),
+        "filename": out_name,
+        "imageUrl": url_for("uploads", filename=out_name),
         "num":  info.get("num",""),
         "sun":  info.get("sun",""),
         "date": info.get("date",""),
         "cash": info.get("cash",""),
         "bnu":  "",
         "name": VENDOR_NAME_MAP.get((info.get("type") or "").lower(), ""),
-        "add":  ""
+        "add":  "",
+        "duplicate":    bool(info.get("duplicate")),
+        "duplicate_of": info.get("duplicate_of", ""),
+        "quality_hint": (info.get("quality") or {}).get("hint", ""),
     }
     return jsonify([row])
 
@@ -233,7 +441,7 @@ def upload_camera():
 # === 結果頁（推裁切圖）===
 @app.route("/result/<path:filename>", methods=["GET"], endpoint="yr_result")
 def yr_result(filename: str):
-    row = next((x for x in LAST_RESULTS if x.get("filename") == filename), None)
+    row = next((x for x in LAST_RESULTS if x.get("filename") == filename), None) or _IN_FLIGHT.get(filename)
     if row is None:
         row = {
             "origin": filename, "filename": filename,
@@ -258,7 +466,8 @@ def yr_result(filename: str):
 # yr.py
 @app.route("/result/detail/<path:imgname>")
 def result_detail(imgname):
-    ocr = detect_and_ocr(str(UPLOAD_DIR / imgname), crops_dir=str(CROPS_DIR))
+    ocr = detect_and_ocr(str(UPLOAD_DIR / imgname), crops_dir=str(CROPS_DIR),
+                         profile=request.args.get("profile") or None, source="detail")
 
     # YOLO 已回傳 {"key":..., "path": 檔名}；模板會用 url_for('uploads_cropped', filename=item.cropped_image)
     crop_by_key = {c["key"]: c.get("path") for c in ocr.get("crops", [])}